@@ -25,16 +25,42 @@ description: Analysis application with Celery app - entrypoint for Celery worker
 Dashboard websocket consumer, websocket routing.
 
 structure:
+    - management/
+        - commands/                 # package for custom commands
+            - analysis_queue_stats.py   # depth and wait times of analysis priority queues
+            - benchmark_analysis.py     # end-to-end throughput, latency and round trips of analyses
+            - benchmark_frames.py       # frame processing with Python loops vs NumPy arrays
+            - benchmark_model_upload.py # peak memory of buffered vs streamed upload to ML model
+            - run_model_standin.py      # runs local stand-in for ML model API
     - migrations/                   # migrations package
     - tests/                        # unit tests package
         - test_mocked_model.py      # celery tasks unit tests
+        - test_batch.py             # batch analysis unit tests
+        - test_inference_cache.py   # ML model results cache unit tests
+        - test_model_client.py      # ML model API client unit tests
+        - test_notifications.py     # websocket notifier unit tests
+        - test_plots.py             # statistics plots rendering and storage unit tests
+        - test_progress.py          # progress reporting unit tests
+        - test_scheduling.py        # priority queues and per-user slots unit tests
+        - test_segmentation.py      # segmented analysis unit tests
+        - test_standin.py           # ML model stand-in and round trips counting unit tests
     - __init__.py                   # exports Celery app so it is available within the module
-    - admin.py                      # file for potential registration of models and model admins
+    - admin.py                      # registration of InferenceResult model in admin interface
     - apps.py                       # analysis app config
+    - cache.py                      # deduplication cache of ML model results (keyed by SHA-256 of recording)
     - celery.py                     # Celery app setup and configuration
+    - client.py                     # pooled HTTP client for ML model API (one per worker process)
     - consumers.py                  # Dashboard Consumer which handles websocket messages
-    - models.py                     # file for potential model definitions
+    - frames.py                     # frames of recording as NumPy arrays, conversion to list of frames
+    - models.py                     # InferenceResult (cached ML model results) and cache hit/miss counter models
+    - notifications.py              # long-lived event loop sending websocket messages from workers
+    - plots.py                      # SVG statistics plots rendered from frames in workers
+    - progress.py                   # progress (stage, percent, ETA) of running analyses
+    - roundtrips.py                 # counting of DB and Redis round trips of Celery tasks
     - routing.py                    # mapping websocket consumer to websocket route
+    - scheduling.py                 # priority queues and per-user fair scheduling of analysis tasks
+    - segmentation.py               # splitting long recordings into windows, merging their results
+    - standin.py                    # local stand-in for ML model API (development, benchmarks)
     - swagger.py                    # auxiliary serializers used in Swagger documentation
     - tasks.py                      # Celery tasks definition and helper functions
     - views.py                      # file for potential view definitions
@@ -19,10 +19,21 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
-Created automatically by Django CLI.
+author: Gustaw Daczkowski
 
-description: File for registering models, model admins, forms, widgets in admin interface.
+description: File registers InferenceResult model (cached ML model results) in admin interface.
 """
 from django.contrib import admin
 
-# Register your models here.
+from .models import InferenceResult
+
+
+class InferenceResultAdmin(admin.ModelAdmin):
+    list_display = ('id', 'audio_hash', 'model_version', 'hits', 'created_at', 'last_used_at')
+    list_filter = ('model_version', 'created_at', 'last_used_at')
+    search_fields = ('audio_hash',)
+    exclude = ('result',)
+    readonly_fields = ('audio_hash', 'model_version', 'hits', 'created_at', 'last_used_at')
+
+
+admin.site.register(InferenceResult, InferenceResultAdmin)
@@ -29,3 +29,7 @@ from django.apps import AppConfig
 class AnalysisConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analysis'
+
+    def ready(self):
+        # connect task signal handlers counting round trips (CELERY_COUNT_ROUND_TRIPS)
+        from . import roundtrips  # noqa: F401
@@ -0,0 +1,151 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Deduplication cache of ML model results keyed by SHA-256 of the recording and model version.
+Entries are evicted when they have not been used for CELERY_INFERENCE_CACHE_TTL days or when there are more
+than CELERY_INFERENCE_CACHE_MAX_ENTRIES of them (least recently used first).
+
+File consists of:
+    - file_sha256 - SHA-256 of a file computed block by block
+    - get_cached_result - returns cached result or None, counts hits and misses
+    - store_result - saves result in cache and evicts stale entries
+    - evict - removes expired and least recently used entries
+    - cache_stats - hit/miss counters and number of entries
+"""
+import hashlib
+from base64 import b64decode, b64encode
+from datetime import timedelta
+from typing import Optional
+
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_duration
+
+from analysis.models import InferenceCacheCounter, InferenceResult
+from recordings.lossless import open_audio
+from recordings.probability import ProbabilityPlot
+
+logger = get_task_logger(__name__)
+
+HITS_KEY = 'hits'
+MISSES_KEY = 'misses'
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """Returns hex digest of SHA-256 of the file (WAV file of compressed recording), file is read in blocks."""
+    digest = hashlib.sha256()
+    with open_audio(file_path) as fp:
+        while block := fp.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _increment(key: str):
+    # counters are rows in the database - atomic UPDATE, never evicted (unlike entries of Django cache)
+    if not InferenceCacheCounter.objects.filter(name=key).update(value=F('value') + 1):
+        _, created = InferenceCacheCounter.objects.get_or_create(name=key, defaults={'value': 1})
+        if not created:
+            # created by another worker in the meantime
+            InferenceCacheCounter.objects.filter(name=key).update(value=F('value') + 1)
+
+
+def _expiration_date():
+    return timezone.now() - timedelta(days=settings.CELERY_INFERENCE_CACHE_TTL)
+
+
+def get_cached_result(audio_hash: str) -> Optional[dict]:
+    """Returns cached result for the recording analysed by current version of ML model or None."""
+    if not settings.CELERY_INFERENCE_CACHE:
+        return None
+
+    entry = InferenceResult.objects.filter(
+        audio_hash=audio_hash, model_version=settings.CELERY_MODEL_VERSION, last_used_at__gte=_expiration_date()
+    ).first()
+
+    if entry is None:
+        _increment(MISSES_KEY)
+        logger.info(f"Inference cache miss: {audio_hash}")
+        return None
+
+    InferenceResult.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    _increment(HITS_KEY)
+    logger.info(f"Inference cache hit: {audio_hash}")
+
+    result = entry.result
+    if isinstance(result.get('length'), str):
+        # duration is stored in JSON as a string
+        result['length'] = parse_duration(result['length'])
+    if isinstance(result.get('probability_frames'), str):
+        result['probability_frames'] = ProbabilityPlot.from_bytes(b64decode(result['probability_frames']))
+    elif 'probability_plot' in result:
+        # entries saved before frames were stored in binary form
+        result['probability_frames'] = result.pop('probability_plot')
+    return result
+
+
+def store_result(audio_hash: str, result: dict):
+    """Saves result returned by current version of ML model and evicts stale entries."""
+    if not settings.CELERY_INFERENCE_CACHE:
+        return
+
+    if result.get('probability_frames') is not None:
+        # frames are stored in the same compact form as in Recording (base64 in JSON)
+        plot = ProbabilityPlot.from_frames(result['probability_frames'])
+        encoded = b64encode(plot.to_bytes(settings.PROBABILITY_PLOT_ENCODING)).decode('ascii')
+        result = {**result, 'probability_frames': encoded}
+
+    InferenceResult.objects.update_or_create(
+        audio_hash=audio_hash, model_version=settings.CELERY_MODEL_VERSION,
+        defaults={'result': result, 'last_used_at': timezone.now()}
+    )
+    evict()
+
+
+def evict() -> int:
+    """Removes expired entries and least recently used entries above the limit. Returns number of removed entries."""
+    removed, _ = InferenceResult.objects.filter(last_used_at__lt=_expiration_date()).delete()
+
+    overflow = list(
+        InferenceResult.objects.order_by('-last_used_at').values_list('pk', flat=True)[
+            settings.CELERY_INFERENCE_CACHE_MAX_ENTRIES:
+        ]
+    )
+    if overflow:
+        removed += InferenceResult.objects.filter(pk__in=overflow).delete()[0]
+    return removed
+
+
+def cache_stats() -> dict:
+    counters = dict(InferenceCacheCounter.objects.values_list('name', 'value'))
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+        "entries": InferenceResult.objects.count(),
+    }
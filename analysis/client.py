@@ -0,0 +1,292 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: HTTP client used by Celery workers to communicate with ML model API.
+
+File consists of:
+    - iter_multipart - generator streaming file(s) as multipart/form-data body in fixed-size chunks
+    - ProgressCallback - type of callback receiving number of bytes uploaded so far and size of the file(s)
+    - ModelClientError - raised when ML model API could not be reached or responded with an error
+    - ClientMetrics - counters of requests, retries, failures and latency of calls to ML model API
+    - ModelClient - pooled, keep-alive HTTP client with connect/read timeouts and retries with backoff
+    - get_model_client - returns ModelClient instance shared by all tasks within current worker process
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Iterator, Optional, Union
+
+import urllib3
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+from django.conf import settings
+
+from recordings.lossless import audio_size, open_audio
+
+logger = get_task_logger(__name__)
+
+# statuses returned by proxies and overloaded model containers, request is worth repeating
+RETRY_STATUSES = (502, 503, 504)
+# inference is not idempotent - only requests which did not reach the model are repeated, a read timeout
+# or a connection dropped while waiting for the response may mean the model is still analysing the recording
+RETRY_ERRORS = (urllib3.exceptions.ConnectTimeoutError,)
+
+
+class ModelClientError(Exception):
+    """Raised when ML model API could not be reached or responded with an error."""
+
+
+def _iter_file_part(file_path: str, boundary: str, field_name: str, chunk_size: int) -> Iterator[bytes]:
+    filename = os.path.basename(file_path).replace('"', '%22')
+    yield (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode()
+
+    # compressed recordings are decoded while they are sent, the model receives the WAV file
+    with open_audio(file_path) as fp:
+        while chunk := fp.read(chunk_size):
+            yield chunk
+    yield b'\r\n'
+
+
+def iter_multipart(file_paths: Union[str, list[str]], boundary: str, field_name: str = 'file',
+                   chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """
+    Yields multipart/form-data body with file field(s). Files are read in chunk_size blocks,
+    so memory usage does not depend on the length of the recordings.
+    """
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+
+    for file_path in file_paths:
+        yield from _iter_file_part(file_path, boundary, field_name, chunk_size)
+    yield f'--{boundary}--\r\n'.encode()
+
+
+ProgressCallback = Callable[[int, int], None]
+
+
+def _track_upload(body: Iterator[bytes], file_paths: Union[str, list[str]],
+                  progress: ProgressCallback) -> Iterator[bytes]:
+    # multipart headers are counted too, so sent bytes are capped at size of the files
+    total = sum(audio_size(path) for path in ([file_paths] if isinstance(file_paths, str) else file_paths))
+    sent = 0
+    for chunk in body:
+        yield chunk
+        sent += len(chunk)
+        progress(min(sent, total), total)
+
+
+class ClientMetrics:
+    """Thread safe counters describing calls made by ModelClient."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def request_started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def request_finished(self, latency: float, failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if failed:
+                self.failures += 1
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "mean_latency": self.total_latency / self.requests if self.requests else 0.0,
+                "max_latency": self.max_latency,
+            }
+
+
+class ModelClient:
+    """
+    HTTP client for ML model API. Keeps a pool of keep-alive connections, so consecutive recordings
+    analysed by the same worker process do not pay for TCP (and TLS) connection setup.
+    Every request is sent with connect and read timeouts and repeated with exponential backoff
+    when the connection could not be established (NewConnectionError is a ConnectTimeoutError too)
+    and on 502/503/504 responses. Read timeouts are not repeated, inference would run again.
+    Files are streamed with chunked transfer encoding instead of being loaded into memory.
+    """
+
+    def __init__(
+        self, base_url: str, connect_timeout: float = 5.0, read_timeout: float = 600.0,
+        max_retries: int = 3, backoff_factor: float = 0.5, pool_size: int = 4, chunk_size: int = 1024 * 1024
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.chunk_size = chunk_size
+        self.metrics = ClientMetrics()
+
+        # retries are handled by the client itself - request body (file) has to be reopened on every attempt
+        self.pool = urllib3.PoolManager(
+            num_pools=1, maxsize=pool_size, retries=False,
+            timeout=urllib3.Timeout(connect=connect_timeout, read=read_timeout)
+        )
+
+    @classmethod
+    def from_settings(cls) -> "ModelClient":
+        return cls(
+            base_url=settings.CELERY_MODEL_URL,
+            connect_timeout=settings.CELERY_MODEL_CONNECT_TIMEOUT,
+            read_timeout=settings.CELERY_MODEL_READ_TIMEOUT,
+            max_retries=settings.CELERY_MODEL_MAX_RETRIES,
+            backoff_factor=settings.CELERY_MODEL_RETRY_BACKOFF,
+            pool_size=settings.CELERY_MODEL_POOL_SIZE,
+            chunk_size=settings.CELERY_MODEL_UPLOAD_CHUNK_SIZE,
+        )
+
+    def inference(self, file_path: str, progress: Optional[ProgressCallback] = None) -> dict:
+        """Sends recording to /inference endpoint and returns decoded JSON response."""
+        return json.loads(self.post_files("/inference", file_path, progress=progress))
+
+    def batch_inference(self, file_paths: list[str]) -> list[dict]:
+        """
+        Sends recordings in one request to /batch_inference endpoint (as repeated "files" field).
+        Returns list of responses shaped like /inference response, in order of file_paths.
+        """
+        data = json.loads(self.post_files("/batch_inference", file_paths, field_name="files"))
+        if len(data["results"]) != len(file_paths):
+            raise ModelClientError(f"ML model returned {len(data['results'])} results for {len(file_paths)} files")
+        return data["results"]
+
+    def post_files(self, endpoint: str, file_paths: Union[str, list[str]], field_name: str = 'file',
+                   progress: Optional[ProgressCallback] = None) -> bytes:
+        """
+        Streams file(s) as multipart/form-data POST request, files are reopened (and always closed) on every attempt.
+        progress is called after each sent chunk (upload starts from zero again when request is retried).
+        Returns response body. Raises ModelClientError if all attempts have failed.
+        """
+        url = f"{self.base_url}{endpoint}"
+        boundary = uuid.uuid4().hex
+        headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.metrics.retried()
+                time.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+
+            self.metrics.request_started()
+            started = time.monotonic()
+            body = iter_multipart(file_paths, boundary, field_name, chunk_size=self.chunk_size)
+            if progress is not None:
+                body = _track_upload(body, file_paths, progress)
+            try:
+                response = self.pool.urlopen('POST', url, headers=headers, chunked=True, body=body)
+            except urllib3.exceptions.HTTPError as e:
+                self.metrics.request_finished(time.monotonic() - started, failed=True)
+                if not isinstance(e, RETRY_ERRORS):
+                    raise ModelClientError(f"Request to ML model failed: {e}") from e
+                if attempt == self.max_retries:
+                    raise ModelClientError(f"Could not reach ML model: {e}") from e
+                logger.warning(f"Request to ML model failed ({e.__class__.__name__}), retrying")
+                continue
+
+            failed = response.status >= 400
+            self.metrics.request_finished(time.monotonic() - started, failed=failed)
+            if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                logger.warning(f"ML model responded with {response.status}, retrying")
+                continue
+            if failed:
+                raise ModelClientError(f"ML model responded with {response.status}")
+
+            logger.debug(f"ML model client stats: {self.stats()}")
+            return response.data
+
+    def pool_stats(self) -> dict:
+        """Returns number of connections opened by the pool and number of requests which reused them."""
+        opened = requests_sent = idle = 0
+        for key in self.pool.pools.keys():
+            pool = self.pool.pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+            # queue is pre-filled with None placeholders, only actual connections are idle
+            idle += sum(1 for conn in pool.pool.queue if conn is not None) if pool.pool else 0
+        return {
+            "connections_opened": opened,
+            "connections_reused": max(requests_sent - opened, 0),
+            "connections_idle": idle,
+        }
+
+    def stats(self) -> dict:
+        return {**self.metrics.as_dict(), **self.pool_stats()}
+
+    def close(self):
+        self.pool.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_model_client() -> ModelClient:
+    """Returns ModelClient shared by all tasks executed within current worker process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ModelClient.from_settings()
+    return _client
+
+
+def _reset_client():
+    # pooled sockets must not be shared between parent and forked worker processes
+    global _client
+    _client = None
+
+
+os.register_at_fork(after_in_child=_reset_client)
+
+
+@worker_process_shutdown.connect
+def close_model_client(**kwargs):
+    if _client is not None:
+        logger.info(f"ML model client stats: {_client.stats()}")
+        _client.close()
@@ -103,3 +103,13 @@ class DashboardConsumer(AsyncJsonWebsocketConsumer):
                 "message": message, "timestamp": timezone.now().isoformat()
             }
         )
+
+    async def batch(self, event):
+        # messages to the group sent together by WebsocketNotifier (analysis/notifications.py), in their order
+        for message in event.get("messages", []):
+            await self.dispatch(message)
+
+    async def progress(self, event):
+        # stage, percent and ETA of running analysis (see analysis/progress.py)
+        progress = event.get("payload")
+        await self.send_json({"type": "progress", "payload": progress, "timestamp": timezone.now().isoformat()})
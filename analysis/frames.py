@@ -0,0 +1,76 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Frames of analysed recording (start of each frame in seconds and probability of bowel sound in it)
+kept in NumPy arrays while they are processed. Recording.probability_frames stores them in compact binary form
+(see recordings/probability.py), list of {"start", "probability"} dictionaries is used only in JSON responses.
+
+File consists of:
+    - Frames - starts and probabilities of frames as NumPy arrays
+    - frames_from_list - converts list of frame dictionaries (ML model response) to Frames
+    - frames_to_list - converts Frames to list of frame dictionaries (JSON format of probability plot)
+    - mock_frames - random frames used by mocked model
+"""
+from operator import itemgetter
+from typing import NamedTuple, Union
+
+import numpy as np
+
+_get_start = itemgetter("start")
+_get_probability = itemgetter("probability")
+
+
+class Frames(NamedTuple):
+    """Frames of recording, both arrays have the same length."""
+    starts: np.ndarray
+    probabilities: np.ndarray
+
+    @classmethod
+    def empty(cls) -> "Frames":
+        return cls(np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64))
+
+
+def frames_from_list(frames: list[dict]) -> Frames:
+    """Converts list of {"start", "probability"} dictionaries to Frames (no intermediate objects are created)."""
+    count = len(frames)
+    return Frames(
+        np.fromiter(map(_get_start, frames), dtype=np.float64, count=count),
+        np.fromiter(map(_get_probability, frames), dtype=np.float64, count=count),
+    )
+
+
+def frames_to_list(frames: Union[Frames, list[dict]]) -> list[dict]:
+    """Converts Frames to list of {"start", "probability"} dictionaries, lists are returned unchanged."""
+    if not isinstance(frames, Frames):
+        return frames
+    # tolist converts whole arrays to Python floats at once, much faster than iterating over NumPy scalars
+    return [
+        {"start": start, "probability": probability}
+        for start, probability in zip(frames.starts.tolist(), frames.probabilities.tolist())
+    ]
+
+
+def mock_frames(count: int = 1000, rng: np.random.Generator = None) -> Frames:
+    """Returns count frames 10 ms apart (frame length of the ML model) with random probabilities."""
+    rng = rng or np.random.default_rng()
+    return Frames(np.round(np.arange(count) / 100, 2), rng.random(count))
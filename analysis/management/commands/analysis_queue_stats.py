@@ -0,0 +1,44 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which prints depth of each analysis queue in broker and wait times of tasks
+started from it (time between enqueue and start of the task).
+
+usage: python manage.py analysis_queue_stats
+"""
+from django.core.management import BaseCommand
+
+from analysis.scheduling import queue_stats
+
+
+class Command(BaseCommand):
+    """Django command which prints metrics of analysis priority queues"""
+    help = "Prints depth and wait times of analysis priority queues"
+
+    def handle(self, *args, **options):
+        for queue, stats in queue_stats().items():
+            depth = "?" if stats["depth"] is None else stats["depth"]
+            self.stdout.write(
+                f"{queue:<22} depth: {depth:>6}   started: {stats['started']:>6}   "
+                f"mean wait: {stats['mean_wait']:8.2f} s   max wait: {stats['max_wait']:8.2f} s"
+            )
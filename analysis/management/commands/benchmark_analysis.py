@@ -0,0 +1,149 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which measures end-to-end throughput of analysis. Synthetic WAV recordings are pushed
+through process_recording executed by running Celery workers (they should use ML model stand-in,
+see run_model_standin command, and CELERY_COUNT_ROUND_TRIPS=True to report round trips).
+Reports tasks per second, p50/p95/p99 latency (enqueue to finish) and DB and Redis round trips per task.
+
+usage: python manage.py benchmark_analysis [--recordings 50] [--duration 60] [--timeout 600] [--keep]
+"""
+import os
+import statistics
+import tempfile
+import time
+import wave
+from datetime import timezone
+
+from celery.exceptions import TimeoutError
+from celery.states import SUCCESS
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.management import BaseCommand
+from django.utils import timezone as django_timezone
+
+from analysis.roundtrips import get_round_trips
+from analysis.scheduling import INTERACTIVE_QUEUE, enqueue
+from analysis.tasks import process_recording
+from examinations.models import Examination
+from recordings.models import Recording
+
+User = get_user_model()
+
+BENCHMARK_EMAIL = 'benchmark@bowell.local'
+
+
+def write_noise_wav(path: str, seconds: float, frame_rate: int = 44100):
+    """Writes mono 16-bit WAV file filled with noise (every file is different, so inference cache is not hit)."""
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(os.urandom(int(seconds * frame_rate) * 2))
+
+
+def percentiles(values: list[float]) -> tuple[float, float, float]:
+    """Returns p50, p95 and p99 of values."""
+    if len(values) == 1:
+        return values[0], values[0], values[0]
+    quantiles = statistics.quantiles(values, n=100, method='inclusive')
+    return quantiles[49], quantiles[94], quantiles[98]
+
+
+class Command(BaseCommand):
+    """Django command which measures throughput and latency of analyses executed by Celery workers"""
+    help = "Pushes synthetic recordings through process_recording and reports throughput, latency and round trips"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recordings', type=int, default=50, help="Number of analysed recordings")
+        parser.add_argument('--duration', type=float, default=60, help="Length of each recording in seconds")
+        parser.add_argument('--timeout', type=float, default=600, help="Maximum time of the whole benchmark")
+        parser.add_argument('--keep', action='store_true', help="Do not remove created recordings")
+
+    def _create_recordings(self, doctor: User, count: int, duration: float) -> list[Recording]:
+        recordings = []
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(count):
+                name = f"benchmark-{i}.wav"
+                path = os.path.join(directory, name)
+                write_noise_wav(path, duration)
+                with open(path, 'rb') as fp:
+                    recording = Recording.objects.create(file=File(fp, name=name), name=name)
+                Examination.objects.create(doctor=doctor, date=django_timezone.now(), recording=recording)
+                recordings.append(recording)
+        return recordings
+
+    def handle(self, *args, **options):
+        doctor, _ = User.objects.get_or_create(email=BENCHMARK_EMAIL, defaults={
+            "first_name": "Benchmark", "last_name": "Doctor", "type": User.Types.DOCTOR
+        })
+        recordings = self._create_recordings(doctor, options['recordings'], options['duration'])
+        self.stdout.write(f"Created {len(recordings)} recordings of {options['duration']} s")
+
+        started = time.time()
+        tasks = [
+            enqueue(process_recording, (recording.id, recording.file.path, doctor.id), INTERACTIVE_QUEUE)
+            for recording in recordings
+        ]
+
+        latencies = []
+        finished = []
+        round_trips = []
+        failed = 0
+        for task in tasks:
+            try:
+                task.get(timeout=max(started + options['timeout'] - time.time(), 1), propagate=False)
+            except TimeoutError:
+                pass
+            if task.status != SUCCESS:
+                failed += 1
+                continue
+            # date_done is UTC
+            done = task.date_done.replace(tzinfo=timezone.utc).timestamp()
+            finished.append(done)
+            latencies.append(done - started)
+            if (counts := get_round_trips(task.id)) is not None:
+                round_trips.append(counts)
+
+        if latencies:
+            p50, p95, p99 = percentiles(latencies)
+            elapsed = max(finished) - started
+            self.stdout.write(f"succeeded: {len(latencies)}   failed: {failed}   time: {elapsed:.2f} s")
+            self.stdout.write(f"throughput: {len(latencies) / elapsed:.2f} tasks/s")
+            self.stdout.write(f"latency p50: {p50:.2f} s   p95: {p95:.2f} s   p99: {p99:.2f} s")
+        else:
+            self.stdout.write(f"All {failed} analyses failed")
+
+        if round_trips:
+            db = sum(counts["db"] for counts in round_trips) / len(round_trips)
+            redis = sum(counts["redis"] for counts in round_trips) / len(round_trips)
+            self.stdout.write(f"round trips per task - DB: {db:.1f}   Redis: {redis:.1f}")
+        else:
+            self.stdout.write("Round trips were not counted (run workers with CELERY_COUNT_ROUND_TRIPS=True)")
+
+        if not options['keep']:
+            for recording in recordings:
+                recording.file.delete(save=False)
+            ids = [recording.id for recording in recordings]
+            Examination.objects.filter(recording__id__in=ids).delete()
+            Recording.objects.filter(id__in=ids).delete()
@@ -0,0 +1,153 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which compares time and peak memory of previous (Python loops over frame dictionaries)
+and current (NumPy arrays) frame processing - mocked model frames, parsing and mapping of ML model response,
+statistics of merged segments and storage of probability plot (JSON list vs packed binary frames).
+
+usage: python manage.py benchmark_frames [--frames 50000] [--repeat 5]
+"""
+import json
+import math
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management import BaseCommand
+
+from analysis.frames import frames_to_list, mock_frames
+from analysis.segmentation import compute_statistics, merge_frames
+from analysis.standin import make_result
+from analysis.tasks import map_model_response
+from recordings.probability import ENCODINGS, FLOAT32, ProbabilityPlot
+
+
+def previous_mock_frames(count: int) -> list[dict]:
+    # previous call_mock implementation
+    return [{"start": round(i / 1000, 2), "probability": random.random()} for i in range(count)]
+
+
+def previous_merge_and_statistics(segments: list[dict], duration: float, threshold: float) -> dict:
+    # previous merge_frames, detect_sounds and compute_statistics (dictionary per frame, statistics module)
+    segments = sorted(segments, key=lambda segment: segment["start"])
+    frames = []
+    for i, segment in enumerate(segments):
+        own_start = (segments[i - 1]["end"] + segment["start"]) / 2 if i > 0 else -math.inf
+        own_end = (segment["end"] + segments[i + 1]["start"]) / 2 if i < len(segments) - 1 else math.inf
+        for frame in segment["frames"]:
+            start = segment["start"] + frame["start"]
+            if own_start <= start < own_end:
+                frames.append({**frame, "start": round(start, 3)})
+
+    step = statistics.median(b["start"] - a["start"] for a, b in zip(frames, frames[1:]))
+    sounds, sound_start, previous = [], None, None
+    for frame in frames:
+        if frame["probability"] >= threshold:
+            if sound_start is None:
+                sound_start = frame["start"]
+        elif sound_start is not None:
+            sounds.append((sound_start, previous["start"] + step))
+            sound_start = None
+        previous = frame
+    if sound_start is not None:
+        sounds.append((sound_start, previous["start"] + step))
+
+    per_minute = [0] * max(math.ceil(duration / 60), 1)
+    for start, _ in sounds:
+        per_minute[min(int(start // 60), len(per_minute) - 1)] += 1
+    gaps = [b[0] - a[1] for a, b in zip(sounds, sounds[1:])]
+    return {
+        "bowell_sounds_number": len(sounds),
+        "mean_per_minute": statistics.mean(per_minute),
+        "deviation_per_minute": statistics.pstdev(per_minute),
+        "quartiles": statistics.quantiles(sorted(per_minute), n=4, method='inclusive'),
+        "repetition_within_100ms": 100 * sum(gap <= 0.1 for gap in gaps) / len(sounds) if sounds else 0.0,
+        "probability_plot": frames,
+    }
+
+
+class Command(BaseCommand):
+    """Django command which measures frame processing with Python loops and with NumPy arrays"""
+    help = "Compares time and peak memory of frame processing with Python loops and NumPy arrays"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=50000, help="Number of frames of a recording")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of measured runs (best one is reported)")
+
+    def _measure(self, label: str, function, repeat: int):
+        best = math.inf
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(f"{label:<32} time: {best * 1000:9.2f} ms   peak memory: {peak / 2 ** 20:8.2f} MB")
+
+    def handle(self, *args, **options):
+        count, repeat = options['frames'], options['repeat']
+
+        self.stdout.write(f"Mocked model frames ({count} frames)")
+        self._measure("python loop", lambda: previous_mock_frames(count), repeat)
+        self._measure("numpy", lambda: frames_to_list(mock_frames(count)), repeat)
+
+        # response of ML model with 10 ms frames, parsed and mapped to Recording fields
+        body = json.dumps(make_result(count)).encode()
+        self.stdout.write(f"ML model response ({len(body) / 2 ** 20:.1f} MB)")
+        self._measure("parse and map", lambda: map_model_response(json.loads(body)), repeat)
+
+        # the same response split into 4 overlapping segments
+        duration = count / 100
+        length = duration / 4 + 10
+        segments = []
+        for i in range(4):
+            start = i * duration / 4
+            end = min(start + length, duration)
+            segments.append({"start": start, "end": end, "frames": make_result(int((end - start) * 100))["frames"]})
+
+        self.stdout.write(f"Merge of 4 segments and statistics ({count} frames)")
+        def merge_and_statistics(to_list: bool):
+            frames = merge_frames(segments)
+            data = {**compute_statistics(frames, duration, 0.5), "probability_frames": frames}
+            if to_list:
+                data["probability_frames"] = frames_to_list(frames)
+            return data
+
+        self._measure("python loop", lambda: previous_merge_and_statistics(segments, duration, 0.5), repeat)
+        self._measure("numpy", lambda: merge_and_statistics(to_list=False), repeat)
+        self._measure("numpy + list of frames", lambda: merge_and_statistics(to_list=True), repeat)
+
+        # value stored in the database: JSON list (previous probability_plot) or packed binary frames
+        frames = merge_frames(segments)
+        as_json = json.dumps(frames_to_list(frames))
+        self.stdout.write(f"Probability plot storage ({count} frames)")
+        for encoding in ENCODINGS:
+            size = len(ProbabilityPlot.from_frames(frames).to_bytes(encoding))
+            self.stdout.write(f"{encoding:<32} size: {size / 2 ** 10:9.1f} kB")
+        self.stdout.write(f"{'json':<32} size: {len(as_json) / 2 ** 10:9.1f} kB")
+        self._measure("json encode and decode", lambda: json.loads(json.dumps(frames_to_list(frames))), repeat)
+        self._measure("float32 encode and decode",
+                      lambda: ProbabilityPlot.from_bytes(ProbabilityPlot.from_frames(frames).to_bytes(FLOAT32)), repeat)
@@ -0,0 +1,87 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which compares peak memory usage of building ML model request body
+with requests' multipart encoder (whole file in memory) and with streamed multipart body.
+
+usage: python manage.py benchmark_model_upload [--size-mb 200] [--chunk-size 1048576]
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+import wave
+
+import requests
+from django.core.management import BaseCommand
+
+from analysis.client import iter_multipart
+
+
+def write_synthetic_wav(path: str, size_mb: int, frame_rate: int = 44100):
+    """Writes mono 16-bit WAV file of roughly size_mb megabytes filled with noise."""
+    block = os.urandom(frame_rate * 2)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        for _ in range(size_mb * 1024 * 1024 // len(block)):
+            wav.writeframes(block)
+
+
+class Command(BaseCommand):
+    """Django command which measures peak memory of buffered and streamed uploads of a recording"""
+    help = "Compares peak memory of buffered and streamed multipart upload of a synthetic WAV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=200, help="Size of synthetic recording")
+        parser.add_argument('--chunk-size', type=int, default=1024 * 1024, help="Streaming chunk size in bytes")
+
+    def _measure(self, label: str, build_body):
+        tracemalloc.start()
+        started = time.perf_counter()
+        sent = build_body()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label:<10} body: {sent / 2 ** 20:8.1f} MB   peak memory: {peak / 2 ** 20:8.1f} MB   "
+            f"time: {elapsed:6.2f} s"
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.wav')
+            write_synthetic_wav(path, options['size_mb'])
+
+            def buffered():
+                # previous call_model implementation - requests encodes whole multipart body in memory
+                with open(path, 'rb') as fp:
+                    prepared = requests.Request('POST', 'http://model/inference', files=[('file', fp)]).prepare()
+                return len(prepared.body)
+
+            def streamed():
+                return sum(len(chunk) for chunk in iter_multipart(path, 'boundary', chunk_size=options['chunk_size']))
+
+            self._measure("buffered", buffered)
+            self._measure("streamed", streamed)
@@ -0,0 +1,58 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which runs local stand-in for ML model API (see analysis/standin.py).
+Celery workers use it when CELERY_MODEL_URL points to it and CELERY_USE_MOCK_MODEL=False.
+
+usage: python manage.py run_model_standin [--port 5000] [--latency 0.5] [--jitter 0.1] [--error-rate 0.01]
+       [--frames 1000]
+"""
+from django.core.management import BaseCommand
+
+from analysis.standin import make_server
+
+
+class Command(BaseCommand):
+    """Django command which serves /inference and /batch_inference endpoints with random results"""
+    help = "Runs local stand-in for ML model API with configurable latency, jitter, error rate and response size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=5000)
+        parser.add_argument('--latency', type=float, default=0.5, help="Mean inference time in seconds")
+        parser.add_argument('--jitter', type=float, default=0.1, help="Inference time varies by +- jitter seconds")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests failing with 503")
+        parser.add_argument('--frames', type=int, default=1000, help="Number of frames in each result")
+
+    def handle(self, *args, **options):
+        server = make_server(
+            options['host'], options['port'], latency=options['latency'], jitter=options['jitter'],
+            error_rate=options['error_rate'], frames=options['frames']
+        )
+        self.stdout.write(f"ML model stand-in listening on http://{options['host']}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
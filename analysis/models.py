@@ -19,10 +19,56 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 
-Created automatically by Django CLI.
+author: Gustaw Daczkowski
 
-description: File for models definitions.
+description: File contains model description of InferenceResult class.
+
+models:
+    - InferenceResult - ML model results cached by SHA-256 of the recording and model version
+    - InferenceCacheCounter - hit/miss counter of the cache of ML model results
+    - PendingAnalysis - recording waiting in the accumulation window of batch analysis
 """
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+
+
+class InferenceResult(models.Model):
+    """Result of ML model inference (mapped to Recording fields) cached by content of the analysed recording."""
+    audio_hash = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=64)
+    result = models.JSONField(encoder=DjangoJSONEncoder)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'inference_results'
+        constraints = [
+            models.UniqueConstraint(fields=['audio_hash', 'model_version'], name='unique_inference_result')
+        ]
+
+    def __str__(self):
+        return f"InferenceResult {self.audio_hash[:12]} (model {self.model_version})"
+
+
+class InferenceCacheCounter(models.Model):
+    """Counter shared by all workers, incremented with UPDATE in the database (increments are not lost)."""
+    name = models.CharField(max_length=32, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'inference_cache_counters'
+
+
+class PendingAnalysis(models.Model):
+    """Recording whose analysis was started by the user and waits to be sent to ML model with others in a batch."""
+    recording = models.OneToOneField(to='recordings.Recording', on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(to=settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    queue = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
 
-# Create your models here.
+    class Meta:
+        db_table = 'pending_analyses'
@@ -0,0 +1,185 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Sending websocket messages from Celery workers through a single, long-lived event loop.
+
+File consists of:
+    - WebsocketNotifier - background event loop with one channel_layer connection, batches queued messages
+      and coalesces progress messages of each recording, messages to one group are sent as one batch message
+    - get_notifier - returns WebsocketNotifier shared by all tasks within current worker process
+"""
+import asyncio
+import os
+import threading
+from collections import defaultdict
+
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+from channels.layers import get_channel_layer
+
+logger = get_task_logger(__name__)
+
+# type of message with list of messages to one group, handled by DashboardConsumer.batch
+BATCH_TYPE = "batch"
+
+
+class WebsocketNotifier:
+    """
+    Runs an event loop in a daemon thread and keeps one channel_layer (and its Redis connection) for the whole
+    lifetime of the worker process. Synchronous code submits messages with send() which never blocks.
+    Messages queued while the previous batch was being sent are sent together - messages to different groups
+    are sent concurrently over the same connection, messages to one group are sent as one message of BATCH_TYPE
+    (unpacked in their order by DashboardConsumer), so a batch takes one round trip per group. Progress messages
+    of one recording are coalesced within a batch, only the latest of them is sent (at its place in the order).
+    """
+
+    def __init__(self):
+        self.channel_layer = None
+        self.messages = 0
+        self.batches = 0
+        self.failures = 0
+        self.coalesced = 0
+
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='websocket-notifier', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.Queue()
+        self.channel_layer = get_channel_layer()
+        self._consumer = self.loop.create_task(self._consume())
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _consume(self):
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            await self._send_batch(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    async def _send_group(self, group_name: str, messages: list[dict]):
+        # sends one after another would keep order only with a round trip per message
+        message = messages[0] if len(messages) == 1 else {"type": BATCH_TYPE, "messages": messages}
+        try:
+            await self.channel_layer.group_send(group_name, message)
+        except Exception as e:
+            self.failures += len(messages)
+            logger.warning(f"Failed to send {len(messages)} message(s) via channel_layer.group_send: {e}")
+
+    @staticmethod
+    def _coalesce(batch: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+        # progress of a recording is a state, earlier reports are superseded by the latest one
+        latest = {}
+        for index, (group_name, message) in enumerate(batch):
+            if message.get("type") == "progress":
+                latest[(group_name, message.get("payload", {}).get("recording_id"))] = index
+        return [
+            (group_name, message) for index, (group_name, message) in enumerate(batch)
+            if message.get("type") != "progress"
+            or latest[(group_name, message.get("payload", {}).get("recording_id"))] == index
+        ]
+
+    async def _send_batch(self, batch: list[tuple[str, dict]]):
+        messages = self._coalesce(batch)
+        self.coalesced += len(batch) - len(messages)
+        grouped = defaultdict(list)
+        for group_name, message in messages:
+            grouped[group_name].append(message)
+
+        await asyncio.gather(*(self._send_group(name, messages) for name, messages in grouped.items()))
+        self.messages += len(batch)
+        self.batches += 1
+        logger.debug(f"sent {len(messages)} of {len(batch)} message(s) to {len(grouped)} group(s) via channel_layer")
+
+    def send(self, group_name: str, message: dict):
+        """Queues message for sending, returns immediately."""
+        if self.channel_layer is None:
+            logger.debug("channel_layer is not configured, message dropped")
+            return
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (group_name, message))
+
+    def flush(self, timeout: float = 5.0):
+        """Blocks until all queued messages have been sent (or timeout has passed)."""
+        if self.channel_layer is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.queue.join(), self.loop).result(timeout)
+        except Exception as e:
+            logger.warning(f"Websocket messages were not flushed: {e}")
+
+    async def _shutdown(self):
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+
+    def close(self, timeout: float = 5.0):
+        """Sends queued messages and stops the event loop."""
+        self.flush(timeout)
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages, "batches": self.batches, "failures": self.failures, "coalesced": self.coalesced
+        }
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier() -> WebsocketNotifier:
+    """Returns WebsocketNotifier shared by all tasks executed within current worker process."""
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                _notifier = WebsocketNotifier()
+    return _notifier
+
+
+def _reset_notifier():
+    # threads do not survive fork - forked worker process starts its own loop
+    global _notifier
+    _notifier = None
+
+
+os.register_at_fork(after_in_child=_reset_notifier)
+
+
+@worker_process_shutdown.connect
+def close_notifier(**kwargs):
+    if _notifier is not None:
+        logger.info(f"Websocket notifier stats: {_notifier.stats()}")
+        _notifier.close()
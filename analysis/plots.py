@@ -0,0 +1,189 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Rendering of statistics plots of analysed recording (RecordingPlot kinds) in Celery worker.
+Bowel sounds are detected in frames of probability plot and summarised per minute of the recording, plots
+are drawn as SVG images (no plotting library is needed and output is byte-for-byte reproducible, so equal
+plots are stored only once - see RecordingPlot and PlotImage).
+
+File consists of:
+    - MinuteSeries - sounds per minute, sound index and mean sound duration in each minute of recording
+    - minute_series - computes MinuteSeries from frames
+    - line_plot, histogram, scatter_plot - SVG renderers
+    - render_plots - all statistics plots of a recording
+"""
+from typing import NamedTuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from analysis.frames import Frames
+from analysis.segmentation import detect_sounds
+from recordings.models import RecordingPlot
+
+SVG = 'image/svg+xml'
+
+WIDTH, HEIGHT = 640, 360
+# left, right, top and bottom margin around plot area (axis labels and title)
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 64, 16, 32, 48
+TICKS = 5
+HISTOGRAM_BINS = 20
+COLOR = '#2f6fb3'
+
+
+class MinuteSeries(NamedTuple):
+    """Values of each minute of recording, sound index is percentage of the minute filled with bowel sounds."""
+    minutes: np.ndarray
+    sounds_per_minute: np.ndarray
+    sound_index: np.ndarray
+    sound_duration: np.ndarray
+    durations: np.ndarray
+
+
+def minute_series(frames: Frames, threshold: float) -> MinuteSeries:
+    """Detects bowel sounds in frames and summarises them in each minute (by start of the sound)."""
+    starts, ends = detect_sounds(frames, threshold)
+    durations = ends - starts
+    duration = float(frames.starts[-1]) if len(frames.starts) else 0.0
+    count = int(duration // 60) + 1
+
+    minute = np.minimum(starts // 60, count - 1).astype(np.int64)
+    sounds = np.bincount(minute, minlength=count)
+    total_duration = np.bincount(minute, weights=durations, minlength=count)
+    mean_duration = np.divide(total_duration, sounds, out=np.zeros(count), where=sounds > 0)
+    return MinuteSeries(np.arange(count), sounds, 100 * total_duration / 60, mean_duration, durations)
+
+
+def _ticks(low: float, high: float) -> np.ndarray:
+    return np.linspace(low, high, TICKS)
+
+
+def _range(values: np.ndarray) -> tuple[float, float]:
+    if not len(values):
+        return 0.0, 1.0
+    low, high = float(np.min(values)), float(np.max(values))
+    return (low, high) if high > low else (low - 0.5, high + 0.5)
+
+
+def _plot(title: str, x_label: str, y_label: str, x_range: tuple, y_range: tuple, shapes) -> bytes:
+    """
+    Returns SVG with axes, ticks and labels around shapes. shapes is a function getting functions which map
+    x and y values to pixel coordinates and returning list of SVG elements.
+    """
+    left, right = MARGIN_LEFT, WIDTH - MARGIN_RIGHT
+    top, bottom = MARGIN_TOP, HEIGHT - MARGIN_BOTTOM
+
+    def x_of(value):
+        return left + (np.asarray(value, dtype=np.float64) - x_range[0]) / (x_range[1] - x_range[0]) * (right - left)
+
+    def y_of(value):
+        return bottom - (np.asarray(value, dtype=np.float64) - y_range[0]) / (y_range[1] - y_range[0]) * (bottom - top)
+
+    elements = [
+        f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" fill="none" stroke="#999"/>',
+        f'<text x="{WIDTH / 2}" y="{top - 12}" text-anchor="middle" font-size="14">{escape(title)}</text>',
+        f'<text x="{WIDTH / 2}" y="{HEIGHT - 8}" text-anchor="middle">{escape(x_label)}</text>',
+        f'<text x="14" y="{HEIGHT / 2}" text-anchor="middle" transform="rotate(-90 14 {HEIGHT / 2})">'
+        f'{escape(y_label)}</text>',
+    ]
+    for value in _ticks(*x_range):
+        x = x_of(value)
+        elements.append(f'<line x1="{x:.1f}" y1="{bottom}" x2="{x:.1f}" y2="{bottom + 4}" stroke="#999"/>')
+        elements.append(f'<text x="{x:.1f}" y="{bottom + 16}" text-anchor="middle">{value:.3g}</text>')
+    for value in _ticks(*y_range):
+        y = y_of(value)
+        elements.append(f'<line x1="{left - 4}" y1="{y:.1f}" x2="{left}" y2="{y:.1f}" stroke="#999"/>')
+        elements.append(f'<text x="{left - 6}" y="{y + 4:.1f}" text-anchor="end">{value:.3g}</text>')
+    elements.extend(shapes(x_of, y_of))
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{WIDTH}" height="{HEIGHT}" '
+        f'viewBox="0 0 {WIDTH} {HEIGHT}" font-family="sans-serif" font-size="11">{"".join(elements)}</svg>'
+    ).encode()
+
+
+def line_plot(x: np.ndarray, y: np.ndarray, title: str, x_label: str, y_label: str) -> bytes:
+    def shapes(x_of, y_of):
+        points = " ".join(f"{px:.1f},{py:.1f}" for px, py in zip(x_of(x).tolist(), y_of(y).tolist()))
+        return [f'<polyline points="{points}" fill="none" stroke="{COLOR}" stroke-width="1.5"/>']
+
+    return _plot(title, x_label, y_label, _range(x), (0.0, max(_range(y)[1], 1.0)), shapes)
+
+
+def histogram(values: np.ndarray, title: str, x_label: str) -> bytes:
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS, range=_range(values))
+
+    def shapes(x_of, y_of):
+        lefts, rights, tops = x_of(edges[:-1]).tolist(), x_of(edges[1:]).tolist(), y_of(counts).tolist()
+        bottom = float(y_of(0))
+        return [
+            f'<rect x="{x0:.1f}" y="{y:.1f}" width="{x1 - x0:.1f}" height="{bottom - y:.1f}" '
+            f'fill="{COLOR}" stroke="#fff"/>'
+            for x0, x1, y in zip(lefts, rights, tops)
+        ]
+
+    return _plot(title, x_label, "count", (float(edges[0]), float(edges[-1])), (0.0, max(int(counts.max()), 1)), shapes)
+
+
+def scatter_plot(x: np.ndarray, y: np.ndarray, title: str, x_label: str, y_label: str) -> bytes:
+    def shapes(x_of, y_of):
+        return [
+            f'<circle cx="{px:.1f}" cy="{py:.1f}" r="3" fill="{COLOR}" fill-opacity="0.6"/>'
+            for px, py in zip(x_of(x).tolist(), y_of(y).tolist())
+        ]
+
+    return _plot(title, x_label, y_label, _range(x), _range(y), shapes)
+
+
+def render_plots(frames: Frames, threshold: float) -> dict[str, bytes]:
+    """Returns SVG image of every RecordingPlot kind computed from frames of probability plot."""
+    series = minute_series(frames, threshold)
+    kinds = RecordingPlot.Kinds
+    sounds_label, index_label, duration_label = "sounds per minute", "sound index [%]", "mean sound duration [s]"
+    return {
+        kinds.bowell_sounds_per_minute_in_time: line_plot(
+            series.minutes, series.sounds_per_minute, "Bowel sounds per minute", "minute", sounds_label
+        ),
+        kinds.sound_index_in_time: line_plot(
+            series.minutes, series.sound_index, "Sound index in time", "minute", index_label
+        ),
+        kinds.sound_duration_in_time: line_plot(
+            series.minutes, series.sound_duration, "Sound duration in time", "minute", duration_label
+        ),
+        kinds.sounds_per_minute_histogram: histogram(
+            series.sounds_per_minute, "Sounds per minute histogram", sounds_label
+        ),
+        kinds.sound_duration_histogram: histogram(
+            series.durations, "Sound duration histogram", "sound duration [s]"
+        ),
+        kinds.sounds_per_minute_vs_sound_index_scatterplot: scatter_plot(
+            series.sounds_per_minute, series.sound_index, "Sounds per minute vs sound index", sounds_label, index_label
+        ),
+        kinds.sounds_per_minute_vs_sound_duration_scatterplot: scatter_plot(
+            series.sounds_per_minute, series.sound_duration, "Sounds per minute vs sound duration", sounds_label,
+            duration_label
+        ),
+        kinds.sound_index_vs_duration_scatterplot: scatter_plot(
+            series.sound_index, series.sound_duration, "Sound index vs sound duration", index_label, duration_label
+        ),
+    }
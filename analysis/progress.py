@@ -0,0 +1,135 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Progress reporting of running analyses. Progress is stored in Celery result backend
+as custom PROGRESS state of the analysis task (returned by GET /api/examinations/<id>/inference/)
+and pushed to websocket group of the user who started the analysis.
+
+File consists of:
+    - PROGRESS - custom Celery task state
+    - Stages - stages of analysis and part of the whole analysis (percent range) each of them takes
+    - ProgressReporter - publishes stage, percent and ETA of analysis of a recording
+"""
+import time
+from typing import Optional
+
+from celery import Task
+from django.conf import settings
+from django.core.cache import cache
+
+from analysis.celery import app
+from analysis.client import ProgressCallback
+from analysis.notifications import get_notifier
+
+PROGRESS = 'PROGRESS'
+
+SEGMENTS_KEY = 'analysis:progress-segments'
+SEGMENTS_TIMEOUT = 24 * 60 * 60
+
+
+class Stages:
+    upload = 'upload'
+    inference = 'inference'
+    persistence = 'persistence'
+
+    ranges = {
+        upload: (0, 40),
+        inference: (40, 90),
+        persistence: (90, 100),
+    }
+
+
+class ProgressReporter:
+    """
+    Publishes progress of analysis of a single recording. Reports within a stage are throttled
+    to one per CELERY_PROGRESS_INTERVAL seconds. ETA is extrapolated from time elapsed since start of the analysis.
+    Reporter can be passed to subtasks as dictionary (as_dict) and recreated with ProgressReporter(**data).
+    """
+
+    def __init__(self, task_id: str, recording_id: int, user_id: int, started_at: Optional[float] = None,
+                 store: bool = True):
+        self.task_id = task_id
+        self.recording_id = recording_id
+        self.user_id = user_id
+        self.started_at = started_at or time.time()
+        # eagerly applied tasks have no result backend to store progress in
+        self.store = store
+        self._last_stage = None
+        self._last_report = 0.0
+
+    @classmethod
+    def for_task(cls, task: Task, recording_id: int, user_id: int) -> "ProgressReporter":
+        return cls(task.request.id, recording_id, user_id, store=not task.request.is_eager)
+
+    def as_dict(self) -> dict:
+        return {
+            "task_id": self.task_id,
+            "recording_id": self.recording_id,
+            "user_id": self.user_id,
+            "started_at": self.started_at,
+            "store": self.store,
+        }
+
+    def report(self, stage: str, fraction: float = 0.0, detail: Optional[dict] = None, force: bool = False):
+        """Publishes progress, fraction is the completed part of the stage (0 - 1)."""
+        now = time.time()
+        if not force and stage == self._last_stage and now - self._last_report < settings.CELERY_PROGRESS_INTERVAL:
+            return
+        self._last_stage, self._last_report = stage, now
+
+        start, end = Stages.ranges[stage]
+        percent = round(start + (end - start) * min(max(fraction, 0.0), 1.0), 1)
+        elapsed = now - self.started_at
+        meta = {
+            "recording_id": self.recording_id,
+            "stage": stage,
+            "percent": percent,
+            "elapsed": round(elapsed, 1),
+            "eta": round(elapsed * (100 - percent) / percent, 1) if percent else None,
+            **(detail or {}),
+        }
+
+        if self.store:
+            app.backend.store_result(self.task_id, meta, PROGRESS)
+        get_notifier().send(f"user-{self.user_id}", {"type": "progress", "payload": meta})
+
+    def upload_callback(self) -> ProgressCallback:
+        """Returns callback for ModelClient reporting upload of the recording (and start of inference after it)."""
+        def callback(sent: int, total: int):
+            if sent < total:
+                self.report(Stages.upload, sent / total)
+            else:
+                self.report(Stages.inference, force=True)
+        return callback
+
+    def start_segments(self):
+        """Resets counter of analysed segments, called before segments are sent to workers."""
+        cache.set(f"{SEGMENTS_KEY}:{self.task_id}", 0, timeout=SEGMENTS_TIMEOUT)
+
+    def segment_finished(self, segments: int):
+        """Reports inference of one of the segments (subtasks finish in any order, so finished ones are counted)."""
+        try:
+            done = cache.incr(f"{SEGMENTS_KEY}:{self.task_id}")
+        except ValueError:  # counter expired
+            done = segments
+        self.report(Stages.inference, done / segments, {"segments_done": done, "segments": segments}, force=True)
@@ -0,0 +1,105 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Counting of database and Redis round trips made by Celery tasks (enabled with CELERY_COUNT_ROUND_TRIPS).
+Counts of each task are saved in Django cache after the task has finished and read by benchmark_analysis command.
+Redis round trips are commands sent by redis-py (result backend, broker), websocket messages sent
+by channel layer are not counted.
+
+File consists of:
+    - RoundTripCounter - counts queries executed by Django connection and commands sent by redis-py in current thread
+    - get_round_trips - counts saved for given task
+"""
+import threading
+from typing import Optional
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from redis.connection import Connection
+
+ROUND_TRIPS_KEY = 'analysis:round-trips'
+ROUND_TRIPS_TIMEOUT = 24 * 60 * 60
+
+_local = threading.local()
+
+
+class RoundTripCounter:
+    """Counts round trips made by the current thread between start and stop."""
+
+    def __init__(self):
+        self.db = 0
+        self.redis = 0
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.db += 1
+        return execute(sql, params, many, context)
+
+    def start(self):
+        _local.counter = self
+        connection.execute_wrappers.append(self._count_query)
+
+    def stop(self):
+        _local.counter = None
+        if self._count_query in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self._count_query)
+
+    def as_dict(self) -> dict:
+        return {"db": self.db, "redis": self.redis}
+
+
+_send_packed_command = Connection.send_packed_command
+
+
+def _counting_send_packed_command(self, *args, **kwargs):
+    # pipelines are sent as one packed command, so each call is one round trip
+    if (counter := getattr(_local, 'counter', None)) is not None:
+        counter.redis += 1
+    return _send_packed_command(self, *args, **kwargs)
+
+
+def _install_redis_hook():
+    # redis-py is patched only in processes which count round trips
+    if Connection.send_packed_command is not _counting_send_packed_command:
+        Connection.send_packed_command = _counting_send_packed_command
+
+
+@task_prerun.connect
+def _start_counting(task=None, **kwargs):
+    if settings.CELERY_COUNT_ROUND_TRIPS:
+        _install_redis_hook()
+        task.request.round_trips = RoundTripCounter()
+        task.request.round_trips.start()
+
+
+@task_postrun.connect
+def _save_round_trips(task_id=None, task=None, **kwargs):
+    if (counter := getattr(task.request, 'round_trips', None)) is not None:
+        counter.stop()
+        cache.set(f"{ROUND_TRIPS_KEY}:{task_id}", counter.as_dict(), timeout=ROUND_TRIPS_TIMEOUT)
+
+
+def get_round_trips(task_id: str) -> Optional[dict]:
+    """Returns number of database and Redis round trips of the task or None if they were not counted."""
+    return cache.get(f"{ROUND_TRIPS_KEY}:{task_id}")
@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Priority queues and per-user fair scheduling of analysis tasks.
+Analyses started from the API go to the interactive queue, batch analyses to the bulk queue and analyses started
+in the admin panel to the admin queue. Workers should consume them in this order (-Q option), with Redis
+broker option queue_order_strategy=priority the first non-empty queue is always served first.
+Bulk and admin analyses of a single user hold one of CELERY_MAX_TASKS_PER_USER slots while they run,
+tasks which do not get a slot are retried later, so one doctor re-analysing an archive does not occupy all workers.
+Task which replaces itself with a chord hands its slot over to the chord callback, which frees it at the end.
+
+File consists of:
+    - INTERACTIVE_QUEUE, BULK_QUEUE, ADMIN_QUEUE - names of queues in order of priority
+    - enqueue - sends task to queue, stamps message with the queue name and enqueue time
+    - get_queue - queue of the task being executed
+    - acquire_slot, release_slot - per-user semaphore stored in Django cache
+    - start_task - acquires slot (or retries the task) and records wait time of the task in its queue
+    - hand_over_slot - detaches slot from the running task, so it is held until the work continued elsewhere ends
+    - queue_stats - depth of each queue in broker and wait times of tasks started from it
+"""
+import time
+from typing import Optional
+
+from celery import Task
+from celery.result import AsyncResult
+from celery.signals import task_postrun
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.core.cache import cache
+
+from analysis.celery import app
+
+logger = get_task_logger(__name__)
+
+INTERACTIVE_QUEUE = 'analysis.interactive'
+ADMIN_QUEUE = 'analysis.admin'
+BULK_QUEUE = 'analysis.bulk'
+QUEUES = (INTERACTIVE_QUEUE, ADMIN_QUEUE, BULK_QUEUE)
+
+# queues in which tasks compete for per-user slots
+FAIR_QUEUES = (ADMIN_QUEUE, BULK_QUEUE)
+
+QUEUE_HEADER = 'analysis_queue'
+ENQUEUED_AT_HEADER = 'analysis_enqueued_at'
+
+SLOT_KEY = 'analysis:slot'
+WAIT_KEY = 'analysis:queue-wait'
+
+
+def enqueue(task: Task, args: tuple, queue: str) -> AsyncResult:
+    """Sends task to given analysis queue."""
+    return task.apply_async(args, queue=queue, headers={QUEUE_HEADER: queue, ENQUEUED_AT_HEADER: time.time()})
+
+
+def _get_header(request, name: str):
+    # custom headers become attributes of request in worker, eagerly applied tasks keep them in request.headers
+    return getattr(request, name, None) or (request.headers or {}).get(name)
+
+
+def get_queue(request) -> Optional[str]:
+    """Returns analysis queue of the task being executed or None when it was sent without enqueue."""
+    return _get_header(request, QUEUE_HEADER)
+
+
+def acquire_slot(user_id: int, task_id: str) -> Optional[str]:
+    """
+    Takes one of CELERY_MAX_TASKS_PER_USER slots of the user, returns its cache key or None when all are taken.
+    Slots expire after CELERY_USER_SLOT_TIMEOUT seconds, so they are not lost when worker is killed.
+    """
+    for slot in range(settings.CELERY_MAX_TASKS_PER_USER):
+        key = f"{SLOT_KEY}:{user_id}:{slot}"
+        # add is atomic - only one task gets the slot
+        if cache.add(key, task_id, timeout=settings.CELERY_USER_SLOT_TIMEOUT) or cache.get(key) == task_id:
+            return key
+    return None
+
+
+def release_slot(key: str, task_id: str):
+    """Frees slot taken by the task."""
+    if cache.get(key) == task_id:
+        cache.delete(key)
+
+
+def _record_wait(queue: str, wait: float):
+    # counters are not updated atomically, they are approximate when many tasks start at once
+    stats = cache.get(f"{WAIT_KEY}:{queue}") or {"started": 0, "total_wait": 0.0, "max_wait": 0.0}
+    stats["started"] += 1
+    stats["total_wait"] += wait
+    stats["max_wait"] = max(stats["max_wait"], wait)
+    cache.set(f"{WAIT_KEY}:{queue}", stats, timeout=None)
+
+
+def start_task(task: Task, user_id: int):
+    """
+    Called at the beginning of analysis task. Tasks from fair queues take a slot of the user first,
+    when all slots are taken the task is retried after CELERY_FAIRNESS_RETRY_DELAY seconds (Retry is raised).
+    Time between enqueue and start of the task is recorded in statistics of its queue.
+    """
+    request = task.request
+    queue = get_queue(request)
+    if queue is None:
+        return
+
+    if queue in FAIR_QUEUES and settings.CELERY_MAX_TASKS_PER_USER:
+        if (key := acquire_slot(user_id, request.id)) is None:
+            logger.info(f"User {user_id} has no free slots, task {request.id} postponed")
+            raise task.retry(
+                countdown=settings.CELERY_FAIRNESS_RETRY_DELAY, max_retries=None,
+                headers={QUEUE_HEADER: queue, ENQUEUED_AT_HEADER: _get_header(request, ENQUEUED_AT_HEADER)}
+            )
+        request.analysis_slot = key
+
+    if (enqueued_at := _get_header(request, ENQUEUED_AT_HEADER)) is not None:
+        _record_wait(queue, time.time() - enqueued_at)
+
+
+def hand_over_slot(task: Task) -> Optional[list]:
+    """
+    Detaches slot from the task being executed, so it is not freed when the task returns (e.g. when it is replaced
+    by a chord). Returns [key, task_id] of the slot (None if task has no slot), whoever finishes the work
+    must free it with release_slot(*slot).
+    """
+    request = task.request
+    key, request.analysis_slot = getattr(request, 'analysis_slot', None), None
+    return [key, request.id] if key is not None else None
+
+
+@task_postrun.connect
+def _release_task_slot(task_id=None, task=None, **kwargs):
+    if (key := getattr(task.request, 'analysis_slot', None)) is not None:
+        release_slot(key, task_id)
+
+
+def queue_stats() -> dict:
+    """Returns number of waiting messages (None if broker could not be asked) and wait times for each queue."""
+    depths = {}
+    try:
+        with app.connection_for_read() as connection:
+            connection.ensure_connection(max_retries=1)
+            channel = connection.default_channel
+            for queue in QUEUES:
+                _, depths[queue], _ = channel.queue_declare(queue, passive=True)
+    except Exception as e:  # broker unavailable or queue not declared yet
+        logger.warning(f"Could not read depth of analysis queues: {e}")
+
+    stats = {}
+    for queue in QUEUES:
+        wait = cache.get(f"{WAIT_KEY}:{queue}") or {"started": 0, "total_wait": 0.0, "max_wait": 0.0}
+        stats[queue] = {
+            "depth": depths.get(queue),
+            "started": wait["started"],
+            "mean_wait": wait["total_wait"] / wait["started"] if wait["started"] else 0.0,
+            "max_wait": wait["max_wait"],
+        }
+    return stats
@@ -0,0 +1,152 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Utilities used for analysing long recordings in overlapping segments.
+
+File consists of:
+    - get_duration - duration of WAV file in seconds
+    - plan_segments - splits recording into overlapping windows
+    - write_segment - copies part of WAV file into a new WAV file
+    - merge_frames - stitches frames returned for each segment into one timeline (NumPy arrays, see frames.py)
+    - detect_sounds - finds bowel sounds (runs of frames above probability threshold)
+    - compute_statistics - recomputes "Main results" statistics from merged frames (on NumPy arrays)
+"""
+import math
+import wave
+from datetime import timedelta
+
+import numpy as np
+
+from analysis.frames import Frames, frames_from_list
+from recordings.lossless import open_audio
+
+# frames are read and written in blocks of this many audio frames
+COPY_BLOCK_FRAMES = 64 * 1024
+
+
+def get_duration(file_path: str) -> float:
+    """Returns duration of WAV file in seconds. Raises wave.Error or EOFError for files which are not WAV."""
+    with open_audio(file_path) as file, wave.open(file, 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def plan_segments(duration: float, length: float, overlap: float) -> list[tuple[float, float]]:
+    """Returns list of (start, end) windows of given length covering the recording, neighbours overlap."""
+    if duration <= length:
+        return [(0.0, duration)]
+
+    step = length - overlap
+    count = math.ceil((duration - overlap) / step)
+    return [(i * step, min(i * step + length, duration)) for i in range(count)]
+
+
+def write_segment(file_path: str, start: float, end: float, target_path: str):
+    """Copies audio between start and end (in seconds) of WAV file to a new WAV file, block by block."""
+    with open_audio(file_path) as file, wave.open(file, 'rb') as source, wave.open(target_path, 'wb') as target:
+        target.setparams(source.getparams())
+        rate = source.getframerate()
+        first, last = int(start * rate), min(int(end * rate), source.getnframes())
+        source.setpos(first)
+
+        frame_size = source.getsampwidth() * source.getnchannels()
+        remaining = last - first
+        while remaining > 0:
+            block = source.readframes(min(COPY_BLOCK_FRAMES, remaining))
+            if not block:
+                break
+            target.writeframes(block)
+            remaining -= len(block) // frame_size
+
+
+def merge_frames(segments: list[dict]) -> Frames:
+    """
+    Stitches frames of analysed segments into one timeline. Frame starts within each segment are relative
+    to its start. Every overlap is split in half - each segment owns frames up to the middle of the overlap,
+    so no part of the recording is counted twice.
+    """
+    segments = sorted(segments, key=lambda segment: segment["start"])
+    starts, probabilities = [], []
+
+    for i, segment in enumerate(segments):
+        own_start = (segments[i - 1]["end"] + segment["start"]) / 2 if i > 0 else -math.inf
+        own_end = (segment["end"] + segments[i + 1]["start"]) / 2 if i < len(segments) - 1 else math.inf
+
+        frames = frames_from_list(segment["frames"])
+        segment_starts = segment["start"] + frames.starts
+        owned = (segment_starts >= own_start) & (segment_starts < own_end)
+        starts.append(segment_starts[owned])
+        probabilities.append(frames.probabilities[owned])
+
+    if not starts:
+        return Frames.empty()
+    return Frames(np.round(np.concatenate(starts), 3), np.concatenate(probabilities))
+
+
+def detect_sounds(frames: Frames, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """Returns starts and ends of every run of consecutive frames with probability not lower than threshold."""
+    if len(frames.starts) < 2:
+        return np.empty(0), np.empty(0)
+
+    step = np.median(np.diff(frames.starts))
+    # +1 where run of frames above threshold begins, -1 after its last frame
+    edges = np.diff(np.concatenate(([0], frames.probabilities >= threshold, [0])).astype(np.int8))
+    first = np.flatnonzero(edges == 1)
+    last = np.flatnonzero(edges == -1) - 1
+    return frames.starts[first], frames.starts[last] + step
+
+
+def compute_statistics(frames: Frames, duration: float, threshold: float) -> dict:
+    """Recomputes statistics returned by ML model in "Main results" (mapped to Recording fields) from frames."""
+    sound_starts, sound_ends = detect_sounds(frames, threshold)
+    count = len(sound_starts)
+    minutes = max(math.ceil(duration / 60), 1)
+
+    minute_of_sound = np.minimum(sound_starts // 60, minutes - 1).astype(np.int64)
+    per_minute = np.bincount(minute_of_sound, minlength=minutes)
+    first_decile, first_quartile, median, third_quartile, ninth_decile = np.percentile(
+        per_minute, [10, 25, 50, 75, 90]
+    )
+
+    gaps = sound_starts[1:] - sound_ends[:-1]
+
+    def repetition(within: float) -> float:
+        return 100 * int(np.count_nonzero(gaps <= within)) / count if count else 0.0
+
+    # NumPy scalars are converted to Python numbers, so results can be saved and serialized to JSON
+    return {
+        "bowell_sounds_number": count,
+        "mean_per_minute": float(per_minute.mean()),
+        "deviation_per_minute": float(per_minute.std()),
+        "median_per_minute": float(median),
+        "first_quartile_per_minute": float(first_quartile),
+        "third_quartile_per_minute": float(third_quartile),
+        "first_decile_per_minute": float(first_decile),
+        "ninth_decile_per_minute": float(ninth_decile),
+        "minimum_per_minute": int(per_minute.min()),
+        "maximum_per_minute": int(per_minute.max()),
+        "total_sound_index": count / (duration / 60) if duration else 0.0,
+        "repetition_within_50ms": repetition(0.05),
+        "repetition_within_100ms": repetition(0.1),
+        "repetition_within_200ms": repetition(0.2),
+        "length": timedelta(seconds=round(duration)),
+    }
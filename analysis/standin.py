@@ -0,0 +1,150 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Local stand-in for ML model API used in development and benchmarks. Responds to /inference
+and /batch_inference with random results shaped like actual model response after configurable latency,
+fails with 503 status at configurable rate.
+
+File consists of:
+    - make_result - random result shaped like ML model response with given number of frames
+    - StandInModelHandler - keep-alive request handler draining uploaded (also chunked) multipart body
+    - make_server - threaded HTTP server with given latency, jitter, error rate and response size
+"""
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from celery.utils.log import get_task_logger
+
+from analysis.tasks import mapper
+
+logger = get_task_logger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+BATCH_FIELD = b'name="files"'
+
+
+def make_result(frames: int, frame_length: float = 0.01) -> dict:
+    """Returns random result of analysis of a single recording shaped like ML model response."""
+    statistics = {key: round(random.uniform(0, 10), 2) for key in mapper}
+    statistics["Bowel sounds identified, total count"] = random.randint(0, frames)
+    length = time.gmtime(frames * frame_length)
+    statistics["Recording length, hours:minutes:seconds"] = time.strftime("%H:%M:%S", length)
+    return {
+        "code": 200,
+        "error": "",
+        "frames": [{"start": round(i * frame_length, 2), "probability": random.random()} for i in range(frames)],
+        "statistics": {"Main results": statistics},
+    }
+
+
+class StandInModelHandler(BaseHTTPRequestHandler):
+    """
+    Handler of ML model endpoints. Uploaded files are read and discarded, only number of files
+    is counted (batch endpoint returns one result per file).
+    """
+    protocol_version = 'HTTP/1.1'
+    server: "StandInModelServer"
+
+    def _iter_body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, READ_CHUNK_SIZE))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+            return
+        while size := int(self.rfile.readline().strip(), 16):
+            while size > 0:
+                chunk = self.rfile.read(min(size, READ_CHUNK_SIZE))
+                size -= len(chunk)
+                yield chunk
+            self.rfile.readline()
+        self.rfile.readline()
+
+    def _count_batch_files(self) -> int:
+        count = 0
+        tail = b''
+        for chunk in self._iter_body():
+            # field name may be split between chunks
+            data = tail + chunk
+            count += data.count(BATCH_FIELD)
+            tail = data[-(len(BATCH_FIELD) - 1):]
+        return count
+
+    def _respond(self, status: int, result: dict):
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path not in ('/inference', '/batch_inference'):
+            self.send_error(404)
+            return
+        files = self._count_batch_files()
+
+        server = self.server
+        time.sleep(max(0.0, random.uniform(server.latency - server.jitter, server.latency + server.jitter)))
+        if random.random() < server.error_rate:
+            self._respond(503, {"code": 503, "error": "Model unavailable (stand-in)"})
+            return
+
+        if self.path == '/batch_inference':
+            self._respond(200, {"results": [make_result(server.frames) for _ in range(files)]})
+        else:
+            self._respond(200, make_result(server.frames))
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} - {format % args}")
+
+
+class StandInModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+    latency: float
+    jitter: float
+    error_rate: float
+    frames: int
+
+
+def make_server(host: str = '127.0.0.1', port: int = 5000, latency: float = 0.0, jitter: float = 0.0,
+                error_rate: float = 0.0, frames: int = 1000) -> StandInModelServer:
+    """
+    Returns stand-in server (not started, call serve_forever).
+
+    :param latency: Mean time of inference in seconds
+    :param jitter: Inference time is drawn uniformly from latency +- jitter
+    :param error_rate: Fraction of requests answered with 503 status
+    :param frames: Number of frames in each result (size of response)
+    """
+    server = StandInModelServer((host, port), StandInModelHandler)
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.frames = frames
+    return server
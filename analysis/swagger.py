@@ -25,15 +25,37 @@ description: File consists of serializers definition used only for swagger docum
 """
 from rest_framework import serializers
 from celery.states import PENDING, RECEIVED, STARTED, SUCCESS, FAILURE, RETRY, REVOKED
+from analysis.progress import PROGRESS
 from recordings.serializers import RecordingAfterAnalysisSerializer
 
 
+class ProgressSerializer(serializers.Serializer):
+    """Serializer used for swagger documentation.
+    Progress of running analysis (stage, percent and ETA in seconds)"""
+    recording_id = serializers.IntegerField()
+    stage = serializers.ChoiceField(choices=("upload", "inference", "persistence"))
+    percent = serializers.FloatField()
+    elapsed = serializers.FloatField()
+    eta = serializers.FloatField(allow_null=True)
+    segments_done = serializers.IntegerField(required=False)
+    segments = serializers.IntegerField(required=False)
+
+
 class InferenceResponseSerializer(serializers.Serializer):
     """Serializer used for swagger documentation.
     Return type of response at GET /api/examinations/<id>/inference/"""
     task_id = serializers.CharField(max_length=36)
     status = serializers.ChoiceField(choices=(
-        PENDING, RECEIVED, STARTED, SUCCESS, FAILURE, RETRY, REVOKED
+        PENDING, RECEIVED, STARTED, PROGRESS, SUCCESS, FAILURE, RETRY, REVOKED
     ))
     # optional result
     result = RecordingAfterAnalysisSerializer(required=False)
+    # progress of running analysis
+    progress = ProgressSerializer(required=False, allow_null=True)
+
+
+class BatchInferenceResponseSerializer(serializers.Serializer):
+    """Serializer used for swagger documentation.
+    Return type of response at POST /api/examinations/batch_inference/"""
+    message = serializers.CharField()
+    task_ids = serializers.ListField(child=serializers.CharField(max_length=36))
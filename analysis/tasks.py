@@ -25,30 +25,69 @@ description: Contains Celery task definitions and utilities.
 
 File consists of:
     - mapper - mapping ML model response fields to Recording model fields
-    - model_mock, call_mock - mocked model response
+    - model_mock, call_mock, call_batch_mock - mocked model response
     - send_websocket_message - utility function for sending ws message via channel_layer
+      (through long-lived event loop shared within worker process, see analysis/notifications.py)
+    - update_examination_status - utility function for updating examination status and notifying user
     - BaseTask - Celery Task base class with on_failure, on_success implementation
     - process_recording - Our main Celery task
+      (sent to priority queues with per-user slots, see analysis/scheduling.py)
     - call_model - utility function for performing HTTP POST request to ML model API in Docker container
+      (via pooled ModelClient shared within worker process, see analysis/client.py)
+      progress of analysis is published with ProgressReporter (see analysis/progress.py)
+    - map_model_response - utility function mapping ML model response to Recording model fields
+    - save_analysis_results - updates Recording with results of analysis
+    - render_recording_plots - renders and stores statistics plots of analysed recording
+    - get_analysed_recording - Recording serialized as result of analysis
+    - plan_batches - groups recordings into batches analysed in a single request
+    - BatchTask - Celery Task base class of batch analysis marking its examinations as failed on failure
+    - add_to_batch - accumulates recording for batch analysis started after CELERY_BATCH_WINDOW seconds
+    - flush_pending_analyses - Celery task sending accumulated recordings to batch analysis
+    - process_recordings_batch - Celery task analysing many recordings in one request to ML model
+    - plan_recording_segments - windows in which long recording is analysed (segmented analysis)
+    - analyse_segment - Celery subtask analysing a single window of long recording
+    - merge_segments - Celery chord callback merging results of all windows
+    - segmented_analysis_failed - errback of segmented analysis chord
 """
-import asyncio
-import random
-
-import requests
-from celery import Task
+import os
+import tempfile
+import wave
+from hashlib import sha256
+from typing import Optional
+
+from celery import Task, chord, group
+from celery.states import FAILURE, SUCCESS
 from celery.utils.log import get_task_logger
-from channels.layers import get_channel_layer
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_duration
 
 from analysis.celery import app
+from analysis.cache import file_sha256, get_cached_result, store_result
+from analysis.client import get_model_client
+from analysis.frames import mock_frames
+from analysis.models import PendingAnalysis
+from analysis.notifications import get_notifier
+from analysis.plots import SVG, render_plots
+from analysis.progress import ProgressReporter, Stages
+from analysis.scheduling import enqueue, get_queue, hand_over_slot, release_slot, start_task
+from analysis.segmentation import compute_statistics, get_duration, merge_frames, plan_segments, write_segment
 from examinations.models import Examination
 from examinations.serializers import ExaminationSerializer
-from recordings.models import Recording
+from examinations.statistics import invalidate_doctor_statistics
+from recordings.lossless import audio_size
+from recordings.models import PlotImage, Recording, RecordingPlot
+from recordings.probability import ProbabilityPlot
+from recordings.pyramid import ProbabilityPyramid
 from recordings.serializers import RecordingAfterAnalysisSerializer
 
 logger = get_task_logger(__name__)
 
+# cache key marking that accumulated analyses of the user already have a scheduled flush
+FLUSH_KEY = 'analysis:batch-flush'
+
 mapper = {
     # Recording model fields are incompatible with fields returned in ML model response,
     # hence mapping is needed
@@ -114,68 +153,66 @@ model_mock = {
 }
 
 
-async def send_websocket_message(group_name: str, message: dict):
+def send_websocket_message(group_name: str, message: dict):
     """
-    Sends websocket message via channel_layer. Logs debug and warning messages to console.
+    Queues websocket message which is sent via channel_layer by event loop of current worker process.
+    Does not block, failures are logged by the notifier.
 
     :param group_name: Dashboard consumer group_name to which message will be sent
     :param message: Dictionary with type, message (and optional payload)
-    :return: Coroutine
     """
+    get_notifier().send(group_name, message)
 
-    channel_layer = get_channel_layer()
-    logger.debug(f"trying to send message via channel_layer.group_send")
-    try:
-        await channel_layer.group_send(group_name, message)
-        logger.debug(f"sent message via channel_layer")
-    except Exception as e:
-        logger.warning("Failed to send a message via channel_layer.group_send")
-        logger.warning(e)
+
+def update_examination_status(recording_id: int, user_id: int, status: str, message: str):
+    """
+    Sets status of examination with given recording and notifies user via websocket.
+
+    :param recording_id: ID of the analyzed recording
+    :param user_id: ID of the doctor who initiated the analysis
+    :param status: New examination status
+    :param message: Message sent to the user together with serialized examination
+    """
+    ex = Examination.objects.filter(recording__id=recording_id)
+    ex.update(status=status)
+    examination = ex.first()
+    # update() does not send signals of Examination
+    invalidate_doctor_statistics(examination.doctor_id if examination else None)
+    serialized = ExaminationSerializer(examination).data
+
+    send_websocket_message(
+        group_name=f"user-{user_id}",
+        message={
+            "type": "update_examination",
+            "message": message,
+            "payload": serialized
+        }
+    )
 
 
 class BaseTask(Task):
     """
     Celery Task with overwritten on_success, on_failure methods.
     Those methods handle saving examination and sending websocket messages after the task has been executed.
+    Tasks using this base take (recording_id, file_path, user_id) as their last positional arguments.
     """
 
     def run(self, *args, **kwargs):
         super().run(*args, **kwargs)
 
     def on_success(self, retval, task_id, args, kwargs):
-        recording_id, _, user_id = args
-        ex = Examination.objects.filter(recording__id=recording_id)
-        ex.update(status=Examination.Statuses.processing_succeeded)
-        serialized = ExaminationSerializer(ex.first()).data
-
-        asyncio.run(
-            send_websocket_message(
-                group_name=f"user-{user_id}",
-                message={
-                    "type": "update_examination",
-                    "message": f"Analysis of recording {recording_id} completed!",
-                    "payload": serialized
-                }
-            )
+        recording_id, _, user_id = args[-3:]
+        update_examination_status(
+            recording_id, user_id, Examination.Statuses.processing_succeeded,
+            f"Analysis of recording {recording_id} completed!"
         )
         return super().on_success(retval, task_id, args, kwargs)
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
-        recording_id, _, user_id = args
-        # set status to processing_failed
-        ex = Examination.objects.filter(recording__id=recording_id)
-        ex.update(status=Examination.Statuses.processing_failed)
-        serialized = ExaminationSerializer(ex.first()).data
-        # send ws message that analysis failed
-        asyncio.run(
-            send_websocket_message(
-                group_name=f"user-{user_id}",
-                message={
-                    "type": "update_examination",
-                    "message": f"Analysis of recording {recording_id} failed!",
-                    "payload": serialized
-                }
-            )
+        recording_id, _, user_id = args[-3:]
+        update_examination_status(
+            recording_id, user_id, Examination.Statuses.processing_failed,
+            f"Analysis of recording {recording_id} failed!"
         )
         return super().on_failure(exc, task_id, args, kwargs, einfo)
 
@@ -193,6 +230,8 @@ def process_recording(self, recording_id: int, file_path: str, user_id: int):
     :param user_id: ID of the doctor who initiated the analysis
     :return: Recording after updates serialized to JSON
     """
+    # waits for a free slot of the user when sent to bulk or admin queue
+    start_task(self, user_id)
     logger.info(f"started processing of Recording ID={recording_id}")
 
     # https://docs.celeryproject.org/en/stable/userguide/tasks.html#id7
@@ -204,63 +243,264 @@ def process_recording(self, recording_id: int, file_path: str, user_id: int):
     examination.status = Examination.Statuses.file_processing
     examination.save(update_fields=['analysis_id', 'status'])
 
-    asyncio.run(
+    send_websocket_message(
+        group_name=f"user-{user_id}",
+        message={
+            "type": "notify",
+            "message": f"Started processing of recording with id: {recording_id}"
+        }
+    )
+    progress = ProgressReporter.for_task(self, recording_id, user_id)
+
+    if settings.CELERY_USE_MOCK_MODEL:
+        progress.report(Stages.inference, force=True)
+        response = call_mock()
+        logger.info("Received response from ml model")
+
         send_websocket_message(
             group_name=f"user-{user_id}",
             message={
                 "type": "notify",
-                "message": f"Started processing of recording with id: {recording_id}"
+                "message": "Received response from model"
             }
         )
-    )
 
-    if settings.CELERY_USE_MOCK_MODEL:
-        response = call_mock()
-        logger.info("Received response from ml model")
+        data = {
+            **response["statistics"]["Main results"],
+            "probability_frames": response["frames"]
+        }
+    else:
+        # the same recording analysed by the same model version - reuse previous results,
+        # recordings uploaded in one request were hashed during the upload
+        audio_hash = Recording.objects.filter(id=recording_id).values_list('audio_id', flat=True).first()
+        audio_hash = audio_hash or file_sha256(file_path)
+        data = get_cached_result(audio_hash)
 
-        asyncio.run(
+        if data is not None:
             send_websocket_message(
                 group_name=f"user-{user_id}",
                 message={
                     "type": "notify",
-                    "message": "Received response from model"
+                    "message": "Loaded results of previous analysis of the same recording"
                 }
             )
-        )
-
-        data = {
-            **response["statistics"]["Main results"],
-            "probability_plot": response["frames"]
-        }
-    else:
-        data = call_model(file_path, user_id)
-
-    Recording.objects.filter(id=recording_id).update(**data, latest_analysis_date=timezone.now())
+        elif len(segments := plan_recording_segments(file_path)) > 1:
+            # long recording - analyse windows in parallel subtasks, merge_segments finishes the analysis
+            logger.info(f"Recording ID={recording_id} split into {len(segments)} segments")
+            # subtasks stay in the queue of the parent task
+            options = {"queue": queue} if (queue := get_queue(req)) else {}
+            progress.start_segments()
+            kwargs = {"progress": progress.as_dict(), "segments": len(segments)}
+            header = group(analyse_segment.s(file_path, start, end, **kwargs).set(**options) for start, end in segments)
+            # slot of the user is held until the callback (or errback) ends, not only until the chord is sent
+            slot = hand_over_slot(self)
+            callback = merge_segments.s(
+                recording_id, file_path, user_id, audio_hash=audio_hash, progress=progress.as_dict(), slot=slot
+            ).set(**options)
+            callback = callback.on_error(segmented_analysis_failed.s(recording_id, user_id, slot=slot))
+            return self.replace(chord(header, callback))
+        else:
+            data = call_model(file_path, user_id, progress)
+            store_result(audio_hash, data)
+
+    progress.report(Stages.persistence, force=True)
+    save_analysis_results(recording_id, data)
 
     logger.info(f"Successfully updated recording {recording_id}")
-    return RecordingAfterAnalysisSerializer(Recording.objects.get(id=recording_id)).data
+    return RecordingAfterAnalysisSerializer(get_analysed_recording(recording_id)).data
 
 
-def call_model(file_path: str, user_id: int):
+def call_model(file_path: str, user_id: int, progress: ProgressReporter = None):
     """
     Sends POST request to Machine Learning model API which runs in Docker container.
     Also logs to console and sends websocket messages via channel_layer.
     :param file_path: Path to file of the analyzed recording
     :param user_id: ID of the doctor who initiated the analysis
+    :param progress: Reporter of upload progress (optional)
     :return: Data returned in response mapped to Recording model fields.
     """
 
-    url = f"{settings.CELERY_MODEL_URL}/inference"
-    print(f"FILE path: {file_path}")
-    files = [
-        ('file', open(file_path, 'rb'))
-    ]
-    logger.info("Sending request to ml model")
+    logger.info(f"Sending request to ml model, file: {file_path}")
+
+    data = get_model_client().inference(file_path, progress=progress.upload_callback() if progress else None)
+
+    logger.info("Received response from ml model")
+    send_websocket_message(
+        group_name=f"user-{user_id}",
+        message={
+            "type": "notify",
+            "message": "Received response from model"
+        }
+    )
+
+    return map_model_response(data)
+
+
+def map_model_response(data: dict) -> dict:
+    """Maps statistics and frames returned by ML model to Recording model fields."""
+    stats = data["statistics"]["Main results"]
+
+    results = {v: stats[k] for k, v in mapper.items()}
+    # model returns length as "hours:minutes:seconds" string
+    if isinstance(results["length"], str):
+        results["length"] = parse_duration(results["length"])
+    # frames are packed into binary probability_frames when saved (see recordings/probability.py)
+    results["probability_frames"] = data["frames"]
+    return results
+
+
+def save_analysis_results(recording_id: int, data: dict):
+    """
+    Updates Recording with results of analysis, legacy JSON probability plot is replaced by probability_frames.
+    Downsampled pyramid of probability plot is built here, so it is computed once per analysis.
+    """
+    frames = data.get("probability_frames")
+    plot = None
+    if frames is not None:
+        plot = frames if isinstance(frames, ProbabilityPlot) else ProbabilityPlot.from_frames(frames)
+        data = {**data, "probability_frames": plot, "probability_pyramid": ProbabilityPyramid.from_plot(plot)}
+    Recording.objects.filter(id=recording_id).update(**data, probability_plot=None, latest_analysis_date=timezone.now())
+    if plot is not None:
+        render_recording_plots(recording_id, plot)
+
+
+def render_recording_plots(recording_id: int, plot: Optional[ProbabilityPlot]):
+    """
+    Renders statistics plots of recording from its probability plot and replaces previous ones (they are only
+    removed when plot is None). Images are stored under SHA-256 of their bytes - existing images are reused
+    and images no longer used by any plot are deleted.
+    """
+    images = {} if plot is None else {
+        kind: (sha256(image).hexdigest(), image)
+        for kind, image in render_plots(plot.to_frames(), settings.CELERY_SEGMENT_PROBABILITY_THRESHOLD).items()
+    }
+    with transaction.atomic():
+        previous = set(RecordingPlot.objects.filter(recording_id=recording_id).values_list('image_id', flat=True))
+        # images are never modified, so a conflict means the same image is already stored
+        PlotImage.objects.bulk_create(
+            [PlotImage(digest=digest, content_type=SVG, data=image) for digest, image in images.values()],
+            ignore_conflicts=True
+        )
+        RecordingPlot.objects.filter(recording_id=recording_id).delete()
+        RecordingPlot.objects.bulk_create(
+            RecordingPlot(recording_id=recording_id, kind=kind, image_id=digest) for kind, (digest, _) in images.items()
+        )
+        PlotImage.objects.filter(digest__in=previous, plots__isnull=True).delete()
+
+
+def get_analysed_recording(recording_id: int) -> Recording:
+    """Returns Recording returned by analysis tasks, downsampled pyramid of probability plot is not loaded."""
+    return Recording.objects.without_blobs('probability_plot', 'probability_frames').get(id=recording_id)
 
-    response = requests.request("POST", url, files=files)
 
-    logger.info(f"Received response from ml model, status {response.status_code}")
-    asyncio.run(
+def plan_batches(recordings: list[Recording]) -> list[list[int]]:
+    """
+    Groups recordings into batches sent to ML model in a single request. Batch contains at most
+    CELERY_BATCH_MAX_SIZE recordings of total size up to CELERY_BATCH_MAX_BYTES (larger recording is sent alone).
+    Size of WAV file is counted (compressed recordings are sent decoded).
+
+    :param recordings: Recordings to be analysed
+    :return: List of batches (lists of recording IDs)
+    """
+    batches, batch, batch_size = [], [], 0
+
+    for recording in recordings:
+        size = audio_size(recording.file.path)
+        full = len(batch) == settings.CELERY_BATCH_MAX_SIZE or batch_size + size > settings.CELERY_BATCH_MAX_BYTES
+        if batch and full:
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(recording.id)
+        batch_size += size
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _save_batch_result(recording_id: int, user_id: int, data: dict) -> str:
+    save_analysis_results(recording_id, data)
+    update_examination_status(
+        recording_id, user_id, Examination.Statuses.processing_succeeded,
+        f"Analysis of recording {recording_id} completed!"
+    )
+    return SUCCESS
+
+
+def _fail_batch_item(recording_id: int, user_id: int) -> str:
+    update_examination_status(
+        recording_id, user_id, Examination.Statuses.processing_failed, f"Analysis of recording {recording_id} failed!"
+    )
+    return FAILURE
+
+
+class BatchTask(Task):
+    """
+    Celery Task base of process_recordings_batch, which takes (recording_ids, user_id) as its last positional arguments.
+    When the task fails, examinations of the batch still processed by it are marked as failed and users are notified.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        recording_ids, user_id = args[-2:]
+        processing = Examination.objects.filter(
+            recording__id__in=recording_ids, analysis_id=task_id, status=Examination.Statuses.file_processing
+        ).values_list('recording_id', flat=True)
+        for recording_id in processing:
+            _fail_batch_item(recording_id, user_id)
+        return super().on_failure(exc, task_id, args, kwargs, einfo)
+
+
+@app.task(bind=True, base=BatchTask)
+def process_recordings_batch(self, recording_ids: list[int], user_id: int):
+    """
+    Celery task which analyses many recordings in a single request to batch endpoint of Machine Learning model
+    (recordings found in inference cache are not sent), updates proper Examination and Recording instances
+    and notifies user about each of them.
+
+    :param self: Attributes and methods on the task type instance
+    :param recording_ids: IDs of the analyzed recordings
+    :param user_id: ID of the doctor who initiated the analysis
+    :return: Dictionary with state (SUCCESS or FAILURE) of analysis of each recording
+    """
+    start_task(self, user_id)
+    logger.info(f"started batch processing of Recordings IDs={recording_ids}")
+
+    recordings = Recording.objects.only('id', 'file', 'audio_id').in_bulk(recording_ids)
+    Examination.objects.filter(recording__id__in=recording_ids).update(
+        analysis_id=self.request.id, status=Examination.Statuses.file_processing
+    )
+    # examinations of the batch were validated to belong to the doctor who started it
+    invalidate_doctor_statistics(user_id)
+    send_websocket_message(
+        group_name=f"user-{user_id}",
+        message={
+            "type": "notify",
+            "message": f"Started processing of {len(recordings)} recordings"
+        }
+    )
+
+    states = {}
+    pending = []  # recordings sent to the model with SHA-256 of their files
+    for recording_id in recording_ids:
+        if (recording := recordings.get(recording_id)) is None:
+            continue
+        if settings.CELERY_USE_MOCK_MODEL:
+            pending.append((recording, None))
+        else:
+            audio_hash = recording.audio_id or file_sha256(recording.file.path)
+            if (data := get_cached_result(audio_hash)) is not None:
+                states[str(recording_id)] = _save_batch_result(recording_id, user_id, data)
+            else:
+                pending.append((recording, audio_hash))
+
+    if pending:
+        # when the request fails, BatchTask marks examinations of pending recordings as failed
+        if settings.CELERY_USE_MOCK_MODEL:
+            responses = call_batch_mock(len(pending))
+        else:
+            responses = get_model_client().batch_inference([recording.file.path for recording, _ in pending])
+
+        logger.info(f"Received batch response from ml model ({len(responses)} results)")
         send_websocket_message(
             group_name=f"user-{user_id}",
             message={
@@ -268,22 +508,164 @@ def call_model(file_path: str, user_id: int):
                 "message": "Received response from model"
             }
         )
-    )
 
-    data = response.json()
-    raw_data = data["frames"]
-    stats = data["statistics"]["Main results"]
+        for (recording, audio_hash), response in zip(pending, responses):
+            if response.get("code", 200) != 200:
+                logger.warning(f"ML model could not analyse recording {recording.id}: {response.get('error')}")
+                states[str(recording.id)] = _fail_batch_item(recording.id, user_id)
+                continue
 
-    results = {v: stats[k] for k, v in mapper.items()}
-    results["probability_plot"] = raw_data
-    return results
+            if settings.CELERY_USE_MOCK_MODEL:
+                data = {**response["statistics"]["Main results"], "probability_frames": response["frames"]}
+            else:
+                data = map_model_response(response)
+                store_result(audio_hash, data)
+            states[str(recording.id)] = _save_batch_result(recording.id, user_id, data)
+
+    logger.info(f"Finished batch processing of Recordings IDs={recording_ids}")
+    return {"recordings": states}
+
+
+def add_to_batch(recording_id: int, user_id: int, queue: str):
+    """
+    Adds recording to analyses accumulated for the user in given queue. Accumulated recordings are sent
+    to process_recordings_batch CELERY_BATCH_WINDOW seconds after the first of them was added,
+    or at once when CELERY_BATCH_MAX_SIZE of them are waiting.
+
+    :param recording_id: ID of the recording to be analysed
+    :param user_id: ID of the doctor who initiated the analysis
+    :param queue: Analysis queue of the batches
+    """
+    PendingAnalysis.objects.update_or_create(recording_id=recording_id, defaults={'user_id': user_id, 'queue': queue})
+    if PendingAnalysis.objects.filter(user_id=user_id, queue=queue).count() >= settings.CELERY_BATCH_MAX_SIZE:
+        flush_pending_analyses.apply_async((user_id, queue), queue=queue)
+    elif cache.add(f"{FLUSH_KEY}:{user_id}:{queue}", 1, timeout=2 * settings.CELERY_BATCH_WINDOW + 60):
+        # the first recording of the window schedules its flush (key is deleted when flush starts, the recording
+        # was saved before, so it is either taken by that flush or schedules the next one)
+        flush_pending_analyses.apply_async((user_id, queue), queue=queue, countdown=settings.CELERY_BATCH_WINDOW)
+
+
+@app.task
+def flush_pending_analyses(user_id: int, queue: str) -> list[str]:
+    """
+    Celery task which sends recordings accumulated for the user to process_recordings_batch in batches.
+
+    :param user_id: ID of the doctor who initiated the analyses
+    :param queue: Analysis queue of the batches
+    :return: IDs of started batch tasks
+    """
+    cache.delete(f"{FLUSH_KEY}:{user_id}:{queue}")
+    with transaction.atomic():
+        pending = list(
+            PendingAnalysis.objects.select_for_update(of=('self',)).select_related('recording')
+            .filter(user_id=user_id, queue=queue).order_by('created_at')
+        )
+        PendingAnalysis.objects.filter(id__in=[analysis.id for analysis in pending]).delete()
+
+    batches = plan_batches([analysis.recording for analysis in pending])
+    logger.info(f"Sending {len(pending)} accumulated recordings of user {user_id} in {len(batches)} batches")
+    return [enqueue(process_recordings_batch, (batch, user_id), queue).id for batch in batches]
+
+
+def plan_recording_segments(file_path: str) -> list[tuple[float, float]]:
+    """
+    Returns windows in which recording should be analysed. Empty list means that recording should
+    be sent to ML model as a whole (segmented analysis disabled or file could not be read as WAV).
+    """
+    if not settings.CELERY_SEGMENTED_ANALYSIS:
+        return []
+    try:
+        duration = get_duration(file_path)
+    except (wave.Error, EOFError, OSError) as e:
+        logger.warning(f"Could not read duration of {file_path}, segmented analysis skipped: {e}")
+        return []
+    return plan_segments(duration, settings.CELERY_SEGMENT_LENGTH, settings.CELERY_SEGMENT_OVERLAP)
+
+
+@app.task
+def analyse_segment(file_path: str, start: float, end: float, progress: dict = None, segments: int = None) -> dict:
+    """
+    Celery subtask which sends a single window of recording to Machine Learning model.
+
+    :param file_path: Path to file of the analyzed recording
+    :param start: Start of the window in seconds
+    :param end: End of the window in seconds
+    :param progress: ProgressReporter of the whole analysis as dictionary (optional)
+    :param segments: Number of windows of the recording, used in progress reports
+    :return: Window boundaries and frames returned by the model (relative to the window start)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        segment_path = os.path.join(directory, "segment.wav")
+        write_segment(file_path, start, end, segment_path)
+        data = get_model_client().inference(segment_path)
+
+    if progress is not None:
+        ProgressReporter(**progress).segment_finished(segments)
+
+    logger.info(f"Received response from ml model for segment {start}-{end}s of {file_path}")
+    return {"start": start, "end": end, "frames": data["frames"]}
+
+
+@app.task(bind=True, base=BaseTask)
+def merge_segments(self, segments: list[dict], recording_id: int, file_path: str, user_id: int, audio_hash: str = None,
+                   progress: dict = None, slot: list = None):
+    """
+    Celery chord callback which stitches frames of all segments into one timeline,
+    recomputes main statistics and updates Recording instance.
+
+    :param self: Attributes and methods on the task type instance
+    :param segments: Results of analyse_segment subtasks
+    :param recording_id: ID of the analyzed recording
+    :param file_path: Path to file of the analyzed recording
+    :param user_id: ID of the doctor who initiated the analysis
+    :param audio_hash: SHA-256 of the recording, merged results are cached under this key
+    :param progress: ProgressReporter of the whole analysis as dictionary (optional)
+    :param slot: Slot of the user handed over by process_recording, freed when merging ends (optional)
+    :return: Recording after updates serialized to JSON
+    """
+    try:
+        reporter = ProgressReporter(**progress) if progress else ProgressReporter.for_task(self, recording_id, user_id)
+        reporter.report(Stages.persistence, force=True)
+        frames = merge_frames(segments)
+        duration = max(segment["end"] for segment in segments)
+
+        data = {
+            **compute_statistics(frames, duration, settings.CELERY_SEGMENT_PROBABILITY_THRESHOLD),
+            "probability_frames": frames
+        }
+        if audio_hash:
+            store_result(audio_hash, data)
+        save_analysis_results(recording_id, data)
+    finally:
+        if slot:
+            release_slot(*slot)
+
+    logger.info(f"Successfully merged {len(segments)} segments of recording {recording_id}")
+    return RecordingAfterAnalysisSerializer(get_analysed_recording(recording_id)).data
+
+
+@app.task
+def segmented_analysis_failed(request, exc, traceback, recording_id: int, user_id: int, slot: list = None):
+    """Errback of segmented analysis chord - called when any of the segments could not be analysed."""
+    if slot:
+        release_slot(*slot)
+    logger.error(f"Segmented analysis of recording {recording_id} failed: {exc}")
+    update_examination_status(
+        recording_id, user_id, Examination.Statuses.processing_failed,
+        f"Analysis of recording {recording_id} failed!"
+    )
 
 
 def call_mock():
     """Returns random, mocked data shaped like an actual response"""
 
-    # mocked frames used for probability plot
-    frames = [{"start": round(i / 1000, 2), "probability": random.random()} for i in range(0, 1000, 1)]
+    # mocked frames used for probability plot (NumPy arrays)
+    frames = mock_frames(1000)
     # shape of actual model response
     results = {"code": 200, "error": "", "frames": frames, "statistics": {"Main results": model_mock}}
     return results
+
+
+def call_batch_mock(count: int) -> list[dict]:
+    """Returns random, mocked data shaped like an actual response of batch endpoint (list of results)"""
+    return [call_mock() for _ in range(count)]
@@ -0,0 +1,148 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of batch analysis of recordings.
+"""
+import os
+import tempfile
+import wave
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from analysis.models import PendingAnalysis
+from analysis.scheduling import INTERACTIVE_QUEUE
+from analysis.tasks import (
+    add_to_batch, call_mock, flush_pending_analyses, mapper, plan_batches, process_recordings_batch
+)
+from examinations.models import Examination
+from recordings.lossless import compress_wav
+from recordings.models import Recording
+
+User = get_user_model()
+
+
+class TestBatchAnalysis(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email="batch@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        cls.recordings = []
+        for i in range(3):
+            recording = Recording.objects.create(
+                file=SimpleUploadedFile(f"batch{i}.wav", b"x" * 100 * (i + 1), content_type="audio/wav"),
+                name=f"batch{i}.wav"
+            )
+            Examination.objects.create(doctor=cls.doctor, date=timezone.now(), recording=recording)
+            cls.recordings.append(recording)
+
+    @override_settings(CELERY_BATCH_MAX_SIZE=2, CELERY_BATCH_MAX_BYTES=10 ** 6)
+    def test_plan_batches_by_size(self):
+        ids = [recording.id for recording in self.recordings]
+        self.assertEqual(plan_batches(self.recordings), [ids[:2], ids[2:]])
+
+    @override_settings(CELERY_BATCH_MAX_SIZE=10, CELERY_BATCH_MAX_BYTES=350)
+    def test_plan_batches_by_bytes(self):
+        # 100 + 200 bytes fit in the limit, 300 bytes start a new batch
+        ids = [recording.id for recording in self.recordings]
+        self.assertEqual(plan_batches(self.recordings), [ids[:2], ids[2:]])
+
+    def test_plan_batches_by_decoded_size(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'silence.wav')
+            with wave.open(path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(8000)
+                wav.writeframes(bytes(16000))
+            compressed_size = compress_wav(path, path + '.z')
+            with open(path + '.z', 'rb') as file:
+                recording = Recording.objects.create(file=File(file, name='silence.flac'), name='silence.wav')
+
+        # compressed recording is sent as WAV file, it does not fit in the batch with the first recording
+        ids = [self.recordings[0].id, recording.id]
+        with override_settings(CELERY_BATCH_MAX_SIZE=10, CELERY_BATCH_MAX_BYTES=100 + compressed_size):
+            self.assertEqual(plan_batches([self.recordings[0], recording]), [ids[:1], ids[1:]])
+
+    @override_settings(CELERY_BATCH_WINDOW=30, CELERY_BATCH_MAX_SIZE=2, CELERY_BATCH_MAX_BYTES=10 ** 6)
+    def test_batch_window(self):
+        ids = [recording.id for recording in self.recordings[:2]]
+        with mock.patch.object(flush_pending_analyses, 'apply_async') as apply_async:
+            # first recording schedules flush at the end of the window, full batch is flushed at once
+            add_to_batch(ids[0], self.doctor.id, INTERACTIVE_QUEUE)
+            apply_async.assert_called_once_with(
+                (self.doctor.id, INTERACTIVE_QUEUE), queue=INTERACTIVE_QUEUE, countdown=30
+            )
+            add_to_batch(ids[1], self.doctor.id, INTERACTIVE_QUEUE)
+            apply_async.assert_called_with((self.doctor.id, INTERACTIVE_QUEUE), queue=INTERACTIVE_QUEUE)
+
+        with mock.patch('analysis.tasks.enqueue') as enqueue:
+            flush_pending_analyses(self.doctor.id, INTERACTIVE_QUEUE)
+
+        enqueue.assert_called_once_with(process_recordings_batch, (ids, self.doctor.id), INTERACTIVE_QUEUE)
+        self.assertFalse(PendingAnalysis.objects.exists())
+
+    @override_settings(CELERY_USE_MOCK_MODEL=True)
+    def test_mocked_batch(self):
+        ids = [recording.id for recording in self.recordings]
+        result = process_recordings_batch.apply(args=(ids, self.doctor.id)).get()
+
+        self.assertEqual(result, {"recordings": {str(i): "SUCCESS" for i in ids}})
+        self.assertFalse(Recording.objects.filter(id__in=ids, probability_frames__isnull=True).exists())
+        self.assertEqual(
+            Examination.objects.filter(status=Examination.Statuses.processing_succeeded).count(), 3
+        )
+
+    @override_settings(CELERY_USE_MOCK_MODEL=True)
+    def test_failed_batch_fails_examinations(self):
+        ids = [recording.id for recording in self.recordings]
+        with mock.patch('analysis.tasks.save_analysis_results', side_effect=RuntimeError("unexpected")):
+            result = process_recordings_batch.apply(args=(ids, self.doctor.id))
+
+        self.assertTrue(result.failed())
+        self.assertEqual(
+            Examination.objects.filter(recording__id__in=ids, status=Examination.Statuses.processing_failed).count(), 3
+        )
+
+    @override_settings(CELERY_USE_MOCK_MODEL=False, CELERY_INFERENCE_CACHE=False)
+    def test_failed_item_does_not_fail_batch(self):
+        ok = call_mock()
+        ok["statistics"]["Main results"] = {key: 1 for key in mapper}
+        ok["statistics"]["Main results"]["Recording length, hours:minutes:seconds"] = "0:00:10"
+        client = mock.Mock()
+        client.batch_inference.return_value = [ok, {"code": 500, "error": "corrupted file"}]
+
+        ids = [recording.id for recording in self.recordings[:2]]
+        with mock.patch('analysis.tasks.get_model_client', return_value=client):
+            result = process_recordings_batch.apply(args=(ids, self.doctor.id)).get()
+
+        self.assertEqual(client.batch_inference.call_count, 1)
+        self.assertEqual(result, {"recordings": {str(ids[0]): "SUCCESS", str(ids[1]): "FAILURE"}})
+        self.assertEqual(
+            Examination.objects.get(recording__id=ids[1]).status, Examination.Statuses.processing_failed
+        )
@@ -0,0 +1,124 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of ML model results deduplication cache.
+"""
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from analysis.cache import cache_stats, evict, file_sha256, get_cached_result, store_result
+from analysis.models import InferenceResult
+from analysis.tasks import mapper, process_recording
+from examinations.models import Examination
+from recordings.models import Recording
+
+TEST_FILES_DIR = os.path.join(settings.BASE_DIR.parent, 'test_files')
+
+User = get_user_model()
+
+
+@override_settings(CELERY_USE_MOCK_MODEL=False, CELERY_INFERENCE_CACHE=True, CELERY_MODEL_VERSION='1')
+class TestInferenceCache(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email="cache@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        cls.recording = Recording.objects.create(
+            file=SimpleUploadedFile("cached.wav", b"file_content", content_type="audio/wav"), name="cached.wav"
+        )
+        Examination.objects.create(doctor=cls.doctor, date=timezone.now(), recording=cls.recording)
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(TEST_FILES_DIR):
+            shutil.rmtree(TEST_FILES_DIR)
+        super().tearDownClass()
+
+    def test_file_sha256(self):
+        Path(TEST_FILES_DIR).mkdir(parents=True, exist_ok=True)
+        path = os.path.join(TEST_FILES_DIR, 'hash.wav')
+        with open(path, 'wb') as fp:
+            fp.write(b'abc')
+        self.assertEqual(file_sha256(path), 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad')
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(get_cached_result('a' * 64))
+        store_result('a' * 64, {"bowell_sounds_number": 3, "length": timedelta(minutes=2)})
+
+        result = get_cached_result('a' * 64)
+        self.assertEqual(result, {"bowell_sounds_number": 3, "length": timedelta(minutes=2)})
+        self.assertEqual(InferenceResult.objects.get().hits, 1)
+        self.assertEqual(cache_stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5, "entries": 1})
+        # counters are not entries of Django cache, they are not culled
+        cache.clear()
+        self.assertEqual(cache_stats()["hits"], 1)
+
+    def test_model_version_is_part_of_key(self):
+        store_result('a' * 64, {"bowell_sounds_number": 3})
+        with override_settings(CELERY_MODEL_VERSION='2'):
+            self.assertIsNone(get_cached_result('a' * 64))
+
+    @override_settings(CELERY_INFERENCE_CACHE_MAX_ENTRIES=2, CELERY_INFERENCE_CACHE_TTL=30)
+    def test_eviction(self):
+        for i in range(3):
+            store_result(str(i) * 64, {"bowell_sounds_number": i})
+        # least recently used entry is removed
+        self.assertFalse(InferenceResult.objects.filter(audio_hash='0' * 64).exists())
+
+        InferenceResult.objects.filter(audio_hash='1' * 64).update(last_used_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(evict(), 1)
+        self.assertEqual(InferenceResult.objects.count(), 1)
+
+    def test_process_recording_uses_cached_result(self):
+        client = mock.Mock()
+        client.inference.return_value = {
+            "frames": [{"start": 0.0, "probability": 0.5}],
+            "statistics": {"Main results": {key: 1 for key in mapper if key != "Recording length, hours:minutes:seconds"}
+                           | {"Recording length, hours:minutes:seconds": "0:01:00"}}
+        }
+        args = (self.recording.id, self.recording.file.path, self.doctor.id)
+
+        with mock.patch('analysis.tasks.get_model_client', return_value=client):
+            first = process_recording.apply(args=args).get()
+            Recording.objects.filter(id=self.recording.id).update(bowell_sounds_number=None, probability_frames=None)
+            second = process_recording.apply(args=args).get()
+
+        self.assertEqual(client.inference.call_count, 1)
+        self.assertEqual(first["bowell_sounds_number"], 1)
+        self.assertEqual(second["bowell_sounds_number"], 1)
+        self.assertEqual(second["probability_plot"], [{"start": 0.0, "probability": 0.5}])
+        self.assertEqual(cache_stats()["hits"], 1)
@@ -0,0 +1,171 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of pooled ML model API client.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from analysis.client import ModelClient, ModelClientError, iter_multipart
+
+TEST_FILES_DIR = os.path.join(settings.BASE_DIR.parent, 'test_files')
+
+
+class ModelHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler which responds with statuses queued in server.statuses (200 when empty)."""
+    protocol_version = 'HTTP/1.1'
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers['Content-Length']))
+        body = b''
+        while size := int(self.rfile.readline().strip(), 16):
+            body += self.rfile.read(size)
+            self.rfile.readline()
+        self.rfile.readline()
+        return body
+
+    def do_POST(self):
+        self.server.requests.append((dict(self.headers), self._read_body()))
+        time.sleep(self.server.delay)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        result = {"frames": [], "statistics": {"Main results": {}}}
+        if self.path == '/batch_inference':
+            result = {"results": [result] * self.server.requests[-1][1].count(b'name="files"')}
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestModelClient(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ModelHandler)
+        cls.server.statuses = []
+        cls.server.requests = []
+        cls.server.delay = 0
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+
+        Path(TEST_FILES_DIR).mkdir(parents=True, exist_ok=True)
+        cls.file_path = os.path.join(TEST_FILES_DIR, 'client.wav')
+        with open(cls.file_path, 'wb') as fp:
+            fp.write(b'RIFF' + bytes(range(256)) * 64)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        if os.path.exists(TEST_FILES_DIR):
+            shutil.rmtree(TEST_FILES_DIR)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.statuses = []
+        self.server.requests = []
+        self.server.delay = 0
+
+    def test_connection_is_reused(self):
+        client = ModelClient(self.url, backoff_factor=0)
+        for _ in range(3):
+            self.assertIn("frames", client.inference(self.file_path))
+
+        stats = client.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["connections_reused"], 2)
+        client.close()
+
+    def test_retries_unavailable_model(self):
+        self.server.statuses = [503, 502]
+        client = ModelClient(self.url, max_retries=2, backoff_factor=0)
+        self.assertIn("frames", client.inference(self.file_path))
+        self.assertEqual(client.stats()["retries"], 2)
+        client.close()
+
+    def test_raises_after_retries_exhausted(self):
+        self.server.statuses = [503, 503]
+        client = ModelClient(self.url, max_retries=1, backoff_factor=0)
+        with self.assertRaises(ModelClientError):
+            client.inference(self.file_path)
+        self.assertEqual(client.stats()["failures"], 2)
+        client.close()
+
+    def test_connection_error(self):
+        client = ModelClient("http://127.0.0.1:1", connect_timeout=0.5, max_retries=1, backoff_factor=0)
+        with self.assertRaises(ModelClientError):
+            client.inference(self.file_path)
+        self.assertEqual(client.stats()["retries"], 1)
+
+    def test_read_timeout_is_not_retried(self):
+        # the model received the recording, repeating the request would analyse it again
+        self.server.delay = 0.5
+        client = ModelClient(self.url, read_timeout=0.1, max_retries=2, backoff_factor=0)
+        with self.assertRaises(ModelClientError):
+            client.inference(self.file_path)
+        self.assertEqual(client.stats()["retries"], 0)
+        self.assertEqual(len(self.server.requests), 1)
+        client.close()
+
+    def test_file_is_streamed_in_chunks(self):
+        client = ModelClient(self.url, chunk_size=1000)
+        client.inference(self.file_path)
+        client.close()
+
+        headers, body = self.server.requests[0]
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        self.assertTrue(headers['Content-Type'].startswith('multipart/form-data; boundary='))
+        with open(self.file_path, 'rb') as fp:
+            self.assertIn(fp.read(), body)
+
+    def test_iter_multipart(self):
+        parts = list(iter_multipart(self.file_path, boundary='xyz', chunk_size=4096))
+        # preamble, 5 chunks of file (4 + 16384 bytes), end of part, closing boundary
+        self.assertEqual(len(parts), 8)
+        self.assertIn(b'name="file"; filename="client.wav"', parts[0])
+        self.assertEqual(parts[-2:], [b'\r\n', b'--xyz--\r\n'])
+        self.assertTrue(all(len(part) <= 4096 for part in parts[1:-2]))
+
+    def test_batch_inference(self):
+        client = ModelClient(self.url)
+        results = client.batch_inference([self.file_path, self.file_path])
+        client.close()
+
+        self.assertEqual(len(results), 2)
+        _, body = self.server.requests[0]
+        self.assertEqual(body.count(b'name="files"; filename="client.wav"'), 2)
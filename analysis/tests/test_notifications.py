@@ -0,0 +1,152 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of websocket notifier used by Celery workers.
+"""
+import asyncio
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from analysis.consumers import DashboardConsumer
+from analysis.notifications import BATCH_TYPE, WebsocketNotifier
+
+
+class FakeChannelLayer:
+    def __init__(self, fail_group: str = None):
+        self.sent = []
+        self.sends = 0
+        self.running = 0
+        self.max_running = 0
+        self.loops = set()
+        self.threads = set()
+        self.fail_group = fail_group
+
+    async def group_send(self, group, message):
+        self.loops.add(asyncio.get_running_loop())
+        self.threads.add(threading.current_thread().name)
+        self.sends += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if group == self.fail_group:
+            raise ConnectionError("redis unavailable")
+        messages = message["messages"] if message["type"] == BATCH_TYPE else [message]
+        self.sent.extend((group, message.get("message")) for message in messages)
+
+
+class TestWebsocketNotifier(SimpleTestCase):
+    def _notifier(self, layer) -> WebsocketNotifier:
+        with mock.patch('analysis.notifications.get_channel_layer', return_value=layer):
+            return WebsocketNotifier()
+
+    def test_messages_are_sent_from_one_loop(self):
+        layer = FakeChannelLayer()
+        notifier = self._notifier(layer)
+        for i in range(5):
+            notifier.send("user-1", {"type": "notify", "message": i})
+            notifier.send("user-2", {"type": "notify", "message": i})
+        notifier.flush()
+
+        self.assertEqual([m for g, m in layer.sent if g == "user-1"], [0, 1, 2, 3, 4])
+        self.assertEqual([m for g, m in layer.sent if g == "user-2"], [0, 1, 2, 3, 4])
+        self.assertEqual(len(layer.loops), 1)
+        self.assertEqual(layer.threads, {"websocket-notifier"})
+        # messages queued while the first one was being sent are sent in one batch
+        self.assertLess(notifier.stats()["batches"], 10)
+        self.assertEqual(notifier.stats()["messages"], 10)
+        notifier.close()
+
+    def test_one_send_per_group(self):
+        layer = FakeChannelLayer()
+        notifier = self._notifier(layer)
+        # messages are queued while the loop is blocked, so they are sent in one batch
+        blocked = threading.Event()
+        notifier.loop.call_soon_threadsafe(blocked.wait, 5)
+        for i in range(3):
+            for group_name in ("user-1", "user-2", "user-3"):
+                notifier.send(group_name, {"type": "notify", "message": i})
+        blocked.set()
+        notifier.close()
+
+        self.assertEqual(notifier.stats()["batches"], 1)
+        # messages to one group are sent as one message, sends to different groups overlap
+        self.assertEqual(layer.sends, 3)
+        self.assertEqual(layer.max_running, 3)
+        for group_name in ("user-1", "user-2", "user-3"):
+            self.assertEqual([m for g, m in layer.sent if g == group_name], [0, 1, 2])
+
+    def test_batch_is_unpacked_by_consumer(self):
+        consumer = DashboardConsumer()
+        consumer.send_json = mock.AsyncMock()
+        asyncio.run(consumer.batch({"type": BATCH_TYPE, "messages": [
+            {"type": "notify", "message": "started"},
+            {"type": "progress", "payload": {"recording_id": 1, "percent": 50}},
+        ]}))
+        sent = [call.args[0] for call in consumer.send_json.call_args_list]
+        self.assertEqual([(m["type"], m.get("message")) for m in sent], [("notify", "started"), ("progress", None)])
+        self.assertEqual(sent[1]["payload"]["percent"], 50)
+
+    def test_send_does_not_block(self):
+        layer = FakeChannelLayer()
+        notifier = self._notifier(layer)
+        notifier.send("user-1", {"type": "notify", "message": "hello"})
+        # group_send sleeps, message cannot be sent yet
+        self.assertEqual(layer.sent, [])
+        notifier.close()
+        self.assertEqual(layer.sent, [("user-1", "hello")])
+
+    def test_progress_is_coalesced(self):
+        progress = [
+            ("user-1", {"type": "progress", "payload": {"recording_id": recording_id, "percent": percent}})
+            for percent in (10, 20, 30) for recording_id in (1, 2)
+        ]
+        batch = [("user-1", {"type": "notify", "message": "started"}), *progress,
+                 ("user-1", {"type": "notify", "message": "done"})]
+        # only the latest progress of each recording is kept, at its place in the order
+        self.assertEqual(WebsocketNotifier._coalesce(batch), [batch[0], progress[-2], progress[-1], batch[-1]])
+
+        layer = FakeChannelLayer()
+        notifier = self._notifier(layer)
+        for group_name, message in batch:
+            notifier.send(group_name, message)
+        notifier.close()
+        self.assertEqual(layer.sent[-1], ("user-1", "done"))
+        self.assertEqual(len(layer.sent) + notifier.stats()["coalesced"], len(batch))
+
+    def test_failures_are_counted(self):
+        layer = FakeChannelLayer(fail_group="user-1")
+        notifier = self._notifier(layer)
+        notifier.send("user-1", {"type": "notify", "message": "lost"})
+        notifier.send("user-2", {"type": "notify", "message": "delivered"})
+        notifier.close()
+        self.assertEqual(layer.sent, [("user-2", "delivered")])
+        self.assertEqual(notifier.stats()["failures"], 1)
+
+    def test_without_channel_layer(self):
+        notifier = self._notifier(None)
+        notifier.send("user-1", {"type": "notify", "message": "dropped"})
+        notifier.close()
+        self.assertEqual(notifier.stats()["messages"], 0)
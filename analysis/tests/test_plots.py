@@ -0,0 +1,75 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of rendering and content-addressed storage of statistics plots.
+"""
+import numpy as np
+from django.test import TestCase
+
+from analysis.frames import Frames
+from analysis.plots import minute_series, render_plots
+from analysis.tasks import save_analysis_results
+from recordings.models import PlotImage, Recording, RecordingPlot
+
+
+def make_frames(minutes: int, sounds_per_minute: int) -> Frames:
+    """10 ms frames with sounds_per_minute sounds of 100 ms at the beginning of every minute"""
+    starts = np.arange(minutes * 6000) / 100
+    probabilities = np.zeros(len(starts))
+    for minute in range(minutes):
+        for sound in range(sounds_per_minute):
+            first = minute * 6000 + sound * 100
+            probabilities[first:first + 10] = 1
+    return Frames(starts, probabilities)
+
+
+class TestPlots(TestCase):
+    def test_minute_series(self):
+        series = minute_series(make_frames(3, 4), 0.5)
+        self.assertEqual(series.sounds_per_minute.tolist(), [4, 4, 4])
+        np.testing.assert_allclose(series.sound_duration, [0.1, 0.1, 0.1])
+        np.testing.assert_allclose(series.sound_index, [100 * 0.4 / 60] * 3)
+        self.assertEqual(len(series.durations), 12)
+
+    def test_render_plots(self):
+        plots = render_plots(make_frames(3, 4), 0.5)
+        self.assertEqual(set(plots), set(RecordingPlot.Kinds.values))
+        self.assertTrue(all(plot.startswith(b"<svg") for plot in plots.values()))
+        # rendering is reproducible, so equal plots have equal digests
+        self.assertEqual(plots, render_plots(make_frames(3, 4), 0.5))
+        # empty recording
+        self.assertEqual(len(render_plots(Frames.empty(), 0.5)), 8)
+
+    def test_plots_stored_once(self):
+        recordings = [Recording.objects.create(name=f"{i}.wav") for i in range(2)]
+        for recording in recordings:
+            save_analysis_results(recording.id, {"probability_frames": make_frames(3, 4)})
+        self.assertEqual(RecordingPlot.objects.count(), 16)
+        self.assertEqual(PlotImage.objects.count(), 8)
+
+        # images of previous analysis are deleted when no plot uses them
+        for recording in recordings:
+            save_analysis_results(recording.id, {"probability_frames": make_frames(3, 5)})
+        self.assertEqual(RecordingPlot.objects.count(), 16)
+        self.assertEqual(PlotImage.objects.count(), 8)
+        self.assertFalse(PlotImage.objects.filter(plots__isnull=True).exists())
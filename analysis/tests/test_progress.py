@@ -0,0 +1,110 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of progress reporting of running analyses.
+"""
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from analysis.progress import PROGRESS, ProgressReporter, Stages
+from analysis.tasks import mapper, process_recording
+from examinations.models import Examination
+from recordings.models import Recording
+
+User = get_user_model()
+
+
+@override_settings(CELERY_PROGRESS_INTERVAL=60)
+class TestProgress(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email="progress@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        cls.recording = Recording.objects.create(
+            file=SimpleUploadedFile("progress.wav", b"file_content", content_type="audio/wav"), name="progress.wav"
+        )
+        Examination.objects.create(doctor=cls.doctor, date=timezone.now(), recording=cls.recording)
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('analysis.progress.get_notifier')
+        self.notifier = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def _reports(self) -> list[dict]:
+        return [call.args[1]["payload"] for call in self.notifier.send.call_args_list]
+
+    def test_report(self):
+        reporter = ProgressReporter("task-id", self.recording.id, self.doctor.id, started_at=100.0)
+        with mock.patch('analysis.progress.app.backend.store_result') as store_result, \
+                mock.patch('analysis.progress.time.time', return_value=120.0):
+            reporter.report(Stages.inference, 0.5)
+
+        meta = {"recording_id": self.recording.id, "stage": "inference", "percent": 65.0, "elapsed": 20.0, "eta": 10.8}
+        store_result.assert_called_once_with("task-id", meta, PROGRESS)
+        self.notifier.send.assert_called_once_with(f"user-{self.doctor.id}", {"type": "progress", "payload": meta})
+
+    def test_reports_are_throttled_within_stage(self):
+        reporter = ProgressReporter("task-id", self.recording.id, self.doctor.id, store=False)
+        callback = reporter.upload_callback()
+        for sent in range(0, 100, 10):
+            callback(sent, 100)
+        # end of upload starts inference stage
+        callback(100, 100)
+        reporter.report(Stages.persistence)
+
+        self.assertEqual([(r["stage"], r["percent"]) for r in self._reports()], [
+            ("upload", 0.0), ("inference", 40.0), ("persistence", 90.0)
+        ])
+
+    def test_segments(self):
+        reporter = ProgressReporter("task-id", self.recording.id, self.doctor.id, store=False)
+        reporter.start_segments()
+        for _ in range(2):
+            ProgressReporter(**reporter.as_dict()).segment_finished(4)
+
+        self.assertEqual([(r["percent"], r["segments_done"]) for r in self._reports()], [(52.5, 1), (65.0, 2)])
+
+    @override_settings(CELERY_USE_MOCK_MODEL=False)
+    def test_process_recording_stages(self):
+        def inference(file_path, progress=None):
+            progress(6, 12)
+            progress(12, 12)
+            return {
+                "frames": [],
+                "statistics": {"Main results": {key: 1 for key in mapper}
+                               | {"Recording length, hours:minutes:seconds": "0:01:00"}}
+            }
+
+        client = mock.Mock()
+        client.inference.side_effect = inference
+        with mock.patch('analysis.tasks.get_model_client', return_value=client):
+            process_recording.apply(args=(self.recording.id, self.recording.file.path, self.doctor.id)).get()
+
+        self.assertEqual([r["stage"] for r in self._reports()], ["upload", "inference", "persistence"])
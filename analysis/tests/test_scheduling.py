@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of priority queues and per-user fair scheduling of analysis tasks.
+"""
+import time
+from unittest import mock
+
+from celery.app.task import Context
+from celery.exceptions import Retry
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from analysis.scheduling import (
+    ADMIN_QUEUE, BULK_QUEUE, ENQUEUED_AT_HEADER, INTERACTIVE_QUEUE, QUEUE_HEADER, acquire_slot, enqueue, queue_stats,
+    _release_task_slot, hand_over_slot, release_slot, start_task
+)
+from analysis.tasks import process_recordings_batch
+from examinations.models import Examination
+from recordings.models import Recording
+
+User = get_user_model()
+
+
+@override_settings(CELERY_MAX_TASKS_PER_USER=2, CELERY_USE_MOCK_MODEL=True)
+class TestScheduling(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email="scheduling@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        cls.recording = Recording.objects.create(
+            file=SimpleUploadedFile("scheduling.wav", b"x" * 100, content_type="audio/wav"), name="scheduling.wav"
+        )
+        Examination.objects.create(doctor=cls.doctor, date=timezone.now(), recording=cls.recording)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_enqueue(self):
+        with mock.patch.object(process_recordings_batch, 'apply_async') as apply_async:
+            enqueue(process_recordings_batch, ([1, 2], self.doctor.id), BULK_QUEUE)
+        args, options = apply_async.call_args
+        self.assertEqual(args[0], ([1, 2], self.doctor.id))
+        self.assertEqual(options["queue"], BULK_QUEUE)
+        self.assertEqual(options["headers"][QUEUE_HEADER], BULK_QUEUE)
+        self.assertAlmostEqual(options["headers"][ENQUEUED_AT_HEADER], time.time(), delta=5)
+
+    def test_slots(self):
+        first = acquire_slot(self.doctor.id, "task-1")
+        second = acquire_slot(self.doctor.id, "task-2")
+        self.assertNotEqual(first, second)
+        self.assertIsNone(acquire_slot(self.doctor.id, "task-3"))
+        # retried task keeps its slot, other users are not affected
+        self.assertEqual(acquire_slot(self.doctor.id, "task-1"), first)
+        self.assertIsNotNone(acquire_slot(self.doctor.id + 1, "task-4"))
+
+        release_slot(first, "task-3")  # slot of another task is not released
+        self.assertIsNone(acquire_slot(self.doctor.id, "task-3"))
+        release_slot(first, "task-1")
+        self.assertEqual(acquire_slot(self.doctor.id, "task-3"), first)
+
+    def _task(self, queue: str):
+        task = mock.Mock()
+        task.request = Context(id="task-id", headers={QUEUE_HEADER: queue, ENQUEUED_AT_HEADER: time.time() - 2})
+        task.retry.return_value = Retry()
+        return task
+
+    def test_start_task_without_free_slot(self):
+        acquire_slot(self.doctor.id, "task-1")
+        acquire_slot(self.doctor.id, "task-2")
+
+        for queue in (BULK_QUEUE, ADMIN_QUEUE):
+            task = self._task(queue)
+            with self.assertRaises(Retry):
+                start_task(task, self.doctor.id)
+            # original enqueue time is kept, so wait time includes postponements
+            self.assertEqual(task.retry.call_args.kwargs["headers"], task.request.headers)
+
+        # interactive analyses are not limited
+        start_task(self._task(INTERACTIVE_QUEUE), self.doctor.id)
+        self.assertEqual(queue_stats()[INTERACTIVE_QUEUE]["started"], 1)
+        self.assertEqual(queue_stats()[BULK_QUEUE]["started"], 0)
+
+    def test_hand_over_slot(self):
+        task = self._task(BULK_QUEUE)
+        start_task(task, self.doctor.id)
+        slot = hand_over_slot(task)
+        self.assertEqual(slot[1], "task-id")
+        self.assertIsNone(task.request.analysis_slot)
+
+        # handed over slot is not freed when the task returns
+        _release_task_slot(task_id="task-id", task=task)
+        acquire_slot(self.doctor.id, "task-1")
+        self.assertIsNone(acquire_slot(self.doctor.id, "task-2"))
+        release_slot(*slot)
+        self.assertIsNotNone(acquire_slot(self.doctor.id, "task-2"))
+
+    def test_batch_task_in_bulk_queue(self):
+        headers = {QUEUE_HEADER: BULK_QUEUE, ENQUEUED_AT_HEADER: time.time() - 2}
+        with mock.patch('analysis.scheduling.app.connection_for_read', side_effect=ConnectionError):
+            process_recordings_batch.apply(args=([self.recording.id], self.doctor.id), headers=headers).get()
+            stats = queue_stats()
+
+        self.assertEqual(stats[BULK_QUEUE]["started"], 1)
+        self.assertGreaterEqual(stats[BULK_QUEUE]["mean_wait"], 2)
+        self.assertIsNone(stats[BULK_QUEUE]["depth"])
+        # slot is released after the task
+        self.assertIsNotNone(acquire_slot(self.doctor.id, "task-1"))
+        self.assertIsNotNone(acquire_slot(self.doctor.id, "task-2"))
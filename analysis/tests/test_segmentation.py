@@ -0,0 +1,186 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of segmented analysis of long recordings.
+"""
+import os
+import shutil
+import wave
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files import File
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.utils import timezone
+
+from analysis.frames import Frames, frames_from_list, frames_to_list, mock_frames
+from analysis.scheduling import BULK_QUEUE, QUEUE_HEADER, acquire_slot
+from analysis.segmentation import (
+    compute_statistics, detect_sounds, get_duration, merge_frames, plan_segments, write_segment
+)
+from analysis.tasks import process_recording, save_analysis_results
+from examinations.models import Examination
+from recordings.models import Recording
+
+TEST_FILES_DIR = os.path.join(settings.BASE_DIR.parent, 'test_files')
+
+User = get_user_model()
+
+
+def write_wav(path: str, seconds: int, frame_rate: int = 1000):
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(b'\x01\x00' * frame_rate * seconds)
+
+
+class TestSegmentation(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        Path(TEST_FILES_DIR).mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(TEST_FILES_DIR):
+            shutil.rmtree(TEST_FILES_DIR)
+        super().tearDownClass()
+
+    def test_plan_segments(self):
+        self.assertEqual(plan_segments(5, 10, 2), [(0.0, 5)])
+        self.assertEqual(plan_segments(25, 10, 2), [(0, 10), (8, 18), (16, 25)])
+        self.assertEqual(plan_segments(26, 10, 2), [(0, 10), (8, 18), (16, 26)])
+
+    def test_write_segment(self):
+        source = os.path.join(TEST_FILES_DIR, 'source.wav')
+        target = os.path.join(TEST_FILES_DIR, 'target.wav')
+        write_wav(source, 20)
+        write_segment(source, 8, 18, target)
+        self.assertEqual(get_duration(target), 10)
+
+    def test_merge_frames_splits_overlap(self):
+        frames = [{"start": i / 2, "probability": 0.1} for i in range(20)]
+        merged = merge_frames([
+            {"start": 8, "end": 18, "frames": frames},
+            {"start": 0, "end": 10, "frames": frames},
+        ])
+        self.assertIsInstance(merged, Frames)
+        # first segment owns frames up to the middle of overlap (9 s), second the rest
+        self.assertEqual(merged.starts.tolist(), [i / 2 for i in range(36)])
+        self.assertEqual(merge_frames([]).starts.size, 0)
+
+    def test_compute_statistics(self):
+        probabilities = [0, 1, 1, 0, 1, 0, 0, 0, 0, 1]
+        frames = frames_from_list([{"start": i * 0.05, "probability": p} for i, p in enumerate(probabilities)])
+        starts, ends = detect_sounds(frames, 0.5)
+        self.assertEqual(list(zip(starts.tolist(), ends.tolist())), [(0.05, 0.15), (0.2, 0.25), (0.45, 0.5)])
+
+        stats = compute_statistics(frames, 120, 0.5)
+        self.assertEqual(stats["bowell_sounds_number"], 3)
+        self.assertEqual(stats["maximum_per_minute"], 3)
+        self.assertEqual(stats["minimum_per_minute"], 0)
+        self.assertAlmostEqual(stats["mean_per_minute"], 1.5)
+        self.assertAlmostEqual(stats["repetition_within_100ms"], 100 / 3)
+        self.assertAlmostEqual(stats["repetition_within_200ms"], 200 / 3)
+
+    def test_frames_conversion(self):
+        frames = [{"start": 0.0, "probability": 0.25}, {"start": 0.01, "probability": 0.75}]
+        self.assertEqual(frames_to_list(frames_from_list(frames)), frames)
+        self.assertIs(frames_to_list(frames), frames)
+
+        mocked = frames_to_list(mock_frames(1000))
+        self.assertEqual(len(mocked), 1000)
+        self.assertEqual(mocked[-1]["start"], 9.99)
+        self.assertTrue(all(0 <= frame["probability"] < 1 for frame in mocked))
+
+
+@override_settings(
+    CELERY_USE_MOCK_MODEL=False, CELERY_SEGMENTED_ANALYSIS=True, CELERY_SEGMENT_LENGTH=10, CELERY_SEGMENT_OVERLAP=2
+)
+class TestSegmentedAnalysis(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Path(TEST_FILES_DIR).mkdir(parents=True, exist_ok=True)
+        path = os.path.join(TEST_FILES_DIR, 'long.wav')
+        write_wav(path, 25)
+
+        cls.doctor = User.objects.create_user(
+            email="segments@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        with open(path, 'rb') as fp:
+            cls.recording = Recording.objects.create(file=File(fp, name='long.wav'), name='long.wav')
+        cls.examination = Examination.objects.create(
+            doctor=cls.doctor, date=timezone.now(), recording=cls.recording
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(TEST_FILES_DIR):
+            shutil.rmtree(TEST_FILES_DIR)
+        super().tearDownClass()
+
+    def test_segments_are_merged(self):
+        client = mock.Mock()
+        client.inference.side_effect = lambda path: {
+            "frames": [{"start": i / 2, "probability": 0.9 if i % 4 == 0 else 0.1}
+                       for i in range(int(get_duration(path) * 2))]
+        }
+
+        with mock.patch('analysis.tasks.get_model_client', return_value=client):
+            process_recording.apply(args=(self.recording.id, self.recording.file.path, self.doctor.id)).get()
+
+        self.assertEqual(client.inference.call_count, 3)
+        recording = Recording.objects.get(id=self.recording.id)
+        self.assertEqual(len(recording.probability_frames), 50)
+        self.assertEqual(recording.probability_frames.to_list()[-1]["start"], 24.5)
+        self.assertEqual(recording.length.total_seconds(), 25)
+        self.assertIsNotNone(recording.bowell_sounds_number)
+        self.examination.refresh_from_db()
+        self.assertEqual(self.examination.status, Examination.Statuses.processing_succeeded)
+
+    @override_settings(CELERY_MAX_TASKS_PER_USER=1)
+    def test_slot_is_held_until_segments_are_merged(self):
+        cache.clear()
+        client = mock.Mock()
+        client.inference.side_effect = lambda path: {
+            "frames": [{"start": i / 2, "probability": 0.1} for i in range(int(get_duration(path) * 2))]
+        }
+        slot_taken = []
+
+        def save(recording_id, data):
+            slot_taken.append(acquire_slot(self.doctor.id, "other-task") is None)
+            save_analysis_results(recording_id, data)
+
+        with mock.patch('analysis.tasks.get_model_client', return_value=client), \
+                mock.patch('analysis.tasks.save_analysis_results', side_effect=save):
+            process_recording.apply(
+                args=(self.recording.id, self.recording.file.path, self.doctor.id), headers={QUEUE_HEADER: BULK_QUEUE}
+            ).get()
+
+        self.assertEqual(slot_taken, [True])
+        # merge_segments frees the slot at the end
+        self.assertIsNotNone(acquire_slot(self.doctor.id, "other-task"))
@@ -0,0 +1,117 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of ML model stand-in server and round trips counting.
+"""
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from analysis.client import ModelClient, ModelClientError
+from analysis.roundtrips import RoundTripCounter, get_round_trips
+from analysis.standin import make_server
+from analysis.tasks import map_model_response, process_recording
+from examinations.models import Examination
+from recordings.models import Recording
+
+TEST_FILES_DIR = os.path.join(settings.BASE_DIR.parent, 'test_files')
+
+User = get_user_model()
+
+
+class TestStandInServer(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = make_server(port=0, latency=0.01, jitter=0.01, frames=5)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.model_client = ModelClient(f"http://127.0.0.1:{cls.server.server_port}", max_retries=0, chunk_size=1000)
+
+        Path(TEST_FILES_DIR).mkdir(parents=True, exist_ok=True)
+        cls.file_path = os.path.join(TEST_FILES_DIR, 'standin.wav')
+        with open(cls.file_path, 'wb') as fp:
+            fp.write(b'RIFF' + bytes(range(256)) * 64)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.model_client.close()
+        cls.server.shutdown()
+        cls.server.server_close()
+        if os.path.exists(TEST_FILES_DIR):
+            shutil.rmtree(TEST_FILES_DIR)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.error_rate = 0.0
+
+    def test_inference(self):
+        data = map_model_response(self.model_client.inference(self.file_path))
+        self.assertEqual(len(data["probability_frames"]), 5)
+        self.assertEqual(data["length"].total_seconds(), 0)
+
+    def test_batch_inference(self):
+        results = self.model_client.batch_inference([self.file_path] * 3)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(len(result["frames"]) == 5 for result in results))
+
+    def test_error_rate(self):
+        self.server.error_rate = 1.0
+        with self.assertRaises(ModelClientError):
+            self.model_client.inference(self.file_path)
+
+
+class TestRoundTrips(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email="roundtrips@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        cls.recording = Recording.objects.create(
+            file=SimpleUploadedFile("roundtrips.wav", b"file_content", content_type="audio/wav"), name="roundtrips.wav"
+        )
+        Examination.objects.create(doctor=cls.doctor, date=timezone.now(), recording=cls.recording)
+
+    def test_counter(self):
+        counter = RoundTripCounter()
+        counter.start()
+        list(Recording.objects.all())
+        Examination.objects.count()
+        counter.stop()
+        list(Recording.objects.all())
+        self.assertEqual(counter.as_dict(), {"db": 2, "redis": 0})
+
+    @override_settings(CELERY_COUNT_ROUND_TRIPS=True, CELERY_USE_MOCK_MODEL=True)
+    def test_task_round_trips(self):
+        task = process_recording.apply(args=(self.recording.id, self.recording.file.path, self.doctor.id))
+        self.assertGreater(get_round_trips(task.id)["db"], 0)
+
+    def test_not_counted_by_default(self):
+        task = process_recording.apply(args=(self.recording.id, self.recording.file.path, self.doctor.id))
+        self.assertIsNone(get_round_trips(task.id))
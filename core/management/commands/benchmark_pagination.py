@@ -0,0 +1,123 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which compares latency of the first and a deep page of /api/examinations/
+with keyset pagination (KeysetPagination, with and without total count) and with offset pagination
+(LimitOffsetPagination used before). Examinations of a benchmark doctor are seeded in a transaction
+which is rolled back at the end (unless --keep is given).
+
+usage: python manage.py benchmark_pagination [--pages 10000] [--page-size 20] [--repeat 5]
+"""
+import statistics
+import time
+from datetime import timedelta
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.pagination import Cursor, LimitOffsetPagination
+from rest_framework.test import APIClient
+
+from core.pagination import KeysetPagination
+from examinations.models import Examination
+from examinations.views import ExaminationViewSet
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+URL = '/api/examinations/'
+
+
+class Command(BaseCommand):
+    """Django command which measures latency of first and deep pages of examinations"""
+    help = "Compares latency of first and deep page of examinations with keyset and offset pagination"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10000, help="Number of the deep page")
+        parser.add_argument('--page-size', type=int, default=20, help="Number of examinations in a page")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of requests of every page")
+        parser.add_argument('--keep', action='store_true', help="Keep seeded examinations")
+
+    def _seed(self, doctor, rows: int):
+        start = timezone.now() + timedelta(days=1)
+        for first in range(0, rows, 10000):
+            Examination.objects.bulk_create(
+                Examination(doctor=doctor, date=start + timedelta(minutes=i))
+                for i in range(first, min(rows, first + 10000))
+            )
+
+    def _latency(self, client: APIClient, url: str, repeat: int) -> float:
+        """Median latency of GET request in milliseconds"""
+        latencies = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+        return statistics.median(latencies)
+
+    def _deep_cursor_url(self, doctor, page: int, page_size: int, query: str) -> str:
+        """URL of the page with given number - cursor positioned after the last examination of the previous page"""
+        ordering = ExaminationViewSet.pagination_ordering
+        ordering = (ordering,) if isinstance(ordering, str) else ordering
+        previous = Examination.objects.filter(doctor=doctor).order_by(*ordering)[(page - 1) * page_size - 1]
+        paginator = KeysetPagination()
+        paginator.base_url = f'http://testserver{URL}?{query}'
+        paginator.page_size = page_size
+        url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(getattr(previous, ordering[0].lstrip('-')))))
+        parts = urlsplit(url)
+        return f'{parts.path}?{parts.query}'
+
+    def handle(self, *args, **options):
+        pages, page_size, repeat = options['pages'], options['page_size'], options['repeat']
+        # requests are handled in this process by the test client
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            doctor = User.objects.create_user(email="benchmark-pagination@bowell.local", password=None,
+                                              first_name="", last_name="", type=User.Types.DOCTOR)
+            started = time.perf_counter()
+            self._seed(doctor, pages * page_size)
+            self.stdout.write(f"Seeded {pages * page_size} examinations in {time.perf_counter() - started:.1f} s")
+
+            client = APIClient()
+            access, refresh = get_tokens_for_user(user=doctor)
+            client.cookies.load({'access': access, 'refresh': refresh})
+
+            self.stdout.write(f"{'pagination':<24}{'page 1':>12}{f'page {pages}':>16}")
+            variants = (('keyset', f'limit={page_size}'), ('keyset without count', f'limit={page_size}&count=false'))
+            for name, query in variants:
+                first = self._latency(client, f'{URL}?{query}', repeat)
+                deep = self._latency(client, self._deep_cursor_url(doctor, pages, page_size, query), repeat)
+                self.stdout.write(f"{name:<24}{first:>9.1f} ms{deep:>13.1f} ms")
+
+            with patch.object(ExaminationViewSet, 'pagination_class', LimitOffsetPagination):
+                first = self._latency(client, f'{URL}?limit={page_size}&offset=0', repeat)
+                deep = self._latency(client, f'{URL}?limit={page_size}&offset={(pages - 1) * page_size}', repeat)
+            self.stdout.write(f"{'offset':<24}{first:>9.1f} ms{deep:>13.1f} ms")
+
+            if not options['keep']:
+                transaction.set_rollback(True)
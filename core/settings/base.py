@@ -239,6 +239,105 @@ SWAGGER_SETTINGS = {
     }
 }
 
+# ML model API client used by Celery workers
+# timeouts in seconds, requests which did not reach the model (connection errors, 502/503/504) are repeated
+# after backoff * 2^(attempt - 1) seconds, read timeouts are not (inference is not idempotent)
+
+CELERY_MODEL_CONNECT_TIMEOUT = float(os.environ.get('CELERY_MODEL_CONNECT_TIMEOUT', 5))
+CELERY_MODEL_READ_TIMEOUT = float(os.environ.get('CELERY_MODEL_READ_TIMEOUT', 600))
+CELERY_MODEL_MAX_RETRIES = int(os.environ.get('CELERY_MODEL_MAX_RETRIES', 3))
+CELERY_MODEL_RETRY_BACKOFF = float(os.environ.get('CELERY_MODEL_RETRY_BACKOFF', 0.5))
+CELERY_MODEL_POOL_SIZE = int(os.environ.get('CELERY_MODEL_POOL_SIZE', 4))
+# recordings are streamed to ML model in chunks of this size (bytes)
+CELERY_MODEL_UPLOAD_CHUNK_SIZE = int(os.environ.get('CELERY_MODEL_UPLOAD_CHUNK_SIZE', 1024 * 1024))
+
+# Segmented analysis - recordings longer than CELERY_SEGMENT_LENGTH (seconds) are split into windows
+# overlapping by CELERY_SEGMENT_OVERLAP seconds, which are analysed in parallel subtasks (Celery chord).
+# Frames with probability >= CELERY_SEGMENT_PROBABILITY_THRESHOLD are treated as bowel sounds
+# when statistics of the whole recording are recomputed.
+CELERY_SEGMENTED_ANALYSIS = os.environ.get('CELERY_SEGMENTED_ANALYSIS', 'False') == 'True'
+CELERY_SEGMENT_LENGTH = float(os.environ.get('CELERY_SEGMENT_LENGTH', 600))
+CELERY_SEGMENT_OVERLAP = float(os.environ.get('CELERY_SEGMENT_OVERLAP', 10))
+CELERY_SEGMENT_PROBABILITY_THRESHOLD = float(os.environ.get('CELERY_SEGMENT_PROBABILITY_THRESHOLD', 0.5))
+
+# Results of ML model are cached by SHA-256 of the recording and CELERY_MODEL_VERSION,
+# entries unused for CELERY_INFERENCE_CACHE_TTL days or above CELERY_INFERENCE_CACHE_MAX_ENTRIES are evicted
+CELERY_MODEL_VERSION = os.environ.get('CELERY_MODEL_VERSION', '1')
+CELERY_INFERENCE_CACHE = os.environ.get('CELERY_INFERENCE_CACHE', 'True') == 'True'
+CELERY_INFERENCE_CACHE_TTL = int(os.environ.get('CELERY_INFERENCE_CACHE_TTL', 30))
+CELERY_INFERENCE_CACHE_MAX_ENTRIES = int(os.environ.get('CELERY_INFERENCE_CACHE_MAX_ENTRIES', 1000))
+
+# Batch analysis - at most CELERY_BATCH_MAX_SIZE recordings of total size up to CELERY_BATCH_MAX_BYTES
+# are sent to ML model in a single request
+CELERY_BATCH_MAX_SIZE = int(os.environ.get('CELERY_BATCH_MAX_SIZE', 16))
+CELERY_BATCH_MAX_BYTES = int(os.environ.get('CELERY_BATCH_MAX_BYTES', 512 * 1024 * 1024))
+# analyses started from the API are accumulated per user for CELERY_BATCH_WINDOW seconds (or until
+# CELERY_BATCH_MAX_SIZE recordings wait) and sent to ML model in batches, 0 starts every analysis at once
+CELERY_BATCH_WINDOW = float(os.environ.get('CELERY_BATCH_WINDOW', 0))
+
+# Priority queues of analysis tasks (see analysis/scheduling.py), workers consume them in order given with -Q:
+# celery -A analysis worker -Q analysis.interactive,analysis.admin,analysis.bulk,celery
+# https://docs.celeryproject.org/en/stable/userguide/routing.html#redis-message-priorities
+CELERY_BROKER_TRANSPORT_OPTIONS = {'queue_order_strategy': 'priority'}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# at most CELERY_MAX_TASKS_PER_USER bulk and admin analyses of one user run at once (0 - no limit),
+# other tasks are retried after CELERY_FAIRNESS_RETRY_DELAY seconds, slots expire after CELERY_USER_SLOT_TIMEOUT
+CELERY_MAX_TASKS_PER_USER = int(os.environ.get('CELERY_MAX_TASKS_PER_USER', 2))
+CELERY_FAIRNESS_RETRY_DELAY = float(os.environ.get('CELERY_FAIRNESS_RETRY_DELAY', 30))
+CELERY_USER_SLOT_TIMEOUT = int(os.environ.get('CELERY_USER_SLOT_TIMEOUT', 3600))
+
+# Progress of analyses is published at most once per CELERY_PROGRESS_INTERVAL seconds within a stage
+CELERY_PROGRESS_INTERVAL = float(os.environ.get('CELERY_PROGRESS_INTERVAL', 1))
+
+# Count DB and Redis round trips of each Celery task (reported by benchmark_analysis command)
+CELERY_COUNT_ROUND_TRIPS = os.environ.get('CELERY_COUNT_ROUND_TRIPS', 'False') == 'True'
+
+# Probabilities of Recording.probability_frames are stored as 'float32' or quantized to 'uint8' (1/255 precision)
+PROBABILITY_PLOT_ENCODING = os.environ.get('PROBABILITY_PLOT_ENCODING', 'float32')
+
+# Responses with statistics plot of given digest (?v=<digest>) are cached by browsers for RECORDING_PLOT_MAX_AGE seconds
+RECORDING_PLOT_MAX_AGE = int(os.environ.get('RECORDING_PLOT_MAX_AGE', 365 * 24 * 60 * 60))
+
+# Audio of recordings (/api/recordings/<id>/audio/) is streamed by Django, or handed off to the front proxy
+# when RECORDING_AUDIO_SENDFILE is 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache mod_xsendfile).
+# nginx serves RECORDING_AUDIO_ACCEL_PREFIX + path relative to MEDIA_ROOT from an internal location:
+# location /protected/media/ { internal; alias <MEDIA_ROOT>/; }
+RECORDING_AUDIO_SENDFILE = os.environ.get('RECORDING_AUDIO_SENDFILE', '')
+RECORDING_AUDIO_ACCEL_PREFIX = os.environ.get('RECORDING_AUDIO_ACCEL_PREFIX', '/protected/media/')
+
+# Resumable chunked upload of recordings (/api/recordings/uploads/) - part files are kept in RECORDING_UPLOAD_DIR
+# of MEDIA_ROOT, chunks can have at most RECORDING_UPLOAD_MAX_CHUNK_SIZE bytes, uploads without a new chunk
+# for RECORDING_UPLOAD_EXPIRY hours are deleted with: python manage.py delete_stale_uploads
+RECORDING_UPLOAD_DIR = os.environ.get('RECORDING_UPLOAD_DIR', 'uploads')
+RECORDING_UPLOAD_MAX_SIZE = int(os.environ.get('RECORDING_UPLOAD_MAX_SIZE', 4 * 1024 * 1024 * 1024))
+RECORDING_UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('RECORDING_UPLOAD_MAX_CHUNK_SIZE', 16 * 1024 * 1024))
+RECORDING_UPLOAD_EXPIRY = int(os.environ.get('RECORDING_UPLOAD_EXPIRY', 48))
+
+# Uploaded recordings have to be PCM WAV files with at most RECORDING_MAX_CHANNELS channels
+# and sample rate of at least RECORDING_MIN_SAMPLE_RATE Hz
+RECORDING_MAX_CHANNELS = int(os.environ.get('RECORDING_MAX_CHANNELS', 2))
+RECORDING_MIN_SAMPLE_RATE = int(os.environ.get('RECORDING_MIN_SAMPLE_RATE', 8000))
+
+# WAV files of uploaded recordings are replaced with their lossless compressed version (recordings/lossless.py,
+# stored as .flac files) in the background, recordings are decoded to WAV on demand when read. Replaced WAV files
+# (analyses queued before compression still read them) are deleted by: python manage.py deduplicate_recordings
+# RECORDING_UPLOAD_EXPIRY hours later, so the command has to be scheduled (e.g. daily) while this is enabled
+RECORDING_COMPRESSION = os.environ.get('RECORDING_COMPRESSION', 'True') == 'True'
+
+# Doctor statistics (/api/statistics/) are cached for DOCTOR_STATISTICS_CACHE_TIMEOUT seconds,
+# changes of doctor's examinations invalidate them earlier
+DOCTOR_STATISTICS_CACHE_TIMEOUT = int(os.environ.get('DOCTOR_STATISTICS_CACHE_TIMEOUT', 300))
+
+# Cache of a single process, settings of environments with Celery workers (dev, prod, heroku) replace it
+# with Redis, so cached statistics, progress and scheduling state are shared by web and worker processes
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Custom user
 # https://docs.djangoproject.com/en/3.2/topics/auth/customizing/
 
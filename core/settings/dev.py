@@ -55,5 +55,14 @@ CHANNEL_LAYERS = {
 CELERY_BROKER_URL = 'redis://redis_db:6379'
 CELERY_RESULT_BACKEND = 'redis://redis_db:6379'
 
-CELERY_MODEL_URL = 'http://localhost:5000'
-CELERY_USE_MOCK_MODEL = True
+# Redis as cache shared by web and Celery worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://redis_db:6379',
+    }
+}
+
+# ML model stand-in can be used instead of mock: python manage.py run_model_standin
+CELERY_MODEL_URL = os.environ.get('CELERY_MODEL_URL', 'http://localhost:5000')
+CELERY_USE_MOCK_MODEL = os.environ.get('CELERY_USE_MOCK_MODEL', 'True') == 'True'
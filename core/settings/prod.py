@@ -80,6 +80,14 @@ REDIS_URL = f'redis://:{REDIS_AUTH_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}'
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
 
+# Redis as cache shared by web and Celery worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+
 CELERY_MODEL_URL = os.environ.get('CELERY_MODEL_URL')
 CELERY_USE_MOCK_MODEL = False
 
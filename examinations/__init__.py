@@ -39,6 +39,8 @@ structure:
     - apps.py                               # examinations app config
     - models.py                             # definition of Examination model
     - serializers.py                        # model serializers (CRUD, data representation and validation)
+    - signals.py                            # invalidates cached doctor statistics when examinations change
+    - statistics.py                         # doctor statistics computed in one aggregate query and cached
     - swagger.py                            # auxiliary serializers used in Swagger documentation
     - urls.py                               # mapping examination viewset to endpoints
     - views.py                              # examination viewset with extra action (CRUD + starting/checking inference)
@@ -29,7 +29,8 @@ from django.contrib.auth import get_user_model
 from django.http.request import HttpRequest
 from django.http.response import HttpResponse, HttpResponseRedirect
 
-from analysis.tasks import process_recording
+from analysis.scheduling import ADMIN_QUEUE, enqueue
+from analysis.tasks import plan_batches, process_recording, process_recordings_batch
 from .models import Examination
 
 User = get_user_model()
@@ -55,12 +56,23 @@ class ExaminationAdmin(admin.ModelAdmin):
     list_filter = ('status', 'date')
     form = ExaminationModelForm
     change_form_template = "examinations/admin/examination_change.html"
+    actions = ['run_batch_analysis']
+
+    @admin.action(description="Run analysis of selected examinations")
+    def run_batch_analysis(self, request: HttpRequest, queryset):
+        recordings = [examination.recording for examination in queryset.select_related('recording')
+                      if examination.recording is not None]
+        # run celery task for each batch
+        batches = plan_batches(recordings)
+        tasks = [enqueue(process_recordings_batch, (batch, request.user.id), ADMIN_QUEUE) for batch in batches]
+        message = f"Started analysis of {len(recordings)} recordings in {len(tasks)} batches"
+        self.message_user(request, message, messages.SUCCESS)
 
     def response_change(self, request: HttpRequest, obj: Examination) -> HttpResponse:
         # handle custom analyze button
         if obj.recording is not None and "run_analysis" in request.POST:
             # run celery task
-            task = process_recording.delay(obj.recording.id, obj.recording.file.path, request.user.id)
+            task = enqueue(process_recording, (obj.recording.id, obj.recording.file.path, request.user.id), ADMIN_QUEUE)
             message = f"Started analysis of {obj.recording}. Task ID {task.id}"
             # refresh page and display success message above
             self.message_user(request, message, messages.SUCCESS)
@@ -29,3 +29,7 @@ from django.apps import AppConfig
 class ExaminationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'examinations'
+
+    def ready(self):
+        # connect signal handlers invalidating cached doctor statistics
+        from . import signals  # noqa: F401
@@ -26,6 +26,7 @@ attribute types and constraints which are reflected in database table, and exami
 by the model itself.
 
 models:
+    - ExaminationQuerySet - Examination queryset joining related objects of its representation
     - Examination
 """
 from django.core.exceptions import ValidationError
@@ -45,7 +46,23 @@ def examination_date_validator(value):
         raise ValidationError('Invalid date! Examination date cannot be in the past.')
 
 
+class ExaminationQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Joins patient, doctor and recording in the same query, loading only their columns used by ExaminationSerializer
+        (recording row with its probability plot and statistics is never loaded just for its name).
+        """
+        user_fields = ('id', 'first_name', 'last_name', 'email')
+        return self.select_related('patient', 'doctor', 'recording').only(
+            *(field.name for field in self.model._meta.concrete_fields),
+            *(f'{user}__{field}' for user in ('patient', 'doctor') for field in user_fields),
+            'recording__id', 'recording__file', 'recording__name'
+        )
+
+
 class Examination(models.Model):
+    objects = ExaminationQuerySet.as_manager()
+
     class Statuses(models.TextChoices):
         cancelled = "cancelled", "cancelled"
         scheduled = "scheduled", "scheduled"
@@ -85,6 +102,11 @@ class Examination(models.Model):
 
     class Meta:
         db_table = 'examinations'
+        # keyset pagination of doctor's and patient's examinations (newest first)
+        indexes = [
+            models.Index(fields=['doctor', '-id'], name='examination_doctor_id'),
+            models.Index(fields=['patient', '-id'], name='examination_patient_id'),
+        ]
 
     def __str__(self):
         return f"Examination {self.id}: {self.status}"
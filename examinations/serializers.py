@@ -31,6 +31,7 @@ serializers:
     - ExaminationCreateSerializer - Examination object creation
     - ExaminationUpdateSerializer - Examination object update
     - ExaminationDetailSerializer - full examination info
+    - BatchInferenceSerializer - examinations analysed in batch
 """
 from rest_framework import serializers
 from .models import Examination, Recording
@@ -116,3 +117,27 @@ class ExaminationDetailSerializer(serializers.ModelSerializer):
             'overview',
             'analysis_id',
         )
+
+
+class BatchInferenceSerializer(serializers.Serializer):
+    """Serializer used for starting analysis of many examinations' recordings"""
+    examinations = serializers.PrimaryKeyRelatedField(queryset=Examination.objects.all(), many=True)
+
+    def validate_examinations(self, examinations):
+        request = self.context.get('request', None)
+        if not examinations:
+            raise serializers.ValidationError('At least one examination is required.')
+        for examination in examinations:
+            if request is None or examination.doctor != request.user:
+                raise serializers.ValidationError(f'Permission denied to examination {examination.id}.')
+            if examination.recording is None:
+                raise serializers.ValidationError(f'Examination {examination.id} does not have a recording.')
+        return examinations
+
+    def create(self, validated_data):
+        """Implementation required by abstract base class"""
+        raise NotImplementedError()
+
+    def update(self, instance, validated_data):
+        """Implementation required by abstract base class"""
+        raise NotImplementedError()
@@ -0,0 +1,49 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Signal handlers of examinations app, connected in ExaminationsConfig.ready.
+
+File consists of:
+    - invalidate_previous_doctor_statistics - invalidates statistics of doctor an examination is taken from
+    - invalidate_statistics - invalidates statistics of doctor of saved or deleted examination
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Examination
+from .statistics import invalidate_doctor_statistics
+
+
+@receiver(pre_save, sender=Examination, dispatch_uid='examinations_invalidate_previous_doctor_statistics')
+def invalidate_previous_doctor_statistics(sender, instance: Examination, update_fields=None, **kwargs):
+    if instance.pk is None or (update_fields is not None and 'doctor' not in update_fields):
+        return
+    previous = Examination.objects.filter(pk=instance.pk).values_list('doctor_id', flat=True).first()
+    if previous != instance.doctor_id:
+        invalidate_doctor_statistics(previous)
+
+
+@receiver(post_save, sender=Examination, dispatch_uid='examinations_invalidate_statistics')
+@receiver(post_delete, sender=Examination, dispatch_uid='examinations_invalidate_statistics_delete')
+def invalidate_statistics(sender, instance: Examination, **kwargs):
+    invalidate_doctor_statistics(instance.doctor_id)
@@ -0,0 +1,74 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Statistics of doctor's examinations shown on the dashboard. All counts are computed in one
+aggregate query with conditional counts and cached per doctor for DOCTOR_STATISTICS_CACHE_TIMEOUT seconds
+(the timeout bounds staleness of the count of examinations in the next week, which changes with time only).
+Cached statistics are invalidated after commit of any change of doctor's examinations.
+
+File consists of:
+    - EXCLUDED_STATUSES - statuses of examinations which are not pending
+    - compute_doctor_statistics - counts of doctor's examinations computed in one query
+    - get_doctor_statistics - cached statistics of doctor
+    - invalidate_doctor_statistics - deletes cached statistics of doctors after commit
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Examination
+
+STATISTICS_KEY = "doctor-statistics"
+
+EXCLUDED_STATUSES = (Examination.Statuses.cancelled, Examination.Statuses.processing_succeeded)
+
+
+def compute_doctor_statistics(doctor_id: int) -> dict:
+    now = timezone.now()
+    pending = ~Q(status__in=EXCLUDED_STATUSES)
+    return Examination.objects.filter(doctor_id=doctor_id).aggregate(
+        examination_count=Count('id'),
+        patients_related_count=Count('patient', distinct=True),
+        examinations_scheduled_count=Count('id', filter=pending),
+        examinations_next_week_count=Count('id', filter=pending & Q(date__gte=now, date__lte=now + timedelta(days=7)))
+    )
+
+
+def get_doctor_statistics(doctor_id: int) -> dict:
+    key = f"{STATISTICS_KEY}:{doctor_id}"
+    statistics = cache.get(key)
+    if statistics is None:
+        statistics = compute_doctor_statistics(doctor_id)
+        cache.set(key, statistics, timeout=settings.DOCTOR_STATISTICS_CACHE_TIMEOUT)
+    return statistics
+
+
+def invalidate_doctor_statistics(*doctor_ids: int):
+    # after commit, otherwise a concurrent request could cache statistics computed from the old state
+    keys = [f"{STATISTICS_KEY}:{doctor_id}" for doctor_id in doctor_ids if doctor_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -27,15 +27,20 @@ import os
 import shutil
 from datetime import timedelta
 from pathlib import Path
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from analysis.scheduling import BULK_QUEUE
 from examinations.models import Examination
 from recordings.models import Recording
 from users.utils import get_tokens_for_user
@@ -48,6 +53,8 @@ User = get_user_model()
 class TestExaminationsAPIViews(TestCase):
     def setUp(self):
         self.client = APIClient()
+        # cached statistics of doctors are not rolled back with the database
+        cache.clear()
 
     @classmethod
     def setUpTestData(cls):
@@ -108,6 +115,50 @@ class TestExaminationsAPIViews(TestCase):
         response = self.client.get("/api/examinations/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_examinations_query_count(self):
+        self._require_jwt_cookies(self.user1)
+        for _ in range(10):
+            recording = Recording.objects.create(uploader=self.user1, name='test.wav')
+            Examination.objects.create(doctor=self.user1, patient=self.user2, recording=recording,
+                                       date=timezone.now() + timedelta(days=1))
+
+        counts = []
+        for limit in (2, 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f"/api/examinations/?limit={limit}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            examination = response.json()['results'][0]
+            self.assertEqual(examination['patient']['id'], self.user2.id)
+            self.assertEqual(examination['doctor']['id'], self.user1.id)
+            self.assertEqual(examination['recording']['name'], 'test.wav')
+            counts.append(len(queries))
+            # recording is joined with its id, file and name only
+            self.assertFalse(any("probability_frames" in query["sql"] for query in queries.captured_queries))
+        # number of queries does not depend on page size
+        self.assertEqual(counts[0], counts[1])
+
+    def test_list_examinations_cursor_pagination(self):
+        self._require_jwt_cookies(self.user1)
+        created = [
+            Examination.objects.create(doctor=self.user1, date=timezone.now() + timedelta(days=days)).id
+            for days in (3, 1, 2, 5, 4)
+        ]
+        ids, url = [], "/api/examinations/?limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()['count'], 5)
+            ids += [examination['id'] for examination in response.json()['results']]
+            url = response.json()['next']
+            # date of an examination on a later page is changed between requests
+            Examination.objects.filter(id=created[0]).update(date=timezone.now() + timedelta(days=10 + len(ids)))
+        # newest examination first, every examination exactly once
+        self.assertEqual(ids, created[::-1])
+
+        response = self.client.get("/api/examinations/?limit=2&count=false")
+        self.assertNotIn('count', response.json())
+        self.assertEqual(len(response.json()['results']), 2)
+
     def test_list_current_examinations(self):
         self._require_jwt_cookies(user=self.user1)
         response = self.client.get("/api/examinations/")
@@ -307,6 +358,68 @@ class TestExaminationsAPIViews(TestCase):
                          {'detail': 'Another recording has already been assigned to chosen examination.'})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_inference_progress(self):
+        examination = Examination.objects.create(
+            doctor=self.user1, patient=self.user2, date=timezone.now(), recording=self.recording1,
+            analysis_id="task-id"
+        )
+        self._require_jwt_cookies(self.user1)
+        progress = {"recording_id": self.recording1.id, "stage": "upload", "percent": 20.0, "elapsed": 2.0, "eta": 8.0}
+
+        with mock.patch('examinations.views.AsyncResult') as async_result:
+            async_result.return_value.task_id = "task-id"
+            async_result.return_value.status = "PROGRESS"
+            async_result.return_value.info = progress
+            response = self.client.get(f"/api/examinations/{examination.id}/inference/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(), {"task_id": "task-id", "status": "PROGRESS", "result": None, "progress": progress}
+        )
+
+    def test_batch_inference(self):
+        examination1 = Examination.objects.create(
+            doctor=self.user1, patient=self.user2, date=timezone.now(), recording=self.recording1
+        )
+        recording2 = Recording.objects.create(
+            file=SimpleUploadedFile("file2.wav", b"file_content", content_type="audio/wav"), name='test2.wav'
+        )
+        examination2 = Examination.objects.create(
+            doctor=self.user1, patient=self.user2, date=timezone.now(), recording=recording2
+        )
+        self._require_jwt_cookies(self.user1)
+
+        with mock.patch('examinations.views.process_recordings_batch.apply_async') as apply_async:
+            apply_async.return_value.id = "task-id"
+            response = self.client.post(
+                "/api/examinations/batch_inference/", {"examinations": [examination1.id, examination2.id]},
+                format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["task_ids"], ["task-id"])
+        args, options = apply_async.call_args
+        self.assertEqual(args[0], ([self.recording1.id, recording2.id], self.user1.id))
+        self.assertEqual(options["queue"], BULK_QUEUE)
+
+    def test_batch_inference_invalid_examinations(self):
+        without_recording = Examination.objects.create(doctor=self.user1, patient=self.user2, date=timezone.now())
+        other_doctor = User.objects.create_user(
+            email="batch_other@gmail.com", password="test1", first_name="", last_name="", type=User.Types.DOCTOR
+        )
+        foreign = Examination.objects.create(doctor=other_doctor, date=timezone.now(), recording=self.recording1)
+        self._require_jwt_cookies(self.user1)
+
+        for examinations in ([], [without_recording.id], [foreign.id]):
+            response = self.client.post(
+                "/api/examinations/batch_inference/", {"examinations": examinations}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self._require_jwt_cookies(self.user2)
+        response = self.client.post(
+            "/api/examinations/batch_inference/", {"examinations": [foreign.id]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_is_doctor(self):
         user1 = User.objects.create_user(
             email="test12@gmail.com", password="test1",
@@ -390,3 +503,27 @@ class TestExaminationsAPIViews(TestCase):
                 'examinations_next_week_count': 4
             }
         )
+
+    def test_statistics_single_query_and_cache(self):
+        self._require_jwt_cookies(self.user1)
+        Examination.objects.create(doctor=self.user1, patient=self.user2, date=timezone.now() + timedelta(days=2))
+        Examination.objects.create(doctor=self.user1, date=timezone.now() + timedelta(days=2))
+
+        for expected_queries in (1, 0):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/api/statistics/")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # cached after the first request
+            self.assertEqual(
+                sum('"examinations"' in query["sql"] for query in queries.captured_queries), expected_queries
+            )
+        self.assertEqual(response.json()['examination_count'], 2)
+        self.assertEqual(response.json()['patients_related_count'], 1)
+
+        # changed status invalidates cached statistics
+        examination = Examination.objects.filter(doctor=self.user1).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            examination.status = Examination.Statuses.cancelled
+            examination.save()
+        response = self.client.get("/api/statistics/")
+        self.assertEqual(response.json()['examinations_scheduled_count'], 1)
@@ -27,6 +27,7 @@ endpoints:
     - /api/examinations/
     - /api/examinations/<id>/
     - /api/examinations/<id>/inference
+    - /api/examinations/batch_inference/
     - /api/statistics/
 """
 from django.urls import path
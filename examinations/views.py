@@ -28,11 +28,10 @@ Defined views and viewsets:
     - ExaminationViewSet - examination CRUD
     - GetDoctorStatistics - doctor statistics
 """
-from datetime import timedelta
-
 from celery.result import AsyncResult
+from celery.states import FAILURE, SUCCESS
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
@@ -48,14 +47,20 @@ from rest_framework.status import (
 )
 from rest_framework.views import APIView
 
-from analysis.swagger import InferenceResponseSerializer
-from analysis.tasks import process_recording
+from core.pagination import KeysetPagination
+from analysis.swagger import BatchInferenceResponseSerializer, InferenceResponseSerializer
+from analysis.progress import PROGRESS
+from analysis.scheduling import BULK_QUEUE, INTERACTIVE_QUEUE, enqueue
+from analysis.tasks import add_to_batch, plan_batches, process_recording, process_recordings_batch
+from recordings.serializers import RecordingAfterAnalysisSerializer
 from .models import Examination
 from .serializers import (
+    BatchInferenceSerializer,
     ExaminationSerializer,
     ExaminationCreateSerializer,
     ExaminationUpdateSerializer
 )
+from .statistics import get_doctor_statistics
 from .swagger import DoctorStatisticsResponse
 
 User = get_user_model()
@@ -69,26 +74,37 @@ class ExaminationViewSet(
     viewsets.GenericViewSet
 ):
     """
-    GET     /api/examinations/          - list all examinations
+    GET     /api/examinations/          - list all examinations (?limit=, ?cursor=, ?count=false)
     POST    /api/examinations/          - register new examination
     GET     /api/examinations/<int:id>/ - retrieve examination
     PUT     /api/examinations/<int:id>/ - update examination
     PATCH   /api/examinations/<int:id>/ - partially update examination
+    GET     /api/examinations/<int:id>/inference/ - check state of analysis
+    POST    /api/examinations/<int:id>/inference/ - start analysis
+    POST    /api/examinations/batch_inference/ - start analysis of many examinations in batches
     """
 
     serializer_class = ExaminationSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['doctor', 'patient']
+    pagination_class = KeysetPagination
+    # newest examinations first - date is editable, pages ordered by it would skip or repeat moved examinations
+    pagination_ordering = '-id'
 
     def get_queryset(self):
         if self.request.user.is_anonymous:
             return Examination.objects.none()
         elif self.request.user.type == "DOCTOR":
-            return Examination.objects.filter(doctor=self.request.user)
+            queryset = Examination.objects.filter(doctor=self.request.user)
         elif self.request.user.type == "PATIENT":
-            return Examination.objects.filter(patient=self.request.user)
-        return Examination.objects.none()
+            queryset = Examination.objects.filter(patient=self.request.user)
+        else:
+            return Examination.objects.none()
+        if getattr(self, 'action', None) in ('list', 'retrieve', 'update', 'partial_update'):
+            # patient, doctor and recording of ExaminationSerializer are joined instead of queried for each row
+            return queryset.with_related()
+        return queryset
 
     def get_serializer_class(self):
         if hasattr(self, 'action') and self.action == 'create':
@@ -97,6 +113,8 @@ class ExaminationViewSet(
             return ExaminationUpdateSerializer
         elif hasattr(self, 'action') and self.action == "inference":
             return Serializer  # empty serializer
+        elif hasattr(self, 'action') and self.action == "batch_inference":
+            return BatchInferenceSerializer
         return super().get_serializer_class()
 
     @swagger_auto_schema(responses={HTTP_201_CREATED: openapi.Response('OK', ExaminationSerializer)})
@@ -133,8 +151,20 @@ class ExaminationViewSet(
             if request.user.type != User.Types.DOCTOR or examination.doctor != request.user:
                 return Response({"message": "Permission denied!"}, status=HTTP_403_FORBIDDEN)
 
+            if settings.CELERY_BATCH_WINDOW:
+                # analysis is sent to ML model in a batch with others started within the window
+                add_to_batch(recording.id, request.user.id, INTERACTIVE_QUEUE)
+                return Response(
+                    {
+                        "message": f"Analysis of Recording ({recording.id}) will start within "
+                                   f"{settings.CELERY_BATCH_WINDOW:g} s!",
+                        "task_id": None
+                    },
+                    status=HTTP_200_OK
+                )
+
             # run celery task
-            task = process_recording.delay(recording.id, recording.file.path, request.user.id)
+            task = enqueue(process_recording, (recording.id, recording.file.path, request.user.id), INTERACTIVE_QUEUE)
             return Response(
                 {"message": f"Analysis of Recording ({recording.id}) has been started!", "task_id": task.id},
                 status=HTTP_200_OK
@@ -152,12 +182,47 @@ class ExaminationViewSet(
 
             # check task status in celery backend
             task = AsyncResult(task_id)
-            result = task.result if task.status == "SUCCESS" else None
+            task_status = task.status
+            result = task.result if task_status == SUCCESS else None
+            # stage, percent and ETA published by running analysis
+            progress = task.info if task_status == PROGRESS else None
+
+            if isinstance(result, dict) and "recordings" in result:
+                # batch analysis - state of this examination's recording only
+                task_status = result["recordings"].get(str(recording.id), FAILURE)
+                result = RecordingAfterAnalysisSerializer(recording).data if task_status == SUCCESS else None
 
             return Response(
-                {"task_id": task.task_id, "status": task.status, "result": result}, status=HTTP_200_OK
+                {"task_id": task.task_id, "status": task_status, "result": result, "progress": progress},
+                status=HTTP_200_OK
             )
 
+    @swagger_auto_schema(method="POST", responses={
+        HTTP_200_OK: openapi.Response('Analysis has been started', BatchInferenceResponseSerializer),
+        HTTP_400_BAD_REQUEST: openapi.Response('Invalid examinations'),
+        HTTP_403_FORBIDDEN: openapi.Response('Permission denied!')
+    })
+    @action(detail=False, methods=['POST'])
+    def batch_inference(self, request, *args, **kwargs):
+        # only doctor can start inference
+        if request.user.type != User.Types.DOCTOR:
+            return Response({"message": "Permission denied!"}, status=HTTP_403_FORBIDDEN)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recordings = [examination.recording for examination in serializer.validated_data['examinations']]
+
+        # run celery task for each batch
+        batches = plan_batches(recordings)
+        tasks = [enqueue(process_recordings_batch, (batch, request.user.id), BULK_QUEUE) for batch in batches]
+        return Response(
+            {
+                "message": f"Analysis of {len(recordings)} recordings has been started!",
+                "task_ids": [task.id for task in tasks]
+            },
+            status=HTTP_200_OK
+        )
+
 
 class GetDoctorStatistics(APIView):
     """
@@ -173,27 +238,4 @@ class GetDoctorStatistics(APIView):
         if self.request.user.type != "DOCTOR":
             return Response({'message': 'Permission denied!'}, status=HTTP_403_FORBIDDEN)
 
-        excluded_statuses = ["cancelled", "processing_succeeded"]
-
-        examination_pending = Examination.objects.filter(doctor=self.request.user).exclude(
-            status__in=excluded_statuses
-        ).count()
-
-        patients_related = Examination.objects.filter(doctor=self.request.user).distinct("patient").count()
-
-        examination_next_week = Examination.objects.filter(
-            doctor=self.request.user, date__gte=timezone.now(),
-            date__lte=timezone.now() + timedelta(days=7)
-        ).exclude(status__in=excluded_statuses).count()
-
-        examination_count = Examination.objects.filter(doctor=self.request.user).count()
-
-        return Response(
-            {
-                'examination_count': examination_count,
-                'patients_related_count': patients_related,
-                'examinations_scheduled_count': examination_pending,
-                'examinations_next_week_count': examination_next_week
-            },
-            status=HTTP_200_OK
-        )
+        return Response(get_doctor_statistics(self.request.user.id), status=HTTP_200_OK)
@@ -29,15 +29,45 @@ description: Package contains structure and functionality of Recording model inc
     - unit tests
 
 structure:
+    - management/
+        - commands/                         # package for custom commands
+            - __init__.py
+            - benchmark_upload.py           # throughput of default vs single-pass upload handling of recordings
+            - compress_recordings.py        # compresses WAV files of recordings, reports throughput and saved storage
+            - deduplicate_recordings.py     # moves recordings to content-addressable storage, deletes duplicate files
+            - delete_stale_uploads.py       # deletes abandoned resumable uploads and their partial files
+            - pack_probability_plots.py     # converts JSON probability plots to binary frames
+        - __init__.py
     - migrations/                           # migrations package
     - tests/                                # unit tests package
         - __init__.py
         - test_api_views.py                 # unit tests of endpoints, views, serializers within recordings app
+        - test_audio.py                     # unit tests of audio endpoint with Range requests
+        - test_handlers.py                  # unit tests of single-pass upload handler of recordings
+        - test_lossless.py                  # unit tests of lossless compression of recordings and their decoding
+        - test_plots.py                     # unit tests of statistics plots endpoints and deferred plot columns
+        - test_probability.py               # unit tests of binary probability plot storage and endpoint
+        - test_pyramid.py                   # unit tests of LTTB pyramid and probability plot window
+        - test_storage.py                   # unit tests of content-addressable storage of recording audio
+        - test_uploads.py                   # unit tests of resumable chunked upload of recordings
+        - test_wav.py                       # unit tests of WAV header parser
+        - test_waveform.py                  # unit tests of waveform peaks, their task and endpoint
     - __init__.py
     - admin.py                              # registration of Recording model in admin interface
     - apps.py                               # recordings app config
-    - models.py                             # definition of Recording model
+    - audio.py                              # streaming of recording audio with HTTP Range support
+    - handlers.py                           # upload handler writing, hashing and parsing recordings in one pass
+    - lossless.py                           # FLAC compression of WAV files with on-demand decoding
+    - models.py                             # definition of Recording model and its statistics plots
+    - probability.py                        # compact binary probability plot (ProbabilityPlot and model field)
+    - pyramid.py                            # multi-resolution LTTB pyramid of probability plot
     - serializers.py                        # model serializers (CRUD, data representation and validation)
+    - signals.py                            # starts waveform and compression of created recordings, releases audio
+    - storage.py                            # content-addressable storage of recording audio with reference counting
+    - tasks.py                              # Celery tasks computing waveform peaks and compressing recordings
+    - uploads.py                            # resumable chunked upload (writing chunks, assembling Recording)
     - urls.py                               # mapping viewset to endpoint
     - views.py
+    - wav.py                                # streaming parser and validation of WAV header of uploaded recordings
+    - waveform.py                           # waveform peaks (min/max per bucket of samples) at several zoom levels
 """
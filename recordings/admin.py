@@ -35,6 +35,10 @@ class RecordingAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'examination', 'latest_analysis_date', 'uploader', 'uploaded_at')
     list_filter = ('uploaded_at', 'latest_analysis_date')
 
+    def get_queryset(self, request):
+        # probability plot columns are loaded only when a recording is opened
+        return super().get_queryset(request).without_blobs()
+
     def examination(self, obj: Recording):
         """Adds an examination column in list_display (with a link to examination if it exists)"""
 
@@ -29,3 +29,7 @@ from django.apps import AppConfig
 class RecordingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recordings'
+
+    def ready(self):
+        # connect signal handler computing waveform peaks of created recordings
+        from . import signals  # noqa: F401
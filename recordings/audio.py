@@ -0,0 +1,204 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Streaming of recording audio with support of HTTP Range requests (RFC 7233), so players can seek
+within a recording and fetch only the bytes which are played. File is read from disk in chunks while the response
+is sent, or the transfer is handed off to the front proxy (X-Accel-Redirect for nginx, X-Sendfile for Apache)
+when RECORDING_AUDIO_SENDFILE is set - the proxy handles ranges itself then. Compressed (FLAC) recordings are
+sent as they are stored to clients which list FLAC in the Accept header, others get bytes of the original WAV file
+from Django - only blocks of the requested range are decoded.
+
+File consists of:
+    - RangeNotSatisfiable - raised for ranges outside of the file
+    - AudioRenderer - renderer of audio action accepting any media type
+    - parse_range - first and last byte of a single byte range from Range header
+    - accepts_flac - whether client accepts FLAC audio explicitly (wildcards do not count)
+    - iter_file_range - generator reading part of a file (WAV bytes of decoded recording) in chunks
+    - audio_response - response with the whole recording, a part of it (206) or proxy hand-off
+"""
+import mimetypes
+import os
+import re
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .lossless import FLAC_CONTENT_TYPE, audio_size, is_compressed, open_audio
+
+CHUNK_SIZE = 64 * 1024
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+WAV_CONTENT_TYPE = 'audio/x-wav'
+FLAC_CONTENT_TYPES = (FLAC_CONTENT_TYPE, 'audio/x-flac')
+
+
+class RangeNotSatisfiable(ValueError):
+    """Range does not overlap with the file"""
+
+
+class AudioRenderer(BaseRenderer):
+    """
+    Accepts any media type (e.g. Accept: audio/wav of players), so content negotiation of audio action
+    does not fail. Audio is sent as HttpResponse, only error messages are rendered (as JSON).
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Returns first and last (inclusive) byte of range from Range header. None is returned for headers which are
+    ignored - malformed ones (including ranges with last byte before the first) and multiple ranges
+    (the whole file is sent then, which RFC 7233 allows).
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # suffix range - last N bytes, there are none in an empty file
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+    if last and int(last) < int(first):
+        # syntactically invalid range (RFC 7233, section 2.1) - header is ignored
+        return None
+    first, last = int(first), min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise RangeNotSatisfiable(header)
+    return first, last
+
+
+def accepts_flac(request: HttpRequest) -> bool:
+    """
+    Whether FLAC media type is listed in Accept header (with non-zero quality). Players accepting any audio
+    (audio/*, */*) get WAV, browsers which do not play FLAC send such headers.
+    """
+    for media_range in request.headers.get('Accept', '').split(','):
+        media_type, *params = (part.strip() for part in media_range.split(';'))
+        quality = next((param.split('=', 1)[1].strip() for param in params if param.startswith('q=')), '1')
+        try:
+            if media_type.lower() in FLAC_CONTENT_TYPES and float(quality) > 0:
+                return True
+        except ValueError:
+            # malformed quality, the media range is ignored
+            continue
+    return False
+
+
+def iter_file_range(path: str, first: int, length: int, chunk_size: int = CHUNK_SIZE,
+                    decode: bool = True) -> Iterator[bytes]:
+    """Yields length bytes of file starting at first, at most chunk_size at once. WAV bytes are read from
+    compressed recording if decode is set."""
+    with open_audio(path) if decode else open(path, 'rb') as file:
+        file.seek(first)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile_response(name: str, path: str) -> Optional[HttpResponse]:
+    # empty response, front proxy sends the file (with Range support) instead
+    if settings.RECORDING_AUDIO_SENDFILE == X_ACCEL_REDIRECT:
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.RECORDING_AUDIO_ACCEL_PREFIX + name
+        return response
+    if settings.RECORDING_AUDIO_SENDFILE == X_SENDFILE:
+        response = HttpResponse()
+        response['X-Sendfile'] = path
+        return response
+    return None
+
+
+def audio_response(request: HttpRequest, name: str, path: str) -> HttpResponse:
+    """
+    Returns response with recording audio stored at path (name is relative to MEDIA_ROOT). Supports Range
+    and If-Range headers (206 and 416 responses) and conditional requests with ETag and Last-Modified.
+    """
+    compressed = is_compressed(path)
+    # compressed recording is sent decoded - as bytes of its WAV file, unless the client plays FLAC
+    decode = compressed and not accepts_flac(request)
+    if decode:
+        content_type = WAV_CONTENT_TYPE
+    elif compressed:
+        content_type = FLAC_CONTENT_TYPE
+    else:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    # front proxy can not decode compressed recordings
+    response = _sendfile_response(name, path) if not decode else None
+    if response is not None:
+        response['Content-Type'] = content_type
+        if compressed:
+            patch_vary_headers(response, ('Accept',))
+        return response
+
+    # ETag contains the size, so FLAC and WAV representations of compressed recording have different ETags
+    size = audio_size(path) if decode else os.path.getsize(path)
+    last_modified = int(os.stat(path).st_mtime)
+    etag = quote_etag(f'{last_modified:x}-{size:x}')
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        if compressed:
+            patch_vary_headers(not_modified, ('Accept',))
+        return not_modified
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # If-Range - range is sent only when the file has not changed since the client got its part
+    if range_header and request.headers.get('If-Range', etag) in (etag, http_date(last_modified)):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    first, last = byte_range or (0, size - 1)
+    length = last - first + 1 if size else 0
+    response = StreamingHttpResponse(
+        iter_file_range(path, first, length, decode=decode) if request.method != 'HEAD' else iter(()),
+        status=206 if byte_range else 200, content_type=content_type
+    )
+    if byte_range:
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    if compressed:
+        patch_vary_headers(response, ('Accept',))
+    return response
@@ -0,0 +1,108 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Upload handler of recording files. Django handlers write the upload to memory or to a temporary
+file and a recording would then be read again to parse its header and once more (in the worker) to hash it.
+RecordingUploadHandler does all of it in one pass over the received chunks - each chunk is written to a temporary
+file in RECORDING_UPLOAD_DIR of MEDIA_ROOT (on the same filesystem as stored recordings, so saving the file is
+just a rename), added to SHA-256 of the file and the beginning of the file is kept for parsing of its WAV header.
+
+File consists of:
+    - HEADER_SIZE - number of bytes at the beginning of the upload kept for parsing of WAV header
+    - RecordingUploadedFile - uploaded recording with its SHA-256 and WAV header
+    - RecordingUploadHandler - upload handler hashing, parsing and writing recording file in one pass
+"""
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+
+from .wav import InvalidWav, read_wav_info
+
+HEADER_SIZE = 64 * 1024
+
+
+class RecordingUploadedFile(TemporaryUploadedFile):
+    """
+    Recording received by RecordingUploadHandler. audio_hash is SHA-256 of the file, wav_info its parsed WAV header
+    or None when the file is not a supported WAV file (wav_error explains why).
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        directory = os.path.join(settings.MEDIA_ROOT, settings.RECORDING_UPLOAD_DIR)
+        os.makedirs(directory, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + os.path.splitext(name)[1], dir=directory)
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.audio_hash = None
+        self.wav_info = None
+        self.wav_error = None
+
+
+class RecordingUploadHandler(FileUploadHandler):
+    """Handles file of recording (field 'file') in one pass, other files are passed to the next handlers"""
+    handled_field = 'file'
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.file = None
+        if field_name != self.handled_field:
+            return
+        self.file = RecordingUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+        self.digest = hashlib.sha256()
+        self.header = bytearray()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file is None:
+            return raw_data
+        self.file.write(raw_data)
+        self.digest.update(raw_data)
+        if len(self.header) < HEADER_SIZE:
+            self.header += raw_data[:HEADER_SIZE - len(self.header)]
+        return None
+
+    def file_complete(self, file_size):
+        if self.file is None:
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.audio_hash = self.digest.hexdigest()
+        try:
+            self.file.wav_info = read_wav_info(BytesIO(self.header), size=file_size)
+        except InvalidWav as e:
+            self.file.wav_error = str(e)
+            if len(self.header) < file_size:
+                # metadata chunks do not fit in the kept bytes, only the header is read from the written file
+                try:
+                    self.file.wav_info, self.file.wav_error = read_wav_info(self.file), None
+                except InvalidWav as e:
+                    self.file.wav_error = str(e)
+        return self.file
+
+    def upload_interrupted(self):
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
@@ -0,0 +1,270 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Lossless compressed storage of WAV recordings as FLAC files (encoded and decoded by libsndfile via
+soundfile). Bytes of the WAV file around the samples (RIFF header, metadata chunks) are stored in APPLICATION
+metadata blocks with RIFF_APPLICATION id (as flac --keep-foreign-metadata does), so the original file is restored
+bit for bit - its SHA-256 (key of cached results of ML model) does not change. FLAC supports at most 24 bits per
+sample, 32-bit recordings are kept as WAV files.
+FlacWavFile is a seekable file object returning bytes of the original WAV file and decoding only blocks of frames
+which are read, so range requests and wave module work on it. The FLAC file replaces the WAV file under a name
+with COMPRESSED_EXTENSION (readers tell them apart by the magic bytes), it can also be sent as it is to clients
+which accept FLAC_CONTENT_TYPE. Both return the same bytes, so it does not matter which of them a reader opens
+while a recording is being compressed.
+
+File consists of:
+    - FlacWavFile - seekable file object with bytes of the original WAV file
+    - compress_wav - compresses WAV file and verifies that it is restored exactly
+    - get_compressed_name - storage name of compressed version of WAV file
+    - is_compressed - whether file at path is a compressed recording
+    - open_audio - opens recording (WAV or compressed) as file object with bytes of WAV file
+    - audio_size - size of WAV file of recording
+"""
+import hashlib
+import io
+import os
+import shutil
+import struct
+from typing import BinaryIO
+
+import numpy as np
+import soundfile
+
+from .wav import read_wav_info
+
+MAGIC = b'fLaC'
+COMPRESSED_EXTENSION = '.flac'
+FLAC_CONTENT_TYPE = 'audio/flac'
+# application id registered for RIFF chunks stored by flac --keep-foreign-metadata
+RIFF_APPLICATION = b'riff'
+SUBTYPES = {1: 'PCM_S8', 2: 'PCM_16', 3: 'PCM_24'}
+
+LAST_METADATA = 0x80
+APPLICATION = 2
+MAX_METADATA_SIZE = (1 << 24) - 1
+BLOCK_FRAMES = 16 * 1024
+
+
+def _to_samples(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """PCM bytes to samples shifted to the top bits of int32, shape (frames, channels)"""
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.int32) - 128) << 24
+    else:
+        # little endian bytes of the sample placed in the high bytes of int32
+        raw = np.zeros((len(data) // sample_width, 4), dtype=np.uint8)
+        raw[:, 4 - sample_width:] = np.frombuffer(data, dtype=np.uint8).reshape(-1, sample_width)
+        samples = raw.view('<i4').reshape(-1)
+    return samples.reshape(-1, channels)
+
+
+def _to_bytes(samples: np.ndarray, sample_width: int) -> bytes:
+    samples = samples.reshape(-1)
+    if sample_width == 1:
+        return ((samples >> 24) + 128).astype(np.uint8).tobytes()
+    return samples.astype('<i4').view(np.uint8).reshape(-1, 4)[:, 4 - sample_width:].tobytes()
+
+
+def _read_metadata(file: BinaryIO) -> list[tuple[int, bytes]]:
+    """Reads metadata blocks (type, data) of FLAC file, the file is left at the first audio frame"""
+    file.seek(0)
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{file.name} is not a FLAC file")
+    blocks = []
+    last = False
+    while not last:
+        # 1 byte of flags and type followed by 24-bit size
+        header = file.read(4)
+        if len(header) < 4:
+            raise ValueError(f"Metadata of {file.name} are truncated")
+        last = header[0] & LAST_METADATA
+        blocks.append((header[0] & ~LAST_METADATA, file.read(int.from_bytes(header[1:], 'big'))))
+    return blocks
+
+
+def _write_metadata(file: BinaryIO, blocks: list[tuple[int, bytes]]):
+    for i, (block_type, data) in enumerate(blocks):
+        flags = block_type | (LAST_METADATA if i == len(blocks) - 1 else 0)
+        file.write(bytes((flags,)) + len(data).to_bytes(3, 'big') + data)
+
+
+def _canonical_head(channels: int, sample_rate: int, sample_width: int, data_size: int) -> bytes:
+    """header of WAV file written by wave module, used for FLAC files without stored RIFF chunks"""
+    block_align = channels * sample_width
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size + data_size % 2, b'WAVE', b'fmt ', 16, 1,
+                       channels, sample_rate, sample_rate * block_align, block_align, 8 * sample_width, b'data',
+                       data_size)
+
+
+class FlacWavFile(io.RawIOBase):
+    """Read-only seekable file object returning bytes of the original WAV file of FLAC compressed recording."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        with open(path, 'rb') as file:
+            riff = b''.join(data[len(RIFF_APPLICATION):] for block_type, data in _read_metadata(file)
+                            if block_type == APPLICATION and data.startswith(RIFF_APPLICATION))
+        self._sound = soundfile.SoundFile(path)
+        try:
+            self.sample_width = {subtype: width for width, subtype in SUBTYPES.items()}[self._sound.subtype]
+        except KeyError:
+            self._sound.close()
+            raise ValueError(f"Unsupported FLAC subtype {self._sound.subtype}")
+        self.channels, self.frames = self._sound.channels, self._sound.frames
+        self._frame_size = self.channels * self.sample_width
+        self._samples_size = self.frames * self._frame_size
+        if riff:
+            # RIFF chunks before the samples end with header of the data chunk
+            data_offset = read_wav_info(io.BytesIO(riff), size=len(riff) + self._samples_size).data_offset
+            self._head, self._tail = riff[:data_offset], riff[data_offset:]
+        else:
+            self._head = _canonical_head(self.channels, self._sound.samplerate, self.sample_width, self._samples_size)
+            self._tail = b'\0' * (self._samples_size % 2)
+        self.size = len(self._head) + self._samples_size + len(self._tail)
+        self._block_size = BLOCK_FRAMES * self._frame_size
+        self._position = 0
+        self._cached = (None, b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        if base + offset < 0:
+            raise ValueError("negative seek position")
+        self._position = base + offset
+        return self._position
+
+    def _block(self, index: int) -> bytes:
+        if self._cached[0] != index:
+            self._sound.seek(index * BLOCK_FRAMES)
+            samples = self._sound.read(BLOCK_FRAMES, dtype='int32', always_2d=True)
+            self._cached = (index, _to_bytes(samples, self.sample_width))
+        return self._cached[1]
+
+    def _read_at(self, position: int, size: int) -> bytes:
+        head, samples_end = len(self._head), len(self._head) + self._samples_size
+        if position < head:
+            return self._head[position:position + size]
+        if position < samples_end:
+            index, start = divmod(position - head, self._block_size)
+            return self._block(index)[start:start + min(size, samples_end - position)]
+        return self._tail[position - samples_end:position - samples_end + size]
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        read = 0
+        while read < len(view) and (data := self._read_at(self._position, len(view) - read)):
+            view[read:read + len(data)] = data
+            read += len(data)
+            self._position += len(data)
+        return read
+
+    def close(self):
+        self._sound.close()
+        super().close()
+
+
+def compress_wav(source_path: str, target_path: str, block_frames: int = BLOCK_FRAMES) -> int:
+    """
+    Writes FLAC file with bytes of WAV file around the samples to target_path and returns its size. The result
+    is decoded and compared with the source (SHA-256) before returning. Raises ValueError (InvalidWav) for files
+    which are not supported WAV files and for 32-bit recordings.
+    """
+    flac_path = f'{target_path}.samples'
+    try:
+        with open(source_path, 'rb') as source:
+            info = read_wav_info(source)
+            sample_width = info.bits_per_sample // 8
+            if sample_width not in SUBTYPES:
+                raise ValueError(f"FLAC does not support {info.bits_per_sample}-bit samples")
+            frame_size = info.channels * sample_width
+            head = source.read(info.data_offset)
+            source.seek(info.data_offset + info.frames * frame_size)
+            tail = source.read()
+            source.seek(info.data_offset)
+
+            digest = hashlib.sha256(head)
+            with soundfile.SoundFile(flac_path, 'w', samplerate=info.sample_rate, channels=info.channels,
+                                     subtype=SUBTYPES[sample_width], format='FLAC') as flac:
+                for start in range(0, info.frames, block_frames):
+                    data = source.read(min(block_frames, info.frames - start) * frame_size)
+                    digest.update(data)
+                    flac.write(_to_samples(data, sample_width, info.channels))
+            digest.update(tail)
+
+        riff = head + tail
+        with open(flac_path, 'rb') as flac, open(target_path, 'wb') as target:
+            blocks = _read_metadata(flac)
+            step = MAX_METADATA_SIZE - len(RIFF_APPLICATION)
+            blocks += [(APPLICATION, RIFF_APPLICATION + riff[i:i + step]) for i in range(0, len(riff), step)]
+            target.write(MAGIC)
+            _write_metadata(target, blocks)
+            shutil.copyfileobj(flac, target)
+    finally:
+        if os.path.exists(flac_path):
+            os.remove(flac_path)
+
+    restored = hashlib.sha256()
+    with FlacWavFile(target_path) as compressed:
+        while data := compressed.read(1024 * 1024):
+            restored.update(data)
+    if restored.digest() != digest.digest():
+        os.remove(target_path)
+        raise ValueError(f"Compressed {source_path} is not restored exactly")
+    return os.path.getsize(target_path)
+
+
+def get_compressed_name(name: str) -> str:
+    return os.path.splitext(name)[0] + COMPRESSED_EXTENSION
+
+
+def _is_compressed(file: BinaryIO) -> bool:
+    compressed = file.read(len(MAGIC)) == MAGIC
+    file.seek(0)
+    return compressed
+
+
+def is_compressed(path: str) -> bool:
+    with open(path, 'rb') as file:
+        return _is_compressed(file)
+
+
+def open_audio(path: str) -> BinaryIO:
+    """Opens WAV file or compressed recording, both return bytes of WAV file."""
+    if is_compressed(path):
+        return io.BufferedReader(FlacWavFile(path), buffer_size=64 * 1024)
+    return open(path, 'rb')
+
+
+def audio_size(path: str) -> int:
+    """Returns size of WAV file of recording (before compression)."""
+    if is_compressed(path):
+        with FlacWavFile(path) as compressed:
+            return compressed.size
+    return os.path.getsize(path)
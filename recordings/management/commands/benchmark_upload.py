@@ -0,0 +1,117 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which compares throughput of receiving a recording with Django upload handlers
+followed by separate reads of the file (WAV header when validating, SHA-256 in the worker) and with single-pass
+RecordingUploadHandler. Multipart body of a synthetic WAV file is parsed, the file is saved to storage
+(in a temporary MEDIA_ROOT) and hashed.
+
+usage: python manage.py benchmark_upload [--size-mb 200] [--repeat 3]
+"""
+import math
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import load_handler
+from django.core.management import BaseCommand
+from django.http.multipartparser import MultiPartParser
+from django.test import override_settings
+
+from analysis.cache import file_sha256
+from analysis.management.commands.benchmark_model_upload import write_synthetic_wav
+from recordings.handlers import RecordingUploadHandler
+from recordings.models import Recording
+from recordings.wav import read_wav_info
+
+BOUNDARY = 'BenchmarkBoundary'
+
+
+def write_multipart_body(path: str, wav_path: str):
+    """Writes multipart/form-data request body with the WAV file as field 'file'"""
+    with open(path, 'wb') as body, open(wav_path, 'rb') as wav:
+        body.write(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="name"\r\n\r\nbenchmark.wav\r\n'
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="benchmark.wav"\r\n'
+            f'Content-Type: audio/wav\r\n\r\n'.encode()
+        )
+        while block := wav.read(1024 * 1024):
+            body.write(block)
+        body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+
+
+class Command(BaseCommand):
+    """Django command which measures upload of a recording with default and single-pass upload handling"""
+    help = "Compares throughput of default upload handlers + separate reads and single-pass RecordingUploadHandler"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=200, help="Size of synthetic recording")
+        parser.add_argument('--repeat', type=int, default=3, help="Number of measured runs (best one is reported)")
+
+    def _receive(self, body_path: str, single_pass: bool) -> str:
+        handlers = [load_handler(handler) for handler in settings.FILE_UPLOAD_HANDLERS]
+        if single_pass:
+            handlers.insert(0, RecordingUploadHandler())
+        meta = {
+            'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+            'CONTENT_LENGTH': os.path.getsize(body_path),
+        }
+        with open(body_path, 'rb') as body:
+            _, files = MultiPartParser(meta, body, handlers).parse()
+        file = files['file']
+        try:
+            if single_pass:
+                info, audio_hash = file.wav_info, file.audio_hash
+                name = default_storage.save(Recording.file.field.generate_filename(None, file.name), file)
+            else:
+                # previous flow - header read when validating, the whole file once more when hashing in the worker
+                info = read_wav_info(file)
+                name = default_storage.save(Recording.file.field.generate_filename(None, file.name), file)
+                audio_hash = file_sha256(default_storage.path(name))
+        finally:
+            file.close()
+        assert info is not None and audio_hash
+        default_storage.delete(name)
+        return audio_hash
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory, override_settings(MEDIA_ROOT=directory):
+            wav_path = os.path.join(directory, 'benchmark.wav')
+            body_path = os.path.join(directory, 'body')
+            write_synthetic_wav(wav_path, options['size_mb'])
+            write_multipart_body(body_path, wav_path)
+            size = os.path.getsize(wav_path)
+            self.stdout.write(f"Upload of {size / 2 ** 20:.1f} MB recording (temporary files of default handlers "
+                              f"in {settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()})")
+
+            hashes = set()
+            for label, single_pass in (("default handlers", False), ("single pass", True)):
+                best = math.inf
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    hashes.add(self._receive(body_path, single_pass))
+                    best = min(best, time.perf_counter() - started)
+                self.stdout.write(f"{label:<20} time: {best:6.2f} s   throughput: {size / 2 ** 20 / best:8.1f} MB/s")
+            assert len(hashes) == 1
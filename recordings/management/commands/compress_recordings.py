@@ -0,0 +1,87 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which compresses WAV files of existing recordings (losslessly, see recordings/lossless.py)
+and reports throughput of the conversion and saved storage. With --report recordings are not compressed, only
+storage used by WAV and compressed files is summarised.
+
+usage: python manage.py compress_recordings [--report] [--batch-size 100]
+"""
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+
+from recordings.lossless import audio_size, is_compressed
+from recordings.models import Recording
+from recordings.tasks import compress_recording
+
+
+def _mb(size: int) -> str:
+    return f"{size / 2 ** 20:.1f} MB"
+
+
+class Command(BaseCommand):
+    """Django command which compresses recordings stored as WAV files and reports saved storage"""
+    help = "Compresses WAV files of recordings losslessly and reports throughput and saved storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report', action='store_true', help="Only report storage, do not compress")
+        parser.add_argument('--batch-size', type=int, default=100, help="Number of recordings loaded at once")
+
+    def _report(self, names: set[str]):
+        counts = {True: 0, False: 0}
+        stored, original = 0, 0
+        for name in names:
+            path = default_storage.path(name)
+            if not os.path.exists(path):
+                continue
+            counts[is_compressed(path)] += 1
+            stored += os.path.getsize(path)
+            original += audio_size(path)
+        self.stdout.write(f"Recordings: {counts[True]} compressed, {counts[False]} WAV files")
+        saved = original - stored
+        self.stdout.write(f"Storage: {_mb(stored)} used, {_mb(original)} as WAV files, {_mb(saved)} saved "
+                          f"({100 * saved / original if original else 0:.1f}%)")
+
+    def handle(self, *args, **options):
+        recordings = Recording.objects.exclude(file='').only('id', 'file')
+        if not options['report']:
+            compressed, original_size, compressed_size, elapsed = 0, 0, 0, 0.0
+            for recording in recordings.iterator(chunk_size=options['batch_size']):
+                started = time.perf_counter()
+                result = compress_recording(recording.id)
+                elapsed += time.perf_counter() - started
+                if result is not None:
+                    compressed += 1
+                    original_size += result['original_size']
+                    compressed_size += result['compressed_size']
+
+            throughput = original_size / 2 ** 20 / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"Compressed {compressed} recordings: {_mb(original_size)} -> {_mb(compressed_size)} "
+                f"in {elapsed:.1f} s ({throughput:.1f} MB/s)"
+            ))
+        # recordings of the same content-addressed audio share the file, compressed files have new names
+        self._report(set(recordings.values_list('file', flat=True)))
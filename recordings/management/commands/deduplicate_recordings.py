@@ -0,0 +1,106 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which moves recordings uploaded before content-addressable storage to it
+(see recordings/storage.py). File of every such recording is hashed and stored once per content. Files of
+recordings directory referenced by no RecordingAudio and no Recording (left by rolled back uploads, replaced
+by compressed files or moved to content-addressable storage, including the duplicates) are deleted, unless they
+were modified in the last RECORDING_UPLOAD_EXPIRY hours (their upload may not be committed yet, analysis queued
+with their path may not have read them yet) - files moved by one run are deleted by a run after the expiry.
+Reports number of deduplicated files and freed storage.
+
+usage: python manage.py deduplicate_recordings [--batch-size 100]
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from analysis.cache import file_sha256
+from recordings.lossless import audio_size
+from recordings.models import Recording, RecordingAudio
+from recordings.storage import store_audio
+
+
+def _mb(size: int) -> str:
+    return f"{size / 2 ** 20:.1f} MB"
+
+
+class Command(BaseCommand):
+    """Django command which moves recordings with their own files to content-addressable storage"""
+    help = "Moves recordings to content-addressable storage, deletes unreferenced files and reports freed storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Number of recordings loaded at once")
+
+    def _delete_orphans(self) -> int:
+        directory = RecordingAudio.file.field.upload_to
+        if not default_storage.exists(directory):
+            return 0
+        written_before = timezone.now() - timedelta(hours=settings.RECORDING_UPLOAD_EXPIRY)
+        names = [f'{directory}/{name}' for name in default_storage.listdir(directory)[1]
+                 if default_storage.get_modified_time(f'{directory}/{name}') < written_before]
+        referenced = set(RecordingAudio.objects.filter(file__in=names).values_list('file', flat=True))
+        referenced.update(Recording.objects.filter(file__in=names).values_list('file', flat=True))
+        freed = 0
+        for name in names:
+            # checked again, the file may have been referenced since (e.g. stored again by an upload)
+            if name in referenced or RecordingAudio.objects.filter(file=name).exists() or \
+                    Recording.objects.filter(file=name).exists():
+                continue
+            freed += default_storage.size(name)
+            default_storage.delete(name)
+        return freed
+
+    def handle(self, *args, **options):
+        recordings = Recording.objects.filter(audio__isnull=True).exclude(file='').only('id', 'file')
+        moved, duplicates, freed, freed_audio = 0, 0, 0, 0
+        for recording in recordings.iterator(chunk_size=options['batch_size']):
+            path = recording.file.path
+            if not os.path.exists(path):
+                continue
+            # compressed file is smaller than the audio it holds
+            size, decoded_size = os.path.getsize(path), audio_size(path)
+            with transaction.atomic():
+                # analyses queued with the path of the file still read it, it is deleted by the sweep of orphans
+                # RECORDING_UPLOAD_EXPIRY hours later
+                audio, created = store_audio(file_sha256(path), path, remove_source=False)
+                Recording.objects.filter(id=recording.id).update(audio=audio, file=audio.file.name)
+            os.utime(path)
+            if created:
+                moved += 1
+            else:
+                duplicates += 1
+                freed += size
+                freed_audio += decoded_size
+
+        orphans = self._delete_orphans()
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} recordings to content-addressable storage, replaced {duplicates} duplicates "
+            f"({_mb(freed)} stored, {_mb(freed_audio)} as WAV files, deleted after RECORDING_UPLOAD_EXPIRY), "
+            f"deleted {_mb(orphans)} of unreferenced files"
+        ))
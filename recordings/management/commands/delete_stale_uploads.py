@@ -0,0 +1,40 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which deletes resumable uploads of recordings (and their part files) which have not
+received a chunk for RECORDING_UPLOAD_EXPIRY hours.
+
+usage: python manage.py delete_stale_uploads
+"""
+from django.core.management import BaseCommand
+
+from recordings.uploads import delete_stale_uploads
+
+
+class Command(BaseCommand):
+    """Django command which deletes abandoned resumable uploads"""
+    help = "Deletes resumable uploads of recordings not continued for RECORDING_UPLOAD_EXPIRY hours"
+
+    def handle(self, *args, **options):
+        count = delete_stale_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} stale uploads."))
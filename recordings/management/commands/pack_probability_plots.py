@@ -0,0 +1,56 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Custom command which converts probability plots of recordings analysed before binary storage
+(JSON list of frames in probability_plot) to packed binary frames (probability_frames) and builds
+their downsampled pyramid.
+
+usage: python manage.py pack_probability_plots [--batch-size 100]
+"""
+from django.core.management import BaseCommand
+
+from recordings.models import Recording
+from recordings.probability import ProbabilityPlot
+from recordings.pyramid import ProbabilityPyramid
+
+
+class Command(BaseCommand):
+    """Django command which moves legacy JSON probability plots to probability_frames"""
+    help = "Converts JSON probability plots to packed binary frames"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Number of recordings loaded at once")
+
+    def handle(self, *args, **options):
+        legacy = Recording.objects.filter(probability_frames__isnull=True, probability_plot__isnull=False)
+        packed = 0
+        for recording in legacy.only('id', 'probability_plot').iterator(chunk_size=options['batch_size']):
+            if not recording.probability_plot:
+                continue
+            plot = ProbabilityPlot.from_frames(recording.probability_plot)
+            # update does not touch latest_analysis_date (auto_now)
+            Recording.objects.filter(id=recording.id).update(
+                probability_frames=plot, probability_pyramid=ProbabilityPyramid.from_plot(plot), probability_plot=None
+            )
+            packed += 1
+        self.stdout.write(self.style.SUCCESS(f"Packed probability plots of {packed} recordings."))
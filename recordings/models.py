@@ -21,17 +21,52 @@ SOFTWARE.
 
 author: Wojciech Nowicki
 
-description: File contains model description of Recording class.
+description: File contains model description of Recording class and its plots.
 
 models:
+    - RecordingQuerySet - Recording queryset able to defer probability plot columns
+    - RecordingAudio - content-addressed audio file shared by Recordings
     - Recording
+    - PlotImage - content-addressed image of a plot
+    - RecordingPlotQuerySet - RecordingPlot queryset loading metadata of plots only
+    - RecordingPlot - statistics plots of Recording, loaded separately from it
+    - RecordingWaveform - waveform peaks of Recording audio
+    - RecordingUpload - resumable chunked upload of Recording
 """
+import uuid
+from typing import Optional
+
 from django.conf import settings
 from django.core.validators import FileExtensionValidator
 from django.db import models
 
+from .probability import ProbabilityPlot, ProbabilityPlotField
+from .pyramid import ProbabilityPyramidField
+from .waveform import WaveformPeaksField
+
+
+class RecordingQuerySet(models.QuerySet):
+    # columns holding frames of probability plot, potentially hundreds of kilobytes per row
+    blob_fields = ('probability_plot', 'probability_frames', 'probability_pyramid')
+
+    def without_blobs(self, *keep: str) -> "RecordingQuerySet":
+        """Defers probability plot columns (except the ones in keep), they are loaded on first access."""
+        return self.defer(*(field for field in self.blob_fields if field not in keep))
+
+
+class RecordingAudio(models.Model):
+    """
+    Audio file stored once under SHA-256 of its WAV bytes and shared by all Recordings uploaded with the same content.
+    Recordings referencing it are its reference count - the file is deleted with the last of them.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to='recordings')
+    created_at = models.DateTimeField(auto_now_add=True)
+
 
 class Recording(models.Model):
+    objects = RecordingQuerySet.as_manager()
+
     uploader = models.ForeignKey(
         to=settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -42,6 +77,14 @@ class Recording(models.Model):
     name = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     latest_analysis_date = models.DateTimeField(auto_now=True, blank=True, null=True)
+    # shared file of recordings with the same content, audio_id (SHA-256) is the key of cached results of ML model;
+    # file is the name of audio.file, recordings uploaded before content-addressed storage have their own files
+    audio = models.ForeignKey(
+        to=RecordingAudio,
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        related_name='recordings')
 
     # main results
     length = models.DurationField(blank=True, null=True)
@@ -93,14 +136,87 @@ class Recording(models.Model):
     # technical details
     similarity_to_training_set = models.FloatField(blank=True, null=True)
 
-    # plots
-    bowell_sounds_per_minute_in_time = models.BinaryField(blank=True, null=True)
-    sound_index_in_time = models.BinaryField(blank=True, null=True)
-    sound_duration_in_time = models.BinaryField(blank=True, null=True)
-    sounds_per_minute_histogram = models.BinaryField(blank=True, null=True)
-    sound_duration_histogram = models.BinaryField(blank=True, null=True)
-    sounds_per_minute_vs_sound_index_scatterplot = models.BinaryField(blank=True, null=True)
-    sounds_per_minute_vs_sound_duration_scatterplot = models.BinaryField(blank=True, null=True)
-    sound_index_vs_duration_scatterplot = models.BinaryField(blank=True, null=True)
-
+    # legacy list of {"start", "probability"} frames, kept for recordings analysed before probability_frames
     probability_plot = models.JSONField(blank=True, null=True)
+    # frames in compact binary form (frame step and packed probabilities), see recordings/probability.py
+    probability_frames = ProbabilityPlotField(blank=True, null=True)
+    # downsampled levels of probability_frames (LTTB), see recordings/pyramid.py
+    probability_pyramid = ProbabilityPyramidField(blank=True, null=True)
+
+    class Meta:
+        # keyset pagination of uploader's recordings (ordered by upload date)
+        indexes = [models.Index(fields=['uploader', 'uploaded_at'], name='recording_uploader_uploaded')]
+
+    def get_probability_plot(self) -> Optional[ProbabilityPlot]:
+        """Returns probability plot, converted from legacy JSON probability_plot if needed."""
+        if self.probability_frames is not None:
+            return self.probability_frames
+        if self.probability_plot:
+            return ProbabilityPlot.from_frames(self.probability_plot)
+        return None
+
+
+class PlotImage(models.Model):
+    """Rendered plot stored under SHA-256 of its bytes, so equal plots of many recordings are stored once."""
+    digest = models.CharField(max_length=64, primary_key=True)
+    content_type = models.CharField(max_length=64)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class RecordingPlotQuerySet(models.QuerySet):
+    def metadata(self) -> "RecordingPlotQuerySet":
+        """Plots with content type of their images, image bytes are not loaded."""
+        return self.select_related('image').only('recording', 'kind', 'updated_at', 'image__content_type')
+
+
+class RecordingPlot(models.Model):
+    """Statistics plot of analysed recording, stored apart from Recording, so its bytes are read only when served."""
+    objects = RecordingPlotQuerySet.as_manager()
+
+    class Kinds(models.TextChoices):
+        bowell_sounds_per_minute_in_time = "bowell_sounds_per_minute_in_time", "bowell_sounds_per_minute_in_time"
+        sound_index_in_time = "sound_index_in_time", "sound_index_in_time"
+        sound_duration_in_time = "sound_duration_in_time", "sound_duration_in_time"
+        sounds_per_minute_histogram = "sounds_per_minute_histogram", "sounds_per_minute_histogram"
+        sound_duration_histogram = "sound_duration_histogram", "sound_duration_histogram"
+        sounds_per_minute_vs_sound_index_scatterplot = (
+            "sounds_per_minute_vs_sound_index_scatterplot", "sounds_per_minute_vs_sound_index_scatterplot"
+        )
+        sounds_per_minute_vs_sound_duration_scatterplot = (
+            "sounds_per_minute_vs_sound_duration_scatterplot", "sounds_per_minute_vs_sound_duration_scatterplot"
+        )
+        sound_index_vs_duration_scatterplot = (
+            "sound_index_vs_duration_scatterplot", "sound_index_vs_duration_scatterplot"
+        )
+
+    recording = models.ForeignKey(to=Recording, on_delete=models.CASCADE, related_name='plots')
+    kind = models.CharField(max_length=64, choices=Kinds.choices)
+    image = models.ForeignKey(to=PlotImage, on_delete=models.PROTECT, related_name='plots')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['recording', 'kind'], name='unique_recording_plot_kind')]
+
+
+class RecordingWaveform(models.Model):
+    """Waveform peaks of recording audio, computed in background after the recording is created."""
+    recording = models.OneToOneField(to=Recording, on_delete=models.CASCADE, related_name='waveform')
+    peaks = WaveformPeaksField()
+    created_at = models.DateTimeField(auto_now=True)
+
+
+class RecordingUpload(models.Model):
+    """Resumable upload of recording sent in chunks, Recording is created when all of its bytes are received."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='recording_uploads')
+    examination = models.ForeignKey(to='examinations.Examination', on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # number of bytes received so far, the next chunk has to start here
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
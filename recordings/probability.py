@@ -0,0 +1,177 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Compact binary representation of probability plot of a recording. Equally spaced frames are stored
+as start of the first frame and frame step together with packed probabilities (float32 or uint8 quantized to 1/255),
+starts of frames which are not equally spaced are stored explicitly (flag 1 set, step 0).
+Layout of stored bytes (little-endian):
+
+    version: uint8 | encoding: uint8 (0 - float32, 1 - uint8) | flags: uint16 | count: uint32 |
+    start: float64 | step: float64 | [starts: count * float64, if flag 1 is set] |
+    probabilities: count * float32 or count * uint8
+
+File consists of:
+    - ProbabilityPlot - frame start, step and probabilities with conversion to/from bytes and frame dictionaries
+    - ProbabilityPlotField - BinaryField storing ProbabilityPlot
+"""
+import struct
+from base64 import b64encode
+from typing import Union
+
+import numpy as np
+from django.conf import settings
+from django.db import models
+
+from analysis.frames import Frames, frames_from_list
+
+VERSION = 1
+HEADER = struct.Struct('<BBHIdd')
+
+FLOAT32 = 'float32'
+UINT8 = 'uint8'
+ENCODINGS = (FLOAT32, UINT8)
+
+UINT8_SCALE = 255
+
+# starts of frames are stored explicitly
+EXPLICIT_STARTS = 1
+# frames are equally spaced when no start differs from start + i * step by more than this fraction of step
+STEP_TOLERANCE = 0.01
+
+
+class ProbabilityPlot:
+    """
+    Probabilities of bowel sound in equally spaced frames starting at start (seconds),
+    frames which are not equally spaced have step 0 and explicit starts.
+    """
+
+    def __init__(self, start: float, step: float, probabilities: np.ndarray, starts: np.ndarray = None):
+        self.start = start
+        self.step = step
+        self.probabilities = probabilities
+        self.explicit_starts = starts
+
+    def __len__(self) -> int:
+        return len(self.probabilities)
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, ProbabilityPlot) and self.start == other.start and self.step == other.step
+            and np.array_equal(self.probabilities, other.probabilities) and np.array_equal(self.starts, other.starts)
+        )
+
+    @property
+    def starts(self) -> np.ndarray:
+        if self.explicit_starts is not None:
+            return self.explicit_starts
+        return self.start + np.arange(len(self.probabilities)) * self.step
+
+    @classmethod
+    def from_frames(cls, frames: Union[Frames, list[dict]]) -> "ProbabilityPlot":
+        """
+        Creates plot from frames. Step is the mean distance between starts of neighbouring frames, when any start
+        differs from its position given by the step by more than STEP_TOLERANCE of step, starts are kept explicitly.
+        """
+        if not isinstance(frames, Frames):
+            frames = frames_from_list(frames)
+        starts, probabilities = frames.starts.astype(np.float64), frames.probabilities.astype(np.float32)
+        start = float(starts[0]) if len(starts) else 0.0
+        if len(starts) < 2:
+            return cls(start, 0.0, probabilities)
+
+        step = float(starts[-1] - start) / (len(starts) - 1)
+        deviation = np.abs(starts - (start + np.arange(len(starts)) * step)).max()
+        if step > 0 and deviation <= STEP_TOLERANCE * step:
+            return cls(start, step, probabilities)
+        return cls(start, 0.0, probabilities, starts=starts)
+
+    def to_frames(self) -> Frames:
+        return Frames(self.starts, self.probabilities.astype(np.float64))
+
+    def to_list(self, indices: np.ndarray = None) -> list[dict]:
+        """Returns frames (only the ones at indices if given) as list of {"start", "probability"} dictionaries."""
+        starts, probabilities = self.starts, self.probabilities
+        if indices is not None:
+            starts, probabilities = starts[indices], probabilities[indices]
+        # starts are rounded, so they are not polluted by floating point error of start + i * step
+        starts = np.round(starts, 6).tolist()
+        probabilities = probabilities.astype(np.float64).round(6).tolist()
+        return [{"start": start, "probability": probability} for start, probability in zip(starts, probabilities)]
+
+    def to_bytes(self, encoding: str = FLOAT32) -> bytes:
+        if encoding == UINT8:
+            payload = np.round(np.clip(self.probabilities, 0, 1) * UINT8_SCALE).astype(np.uint8).tobytes()
+        elif encoding == FLOAT32:
+            payload = self.probabilities.astype('<f4').tobytes()
+        else:
+            raise ValueError(f"Unknown probability plot encoding: {encoding}")
+        flags, starts = 0, b''
+        if self.explicit_starts is not None:
+            flags, starts = EXPLICIT_STARTS, self.explicit_starts.astype('<f8').tobytes()
+        header = HEADER.pack(VERSION, ENCODINGS.index(encoding), flags, len(self.probabilities), self.start, self.step)
+        return header + starts + payload
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ProbabilityPlot":
+        version, encoding, flags, count, start, step = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"Unsupported probability plot version: {version}")
+        offset, starts = HEADER.size, None
+        if flags & EXPLICIT_STARTS:
+            starts = np.frombuffer(data, dtype='<f8', count=count, offset=offset).astype(np.float64)
+            offset += starts.nbytes
+        if ENCODINGS[encoding] == UINT8:
+            probabilities = np.frombuffer(data, dtype=np.uint8, count=count, offset=offset)
+            probabilities = probabilities.astype(np.float32) / UINT8_SCALE
+        else:
+            probabilities = np.frombuffer(data, dtype='<f4', count=count, offset=offset).astype(np.float32)
+        return cls(start, step, probabilities, starts=starts)
+
+
+class ProbabilityPlotField(models.BinaryField):
+    """
+    BinaryField with ProbabilityPlot as Python value. Plots, Frames and lists of frame dictionaries
+    can be saved, they are encoded with PROBABILITY_PLOT_ENCODING.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return ProbabilityPlot.from_bytes(bytes(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, ProbabilityPlot):
+            return value
+        return ProbabilityPlot.from_bytes(super().to_python(value))
+
+    def get_prep_value(self, value):
+        if isinstance(value, (Frames, list)):
+            value = ProbabilityPlot.from_frames(value)
+        if isinstance(value, ProbabilityPlot):
+            value = value.to_bytes(settings.PROBABILITY_PLOT_ENCODING)
+        return super().get_prep_value(value)
+
+    def value_to_string(self, obj):
+        # serialization (dumpdata) - base64 of encoded bytes
+        value = self.value_from_object(obj)
+        return None if value is None else b64encode(self.get_prep_value(value)).decode('ascii')
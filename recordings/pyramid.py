@@ -0,0 +1,179 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Multi-resolution pyramid of probability plot used to return only points which can be drawn
+in the current chart viewport. Each level keeps indices of frames selected with Largest-Triangle-Three-Buckets
+(LTTB) downsampling, which preserves peaks of the curve much better than taking every n-th frame. Levels have
+PYRAMID_BASE * PYRAMID_FACTOR ** n points and are built once, when analysis results are saved. Probabilities
+are taken from the full plot, so only indices are stored (little-endian):
+
+    version: uint8 | reserved: uint8 | levels: uint16 | levels * (count: uint32 | indices: count * uint32)
+
+File consists of:
+    - lttb - indices of points selected with LTTB downsampling
+    - ProbabilityPyramid - indices of frames of each level with conversion to/from bytes
+    - ProbabilityPyramidField - BinaryField storing ProbabilityPyramid
+    - select_indices - frames of plot within time range, downsampled to requested resolution
+"""
+import math
+import struct
+from typing import Optional
+
+import numpy as np
+from django.db import models
+
+from .probability import ProbabilityPlot
+
+VERSION = 1
+HEADER = struct.Struct('<BBH')
+LEVEL_HEADER = struct.Struct('<I')
+
+PYRAMID_BASE = 500
+PYRAMID_FACTOR = 4
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Returns indices of threshold points selected with Largest-Triangle-Three-Buckets. First and last point
+    are always kept, from every bucket in between the point forming the largest triangle with the previously
+    selected point and the average of the next bucket is taken.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # buckets of points between the first and the last one, bucket i is bounds[i]:bounds[i + 1]
+    bounds = 1 + (np.arange(threshold - 1) * (n - 2) // (threshold - 2))
+    counts = np.diff(bounds)
+    # average of the next bucket for every bucket, the last bucket is followed by the last point
+    next_x = np.append((np.add.reduceat(x[:n - 1], bounds[:-1]) / counts)[1:], x[-1])
+    next_y = np.append((np.add.reduceat(y[:n - 1], bounds[:-1]) / counts)[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        low, high = bounds[i], bounds[i + 1]
+        # doubled triangle area, constant factor does not change the argmax
+        area = np.abs((x[a] - next_x[i]) * (y[low:high] - y[a]) - (x[a] - x[low:high]) * (next_y[i] - y[a]))
+        a = low + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+class ProbabilityPyramid:
+    """Levels of downsampled probability plot (indices of its frames), from the coarsest to the finest."""
+
+    def __init__(self, levels: list[np.ndarray]):
+        self.levels = levels
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, ProbabilityPyramid) and len(self.levels) == len(other.levels)
+            and all(np.array_equal(a, b) for a, b in zip(self.levels, other.levels))
+        )
+
+    @classmethod
+    def from_plot(cls, plot: ProbabilityPlot) -> "ProbabilityPyramid":
+        """Builds levels which are at least PYRAMID_FACTOR times smaller than the plot itself."""
+        x = np.arange(len(plot))
+        levels = []
+        points = PYRAMID_BASE
+        while points * PYRAMID_FACTOR <= len(plot):
+            levels.append(lttb(x, plot.probabilities, points).astype(np.uint32))
+            points *= PYRAMID_FACTOR
+        return cls(levels)
+
+    def to_bytes(self) -> bytes:
+        parts = [HEADER.pack(VERSION, 0, len(self.levels))]
+        for level in self.levels:
+            parts.append(LEVEL_HEADER.pack(len(level)))
+            parts.append(level.astype('<u4').tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ProbabilityPyramid":
+        version, _, count = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"Unsupported probability pyramid version: {version}")
+        levels, offset = [], HEADER.size
+        for _ in range(count):
+            (points,) = LEVEL_HEADER.unpack_from(data, offset)
+            offset += LEVEL_HEADER.size
+            levels.append(np.frombuffer(data, dtype='<u4', count=points, offset=offset))
+            offset += points * 4
+        return cls(levels)
+
+
+class ProbabilityPyramidField(models.BinaryField):
+    """BinaryField with ProbabilityPyramid as Python value."""
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return ProbabilityPyramid.from_bytes(bytes(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, ProbabilityPyramid):
+            return value
+        return ProbabilityPyramid.from_bytes(super().to_python(value))
+
+    def get_prep_value(self, value):
+        if isinstance(value, ProbabilityPyramid):
+            value = value.to_bytes()
+        return super().get_prep_value(value)
+
+
+def _frame_range(plot: ProbabilityPlot, start: Optional[float], end: Optional[float]) -> tuple[int, int]:
+    """Returns indices of the first and after the last frame starting within [start, end] seconds."""
+    if plot.step <= 0:
+        # frames are not equally spaced, their starts are searched
+        first = 0 if start is None else int(np.searchsorted(plot.starts, start, side='left'))
+        last = len(plot) if end is None else int(np.searchsorted(plot.starts, end, side='right'))
+        return first, max(first, last)
+    # rounding avoids floating point error of division, e.g. 100 / 0.01 = 10000.000000000002
+    first = 0 if start is None else max(math.ceil(round((start - plot.start) / plot.step, 6)), 0)
+    last = len(plot) if end is None else min(math.floor(round((end - plot.start) / plot.step, 6)) + 1, len(plot))
+    return first, max(first, last)
+
+
+def select_indices(plot: ProbabilityPlot, pyramid: Optional[ProbabilityPyramid], resolution: Optional[int] = None,
+                   start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+    """
+    Returns indices of frames of plot starting within [start, end] seconds. Without resolution all of them
+    are returned (full detail), otherwise at most resolution points - the coarsest pyramid level with enough
+    points in range is downsampled further with LTTB (the full plot is used when there is no such level).
+    """
+    first, last = _frame_range(plot, start, end)
+    indices = np.arange(first, last)
+    if resolution is not None and last - first > resolution:
+        for level in pyramid.levels if pyramid is not None else []:
+            low, high = np.searchsorted(level, [first, last])
+            if high - low >= resolution:
+                # the first and the last frame of range are kept, so the curve reaches edges of the viewport
+                indices = np.unique(np.concatenate(([first], level[low:high], [last - 1]))).astype(np.int64)
+                break
+        indices = indices[lttb(indices, plot.probabilities[indices], resolution)]
+    return indices
@@ -26,19 +26,36 @@ from Recording model which can be used to perform different operations on partic
 
 custom serializer fields:
     - ExaminationsFilteredPrimaryKeyRelatedField - logged user related examinations
+    - ProbabilityPlotListField - probability plot as list of frames, written frames are packed into binary columns
 
 serializers:
     - RecordingCreateSerializer - recording creation
     - RecordingAfterAnalysisSerializer - full recording model definition also used for update
     - RecordingBeforeAnalysisSerializer - quick summary of object
     - ListRecordingsBeforeAnalysisSerializer - list of uploaded recordings
+    - ProbabilityPlotWindowSerializer - query parameters of probability plot (resolution and time range)
+    - WaveformWindowSerializer - query parameters of waveform peaks (resolution and time range)
+    - RecordingUploadSerializer - resumable upload of recording (start and state)
+    - RecordingPlotSerializer - metadata of statistics plot of recording
 """
+from typing import Optional
 
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
 
 from examinations.models import Examination
 from examinations.serializers import ExaminationDetailSerializer
-from .models import Recording
+from .handlers import RecordingUploadedFile
+from .models import Recording, RecordingPlot, RecordingUpload
+from .probability import ProbabilityPlot
+from .pyramid import ProbabilityPyramid, select_indices
+from .storage import store_file
+from .wav import InvalidWav, read_wav_info
+
+WAVEFORM_DEFAULT_RESOLUTION = 2000
+WAVEFORM_MAX_RESOLUTION = 20000
 
 
 class ExaminationsFilteredPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
@@ -52,6 +69,50 @@ class ExaminationsFilteredPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedFi
         return queryset.filter(doctor=request.user)
 
 
+class ProbabilityPlotListField(serializers.Field):
+    """
+    Probability plot as list of {"start", "probability"} frames (JSON compatibility mode of binary
+    probability_frames). Written frames replace probability_frames and its pyramid, null removes the plot.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a list of frames with numeric "start" and "probability".',
+    }
+
+    class Meta:
+        swagger_schema_fields = {'type': 'array', 'items': {'type': 'object'}, 'x-nullable': True}
+
+    def __init__(self, **kwargs):
+        # reads and writes several columns of the recording
+        kwargs.update(source='*', required=False)
+        super().__init__(**kwargs)
+
+    def validate_empty_values(self, data):
+        # values of source='*' field are merged into validated data, so null is a dictionary of empty columns
+        if data is None:
+            return True, {'probability_frames': None, 'probability_pyramid': None, 'probability_plot': None}
+        return super().validate_empty_values(data)
+
+    def to_representation(self, obj) -> Optional[list]:
+        # old recordings still have JSON probability_plot
+        window = self.context.get('probability_plot_window')
+        if not window:
+            return obj.probability_frames.to_list() if obj.probability_frames is not None else obj.probability_plot
+        plot = obj.get_probability_plot()
+        if plot is None:
+            return None
+        return plot.to_list(select_indices(plot, obj.probability_pyramid, **window))
+
+    def to_internal_value(self, data) -> dict:
+        if not isinstance(data, list) or not all(
+                isinstance(frame, dict) and all(isinstance(frame.get(key), (int, float)) and
+                                                not isinstance(frame.get(key), bool)
+                                                for key in ('start', 'probability')) for frame in data):
+            self.fail('invalid')
+        plot = ProbabilityPlot.from_frames(data)
+        return {'probability_frames': plot, 'probability_pyramid': ProbabilityPyramid.from_plot(plot),
+                'probability_plot': None}
+
+
 class RecordingCreateSerializer(serializers.ModelSerializer):
     """Serializer used for creating new recording"""
     examination = ExaminationsFilteredPrimaryKeyRelatedField(queryset=Examination.objects)
@@ -65,6 +126,21 @@ class RecordingCreateSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         return RecordingBeforeAnalysisSerializer(instance).data
 
+    def validate(self, attrs):
+        # corrupt files are rejected before they are saved and analysed
+        file = attrs['file']
+        if isinstance(file, RecordingUploadedFile):
+            # hashed and parsed by RecordingUploadHandler while it was received
+            if file.wav_info is None:
+                raise serializers.ValidationError({'file': [file.wav_error]})
+            attrs['length'] = file.wav_info.length
+            return attrs
+        try:
+            attrs['length'] = read_wav_info(file).length
+        except InvalidWav as e:
+            raise serializers.ValidationError({'file': [str(e)]})
+        return attrs
+
     def create(self, validated_data):
         examination = validated_data.get('examination')
         if examination.recording is not None:
@@ -72,10 +148,14 @@ class RecordingCreateSerializer(serializers.ModelSerializer):
                 {'detail': 'Another recording has already been assigned to chosen examination.'})
         else:
             validated_data['uploader'] = self._user
-            instance = super().create(validated_data)
-            examination.recording = instance
-            examination.status = Examination.Statuses.file_uploaded
-            examination.save()
+            with transaction.atomic():
+                # the same content is stored once, the recording references the stored file
+                audio = store_file(validated_data['file'])
+                validated_data.update(audio=audio, file=audio.file.name)
+                instance = super().create(validated_data)
+                examination.recording = instance
+                examination.status = Examination.Statuses.file_uploaded
+                examination.save()
         return instance
 
     class Meta:
@@ -86,10 +166,43 @@ class RecordingCreateSerializer(serializers.ModelSerializer):
 class RecordingAfterAnalysisSerializer(serializers.ModelSerializer):
     """Serializer for recording representation and updates"""
     uploader = serializers.PrimaryKeyRelatedField(read_only=True)
+    probability_plot = ProbabilityPlotListField()
+    plots = serializers.SerializerMethodField()
+
+    def get_plots(self, obj) -> list[dict]:
+        # plots available at /api/recordings/<id>/plots/<kind>/, their bytes are not loaded
+        return RecordingPlotSerializer(obj.plots.metadata().order_by('kind'), many=True).data
 
     class Meta:
         model = Recording
-        exclude = ('file', 'name')
+        exclude = ('file', 'name', 'audio', 'probability_frames', 'probability_pyramid')
+
+
+class RecordingPlotSerializer(serializers.ModelSerializer):
+    """Serializer for metadata of recording plot (without the image itself)"""
+    digest = serializers.CharField(source='image_id')
+    content_type = serializers.CharField(source='image.content_type')
+    url = serializers.SerializerMethodField()
+
+    def get_url(self, obj) -> str:
+        # url with digest of the image, responses to it are cached by browsers for a long time
+        return f"{reverse('recordings-plot', args=[obj.recording_id, obj.kind])}?v={obj.image_id}"
+
+    class Meta:
+        model = RecordingPlot
+        fields = ('kind', 'digest', 'content_type', 'updated_at', 'url')
+
+
+class ProbabilityPlotWindowSerializer(serializers.Serializer):
+    """Query parameters selecting part of probability plot (time range in seconds) and number of its points"""
+    resolution = serializers.IntegerField(min_value=3, required=False)
+    start = serializers.FloatField(min_value=0, required=False)
+    end = serializers.FloatField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': 'End of range has to be after its start.'})
+        return attrs
 
 
 class RecordingBeforeAnalysisSerializer(serializers.ModelSerializer):
@@ -109,10 +222,46 @@ class ListRecordingsBeforeAnalysisSerializer(serializers.ModelSerializer):
     examination = serializers.SerializerMethodField('get_examinations')
 
     def get_examinations(self, obj):
-        if obj.examination_set.first():
-            return ExaminationDetailSerializer(obj.examination_set.first()).data
+        # examinations are prefetched with their patients by RecordingViewSet, first() would query each of them again
+        examination = next(iter(obj.examination_set.all()), None)
+        if examination is not None:
+            return ExaminationDetailSerializer(examination).data
         return None
 
     class Meta:
         model = Recording
         fields = ('id', 'file', 'name', 'uploaded_at', 'examination', 'uploader')
+
+
+class WaveformWindowSerializer(ProbabilityPlotWindowSerializer):
+    """Query parameters selecting time range of waveform and maximum number of its peaks"""
+    resolution = serializers.IntegerField(min_value=1, max_value=WAVEFORM_MAX_RESOLUTION,
+                                          default=WAVEFORM_DEFAULT_RESOLUTION)
+
+
+class RecordingUploadSerializer(serializers.ModelSerializer):
+    """Serializer used for starting resumable upload of recording and checking its offset"""
+    examination = ExaminationsFilteredPrimaryKeyRelatedField(queryset=Examination.objects)
+    name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_name(self, value):
+        if not value.lower().endswith('.wav'):
+            raise serializers.ValidationError('Only .wav recordings can be uploaded.')
+        return value
+
+    def validate_size(self, value):
+        if value > settings.RECORDING_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Recording can not be larger than {settings.RECORDING_UPLOAD_MAX_SIZE} bytes.')
+        return value
+
+    def validate_examination(self, value):
+        if value.recording is not None:
+            raise serializers.ValidationError('Another recording has already been assigned to chosen examination.')
+        return value
+
+    class Meta:
+        model = RecordingUpload
+        fields = ('id', 'name', 'examination', 'size', 'offset', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'offset', 'created_at', 'updated_at')
@@ -0,0 +1,59 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Signal handlers of recordings app, connected in RecordingsConfig.ready.
+
+File consists of:
+    - schedule_waveform - starts computing waveform peaks of every created recording
+    - schedule_compression - starts lossless compression of every created recording
+    - release_recording_audio - deletes stored audio of deleted recording when no other recording references it
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Recording
+from .storage import release_audio
+from .tasks import compress_recording, compute_waveform
+
+
+@receiver(post_save, sender=Recording, dispatch_uid='recordings_schedule_waveform')
+def schedule_waveform(sender, instance: Recording, created: bool, **kwargs):
+    # task is sent after commit, so the worker finds the recording and its file
+    if created and instance.file:
+        transaction.on_commit(lambda: compute_waveform.delay(instance.id))
+
+
+@receiver(post_save, sender=Recording, dispatch_uid='recordings_schedule_compression')
+def schedule_compression(sender, instance: Recording, created: bool, **kwargs):
+    # waveform task reads the WAV file at the same time, it is decoded on demand if it starts later
+    if created and instance.file and settings.RECORDING_COMPRESSION:
+        transaction.on_commit(lambda: compress_recording.delay(instance.id))
+
+
+@receiver(post_delete, sender=Recording, dispatch_uid='recordings_release_audio')
+def release_recording_audio(sender, instance: Recording, **kwargs):
+    # after commit the deleted recording is no longer a reference, recordings with their own files keep them
+    if instance.audio_id:
+        transaction.on_commit(lambda: release_audio(instance.audio_id))
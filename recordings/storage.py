@@ -0,0 +1,120 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Content-addressable storage of recording audio. File of an uploaded recording is stored once
+as recordings/<SHA-256>.wav (RecordingAudio, .flac when it is compressed) and referenced by every Recording
+uploaded with the same content, a duplicate upload is dropped instead of being written to storage. Recordings
+referencing RecordingAudio are its reference count - the file is deleted when the last of them is deleted.
+RecordingAudio row is locked while a reference is added or the file is deleted, so a file is never deleted under
+an upload starting to reference it.
+Source file of stored audio is linked into storage and removed only when the transaction is committed, after
+a rollback it can be stored again (file left in storage without RecordingAudio is deleted by deduplicate_recordings).
+
+File consists of:
+    - get_audio_name - storage name of audio with given SHA-256
+    - store_audio - links local file into storage (or drops it when its content is stored already)
+    - store_file - stores uploaded file, hashing it if it was not hashed during upload
+    - release_audio - deletes audio and its file when no recording references it
+"""
+import hashlib
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .handlers import RecordingUploadedFile
+from .lossless import get_compressed_name, is_compressed
+from .models import RecordingAudio
+
+
+def get_audio_name(digest: str, compressed: bool = False) -> str:
+    name = f'{RecordingAudio.file.field.upload_to}/{digest}.wav'
+    return get_compressed_name(name) if compressed else name
+
+
+def _link(source_path: str, path: str):
+    # hard link shares bytes of the file (copy is made only on file systems without links), temporary name
+    # and rename replace a file left in storage by a rolled back transaction
+    temporary_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        os.link(source_path, temporary_path)
+    except OSError:
+        shutil.copyfile(source_path, temporary_path)
+    os.replace(temporary_path, path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def store_audio(digest: str, source_path: str, remove_source: bool = True) -> tuple[RecordingAudio, bool]:
+    """
+    Returns RecordingAudio of given SHA-256 and whether it was created. New audio gets the file at source_path
+    (linked, not copied). File at source_path is deleted when the transaction is committed, unless remove_source
+    is False. Has to be called in the transaction which creates the referencing Recording - the audio stays locked
+    until it ends.
+    """
+    audio, created = RecordingAudio.objects.select_for_update().get_or_create(
+        digest=digest, defaults={'file': get_audio_name(digest, compressed=is_compressed(source_path))}
+    )
+    if created:
+        path = default_storage.path(audio.file.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _link(source_path, path)
+    if remove_source:
+        transaction.on_commit(lambda: _remove(source_path))
+    return audio, created
+
+
+def store_file(file: File) -> RecordingAudio:
+    """Stores uploaded recording (in a transaction, see store_audio). RecordingUploadedFile is hashed already."""
+    if isinstance(file, RecordingUploadedFile):
+        return store_audio(file.audio_hash, file.temporary_file_path())[0]
+
+    path = os.path.join(settings.MEDIA_ROOT, settings.RECORDING_UPLOAD_DIR, f'{uuid.uuid4().hex}.part')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    with open(path, 'wb') as part:
+        for chunk in file.chunks():
+            part.write(chunk)
+            digest.update(chunk)
+    return store_audio(digest.hexdigest(), path)[0]
+
+
+def release_audio(digest: str) -> bool:
+    """Deletes audio and its file if no recording references it. Returns whether it was deleted."""
+    with transaction.atomic():
+        audio = RecordingAudio.objects.select_for_update().filter(digest=digest).first()
+        if audio is None or audio.recordings.exists():
+            return False
+        audio.delete()
+        # file is deleted while the row is locked, an upload of the same content waits and stores it again
+        default_storage.delete(audio.file.name)
+    return True
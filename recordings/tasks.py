@@ -0,0 +1,113 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Celery tasks of recordings app (discovered by Celery app in analysis/celery.py).
+
+File consists of:
+    - compute_waveform - computes waveform peaks of uploaded recording
+    - compress_recording - replaces WAV file of recording with its lossless compressed version (FLAC file)
+"""
+import os
+import uuid
+import wave
+from typing import Optional
+
+from celery.utils.log import get_task_logger
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from analysis.celery import app
+from .lossless import COMPRESSED_EXTENSION, compress_wav, get_compressed_name
+from .models import Recording, RecordingAudio, RecordingWaveform
+from .waveform import WaveformPeaks
+
+logger = get_task_logger(__name__)
+
+
+@app.task
+def compute_waveform(recording_id: int):
+    """
+    Celery task which reads audio of recording once and stores its waveform peaks.
+
+    :param recording_id: ID of the uploaded recording
+    """
+    recording = Recording.objects.without_blobs().get(id=recording_id)
+    # recordings of the same stored audio have the same waveform
+    shared = RecordingWaveform.objects.filter(recording__audio_id=recording.audio_id).first() \
+        if recording.audio_id else None
+    if shared is not None:
+        RecordingWaveform.objects.update_or_create(recording=recording, defaults={'peaks': shared.peaks})
+        logger.info(f"Copied waveform of recording {shared.recording_id} to recording {recording_id}")
+        return
+    try:
+        peaks = WaveformPeaks.from_wav(recording.file.path)
+    except (wave.Error, EOFError, KeyError) as e:
+        # KeyError - sample width not supported by WaveformPeaks
+        logger.warning(f"Waveform of recording {recording_id} can not be computed: {e!r}")
+        return
+    RecordingWaveform.objects.update_or_create(recording=recording, defaults={'peaks': peaks})
+    logger.info(f"Computed waveform of recording {recording_id} ({len(peaks.levels)} levels)")
+
+
+@app.task
+def compress_recording(recording_id: int) -> Optional[dict]:
+    """
+    Celery task which replaces WAV file of recording with its lossless compressed version (FLAC) stored under
+    the name with COMPRESSED_EXTENSION, all recordings sharing the file are updated. Replaced file is left for
+    the sweep of deduplicate_recordings. Files which do not get smaller (and 32-bit recordings, which FLAC does
+    not support) are kept as they are.
+
+    :param recording_id: ID of the uploaded recording
+    :return: sizes of WAV file and compressed file, None if the recording was not compressed
+    """
+    name = Recording.objects.filter(id=recording_id).values_list('file', flat=True).first()
+    if not name or name.endswith(COMPRESSED_EXTENSION):
+        return None
+    path = default_storage.path(name)
+    part_path = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        original_size = os.path.getsize(path)
+        compressed_size = compress_wav(path, part_path)
+        if compressed_size >= original_size:
+            os.remove(part_path)
+            return None
+    except (ValueError, OSError, RuntimeError) as e:
+        # ValueError - not a supported WAV file (InvalidWav), 32-bit samples or the compressed file is not restored
+        # exactly, RuntimeError - error of libsndfile
+        logger.warning(f"Recording {recording_id} can not be compressed: {e!r}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
+
+    compressed_name = get_compressed_name(name)
+    os.replace(part_path, default_storage.path(compressed_name))
+    with transaction.atomic():
+        # an upload referencing the content-addressed audio holds its lock, its recording is updated after it commits
+        list(RecordingAudio.objects.select_for_update().filter(file=name))
+        RecordingAudio.objects.filter(file=name).update(file=compressed_name)
+        Recording.objects.filter(file=name).update(file=compressed_name)
+    # analyses queued with path of the WAV file still read it, it is deleted by deduplicate_recordings
+    # RECORDING_UPLOAD_EXPIRY hours after it was replaced
+    os.utime(path)
+    logger.info(f"Compressed recording {recording_id}: {original_size} -> {compressed_size} bytes")
+    return {'original_size': original_size, 'compressed_size': compressed_size}
@@ -23,12 +23,16 @@ author: Wojciech Nowicki, Hubert Decyusz
 
 description: File contains tests used for recordings app testing.
 """
+import io
 import os
 import shutil
+import wave
 from pathlib import Path
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -44,6 +48,20 @@ TEST_FILES_DIR = os.path.join(settings.BASE_DIR.parent, 'test_files')
 User = get_user_model()
 
 
+def make_wav(seconds: float = 1.5, sample_rate: int = 8000) -> bytes:
+    """Silent 16-bit mono WAV file"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(2 * int(seconds * sample_rate)))
+    return buffer.getvalue()
+
+
+WAV = make_wav()
+
+
 class TestRecordingsAPIViews(TestCase):
     def setUp(self):
         # recreate data on each run
@@ -93,7 +111,7 @@ class TestRecordingsAPIViews(TestCase):
         self._require_jwt_cookies(self.user1)
 
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'xd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -108,7 +126,7 @@ class TestRecordingsAPIViews(TestCase):
         self._require_jwt_cookies(self.user1)
 
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'xd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -120,6 +138,36 @@ class TestRecordingsAPIViews(TestCase):
         file = Recording.objects.get(name="fart.wav")
         self.assertEqual(response.json(), RecordingBeforeAnalysisSerializer(file).data)
 
+    def test_create_recording_length(self):
+        self._require_jwt_cookies(self.user1)
+
+        with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
+            fp.write(make_wav(seconds=2.5))
+            fp.seek(0)
+            response = self.client.post("/api/recordings/", {
+                'file': fp,
+                'name': 'fart.wav',
+                'examination': self.exam1.id
+            }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Recording.objects.get(name="fart.wav").length, timedelta(seconds=2.5))
+
+    def test_create_recording_invalid_wav(self):
+        self._require_jwt_cookies(self.user1)
+
+        for content in (b'xd', WAV[:-100], make_wav(sample_rate=4000)):
+            with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
+                fp.write(content)
+                fp.seek(0)
+                response = self.client.post("/api/recordings/", {
+                    'file': fp,
+                    'name': 'fart.wav',
+                    'examination': self.exam1.id
+                }, format="multipart")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('file', response.json())
+        self.assertFalse(Recording.objects.filter(name='fart.wav').exists())
+
     def test_create_recording_empty(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
@@ -135,7 +183,7 @@ class TestRecordingsAPIViews(TestCase):
         self._require_jwt_cookies(self.user1)
 
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'xd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -147,7 +195,7 @@ class TestRecordingsAPIViews(TestCase):
         self._require_jwt_cookies(self.user1)
 
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'esd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -157,7 +205,7 @@ class TestRecordingsAPIViews(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
         with open(f'{TEST_FILES_DIR}/test1.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -189,7 +237,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_list_recordings(self):
         self._require_jwt_cookies(user=self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'xd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -201,7 +249,7 @@ class TestRecordingsAPIViews(TestCase):
         exam2 = Examination.objects.create(doctor=self.user1, date=timezone.now() + timedelta(days=1))
 
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'xd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -212,6 +260,26 @@ class TestRecordingsAPIViews(TestCase):
         response = self.client.get("/api/recordings/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_recordings_query_count(self):
+        self._require_jwt_cookies(user=self.user1)
+        patient = User.objects.create_user(email="patient43@gmail.com", password="test1", first_name="",
+                                           last_name="", type=User.Types.PATIENT)
+        for _ in range(10):
+            recording = Recording.objects.create(uploader=self.user1, name='fart.wav')
+            Examination.objects.create(doctor=self.user1, patient=patient, recording=recording,
+                                       date=timezone.now() + timedelta(days=1))
+
+        counts = []
+        for limit in (2, 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f"/api/recordings/?limit={limit}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.json()['results']), limit)
+            self.assertEqual(response.json()['results'][0]['examination']['patient']['id'], patient.id)
+            counts.append(len(queries))
+        # examinations and their patients are prefetched - number of queries does not depend on page size
+        self.assertEqual(counts[0], counts[1])
+
     def test_list_current_recordings(self):
         self._require_jwt_cookies(user=self.user1)
         response = self.client.get("/api/recordings/")
@@ -220,7 +288,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_update_recording_file_one_attribute(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -242,7 +310,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_update_recording_file_two_attributes(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -266,7 +334,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_update_recording_file_multiple_attributes(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -300,7 +368,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_update_recording_file_wrong_attribute_type(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -322,7 +390,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_update_recording_file_one_wrong_attribute_type(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -343,7 +411,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_update_recording_file_wrong_attribute_chosen(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -364,7 +432,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_delete_recording(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
@@ -380,7 +448,7 @@ class TestRecordingsAPIViews(TestCase):
     def test_delete_the_same_recording_twice(self):
         self._require_jwt_cookies(self.user1)
         with open(f'{TEST_FILES_DIR}/test.wav', 'wb+') as fp:
-            fp.write(b'abcd')
+            fp.write(WAV)
             fp.seek(0)
             response = self.client.post("/api/recordings/", {
                 'file': fp,
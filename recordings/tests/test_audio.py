@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of recording audio endpoint with HTTP Range requests.
+"""
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recordings.audio import RangeNotSatisfiable, parse_range
+from recordings.models import Recording
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+AUDIO = bytes(range(100))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestRecordingAudio(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+        cls.other_doctor = User.objects.create_user(email="other@gmail.com", password="test1", first_name="",
+                                                    last_name="", type=User.Types.DOCTOR)
+        cls.recording = Recording.objects.create(name="test.wav", uploader=cls.doctor,
+                                                 file=ContentFile(AUDIO, name="test.wav"))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def _get_audio(self, user=None, **headers):
+        access, refresh = get_tokens_for_user(user=user or self.doctor)
+        self.client.cookies.load({'access': access, 'refresh': refresh})
+        return self.client.get(f"/api/recordings/{self.recording.id}/audio/", **headers)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=90-1000", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertIsNone(parse_range("bytes=0-9,20-29", 100))
+        self.assertIsNone(parse_range("items=0-9", 100))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=100-", 100)
+        # last byte before the first - header is ignored
+        self.assertIsNone(parse_range("bytes=5-3", 100))
+        # empty file has no last bytes
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=-10", 0)
+
+    def test_whole_file(self):
+        response = self._get_audio(HTTP_ACCEPT="audio/wav")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), AUDIO)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(response["Content-Type"], "audio/x-wav")
+
+    def test_range(self):
+        response = self._get_audio(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), AUDIO[10:20])
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(response["Content-Length"], "10")
+
+        response = self._get_audio(HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), AUDIO[-5:])
+
+        response = self._get_audio(HTTP_RANGE="bytes=100-")
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+        response = self._get_audio(HTTP_RANGE="bytes=5-3")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), AUDIO)
+
+    def test_suffix_range_of_empty_file(self):
+        self.recording.file.save("empty.wav", ContentFile(b""))
+        response = self._get_audio(HTTP_RANGE="bytes=-10")
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response["Content-Range"], "bytes */0")
+
+    def test_if_range(self):
+        etag = self._get_audio()["ETag"]
+        response = self._get_audio(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        # file has changed since the client got its part - the whole file is sent
+        response = self._get_audio(HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"changed"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(RECORDING_AUDIO_SENDFILE="x-accel-redirect", RECORDING_AUDIO_ACCEL_PREFIX="/protected/media/")
+    def test_accel_redirect(self):
+        response = self._get_audio(HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/media/{self.recording.file.name}")
+        self.assertEqual(response.content, b"")
+
+    def test_audio_of_other_doctor(self):
+        response = self._get_audio(user=self.other_doctor)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
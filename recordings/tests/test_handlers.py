@@ -0,0 +1,115 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of single-pass upload handler of recordings.
+"""
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import wave
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from examinations.models import Examination
+from recordings.handlers import HEADER_SIZE
+from recordings.models import Recording
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_wav(frames: int, metadata: int = 0) -> bytes:
+    """16-bit mono WAV file, with LIST chunk of metadata bytes before the audio"""
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(os.urandom(2 * frames))
+    data = buffer.getvalue()
+    if metadata:
+        chunk = struct.pack('<4sI', b'LIST', metadata) + bytes(metadata)
+        data = data[:4] + struct.pack('<I', len(data) - 8 + len(chunk)) + data[8:36] + chunk + data[36:]
+    return data
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestRecordingUploadHandler(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        access, refresh = get_tokens_for_user(user=self.doctor)
+        self.client.cookies.load({'access': access, 'refresh': refresh})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def _upload(self, content: bytes):
+        examination = Examination.objects.create(doctor=self.doctor, date=timezone.now() + timedelta(days=1))
+        return self.client.post("/api/recordings/", {
+            'file': SimpleUploadedFile("test.wav", content),
+            'name': 'test.wav',
+            'examination': examination.id
+        }, format="multipart")
+
+    def _temporary_files(self) -> list[str]:
+        return os.listdir(os.path.join(MEDIA_ROOT, settings.RECORDING_UPLOAD_DIR))
+
+    def test_upload(self):
+        # second file has metadata longer than bytes kept for parsing of the header
+        for content in (make_wav(16000), make_wav(8000, metadata=HEADER_SIZE)):
+            response = self._upload(content)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            recording = Recording.objects.get(id=response.json()['id'])
+            self.assertEqual(recording.audio_id, hashlib.sha256(content).hexdigest())
+            with recording.file.open('rb') as file:
+                self.assertEqual(file.read(), content)
+        self.assertEqual(recording.length, timedelta(seconds=1))
+        # temporary file was moved to storage of recordings
+        self.assertEqual(self._temporary_files(), [])
+
+    def test_invalid_file(self):
+        for content in (b'xd', make_wav(8000)[:-10]):
+            response = self._upload(content)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('file', response.json())
+        self.assertFalse(Recording.objects.filter(uploader=self.doctor).exists())
+        self.assertEqual(self._temporary_files(), [])
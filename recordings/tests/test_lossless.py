@@ -0,0 +1,240 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of lossless compressed storage of recordings and reading of compressed recordings.
+"""
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import wave
+from io import BytesIO, StringIO
+from unittest.mock import Mock, patch
+
+import numpy as np
+import soundfile
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from analysis.cache import file_sha256
+from analysis.segmentation import get_duration, write_segment
+from analysis.tasks import process_recording
+from recordings.lossless import compress_wav, is_compressed, open_audio
+from examinations.models import Examination
+from recordings.models import Recording
+from recordings.tasks import compress_recording, compute_waveform
+from recordings.waveform import WaveformPeaks
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+SAMPLE_RATE = 8000
+
+
+def make_wav(frames: int, channels: int = 1, sample_width: int = 2, metadata: bytes = b'') -> bytes:
+    """WAV file with quiet sine and noise, metadata is stored in a LIST chunk after the samples"""
+    rng = np.random.default_rng(0)
+    time = np.arange(frames) / SAMPLE_RATE
+    signal = 0.3 * np.sin(2 * np.pi * 50 * time)[:, None] + 0.01 * rng.standard_normal((frames, channels))
+    if sample_width == 1:
+        data = (signal * 127 + 128).astype(np.uint8).tobytes()
+    elif sample_width == 3:
+        data = (signal * (2 ** 23 - 1)).astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        data = (signal * (2 ** (8 * sample_width - 1) - 1)).astype(f'<i{sample_width}').tobytes()
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(data)
+    content = buffer.getvalue()
+    if metadata:
+        chunk = struct.pack('<4sI', b'LIST', len(metadata)) + metadata + b'\0' * (len(metadata) % 2)
+        content = content[:4] + struct.pack('<I', len(content) - 8 + len(chunk)) + content[8:] + chunk
+    return content
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestLossless(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def _write(self, content: bytes) -> str:
+        path = os.path.join(MEDIA_ROOT, "source.wav")
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_restored_exactly(self):
+        for channels, sample_width in ((1, 1), (2, 1), (1, 2), (2, 2), (1, 3), (2, 3)):
+            with self.subTest(channels=channels, sample_width=sample_width):
+                content = make_wav(20000, channels, sample_width, metadata=b'INFOxyz')
+                path = self._write(content)
+                size = compress_wav(path, path + ".z", block_frames=4096)
+                self.assertLess(size, len(content))
+                # standard FLAC file, samples are decoded by any FLAC decoder
+                with wave.open(BytesIO(content)) as wav:
+                    frames = wav.readframes(wav.getnframes())
+                samples, _ = soundfile.read(path + ".z", dtype='int16' if sample_width == 2 else 'int32')
+                if sample_width == 2:
+                    self.assertEqual(samples.tobytes(), frames)
+                with open_audio(path + ".z") as file:
+                    self.assertEqual(file.read(), content)
+                    # random access across blocks, into the metadata after the samples and past the end
+                    for first, length in ((0, 10), (7000, 30000), (len(content) - 20, 100), (len(content) + 5, 10)):
+                        file.seek(first)
+                        self.assertEqual(file.read(length), content[first:first + length])
+
+    def test_32_bit_not_compressed(self):
+        path = self._write(make_wav(1000, sample_width=4))
+        with self.assertRaises(ValueError):
+            compress_wav(path, path + ".z")
+        self.assertFalse(os.path.exists(path + ".z"))
+
+    def test_compress_recording(self):
+        content = make_wav(5 * SAMPLE_RATE)
+        recording = Recording.objects.create(name="test.wav", uploader=self.doctor,
+                                             file=ContentFile(content, name="test.wav"))
+        wav_path = recording.file.path
+        peaks = WaveformPeaks.from_wav(wav_path)
+
+        result = compress_recording.apply(args=(recording.id,)).get()
+        self.assertEqual(result['original_size'], len(content))
+        # compressed file is not stored under the name of WAV file
+        recording.refresh_from_db()
+        path = recording.file.path
+        self.assertTrue(recording.file.name.endswith('.flac'))
+        self.assertTrue(is_compressed(path))
+        self.assertEqual(os.path.getsize(path), result['compressed_size'])
+        self.assertFalse(any(name.endswith('.part') for name in os.listdir(os.path.dirname(path))))
+        # compressing again does nothing
+        self.assertIsNone(compress_recording.apply(args=(recording.id,)).get())
+
+        # readers get bytes of the WAV file
+        self.assertEqual(file_sha256(path), hashlib.sha256(content).hexdigest())
+        self.assertEqual(get_duration(path), 5)
+        self.assertEqual(WaveformPeaks.from_wav(path).to_bytes(), peaks.to_bytes())
+        segment_path = os.path.join(MEDIA_ROOT, "segment.wav")
+        write_segment(path, 1, 2, segment_path)
+        with wave.open(segment_path, 'rb') as segment:
+            self.assertEqual(segment.getnframes(), SAMPLE_RATE)
+
+        access, refresh = get_tokens_for_user(user=self.doctor)
+        client = APIClient()
+        client.cookies.load({'access': access, 'refresh': refresh})
+        response = client.get(f"/api/recordings/{recording.id}/audio/", HTTP_RANGE="bytes=1000-1999")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Type'], 'audio/x-wav')
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[1000:2000])
+        self.assertIn('Accept', response['Vary'])
+
+        # clients playing FLAC get the compressed file
+        with open(path, 'rb') as file:
+            compressed = file.read()
+        for accept in ('audio/flac', 'audio/wav;q=0.9, audio/x-flac'):
+            response = client.get(f"/api/recordings/{recording.id}/audio/", HTTP_ACCEPT=accept)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'audio/flac')
+            self.assertEqual(b''.join(response.streaming_content), compressed)
+        response = client.get(f"/api/recordings/{recording.id}/audio/", HTTP_ACCEPT="audio/*, audio/flac;q=0")
+        self.assertEqual(response['Content-Type'], 'audio/x-wav')
+
+    @override_settings(CELERY_USE_MOCK_MODEL=False, CELERY_INFERENCE_CACHE=False, CELERY_SEGMENTED_ANALYSIS=True,
+                       CELERY_SEGMENT_LENGTH=10, CELERY_SEGMENT_OVERLAP=2)
+    def test_compressed_during_queued_analysis(self):
+        recording = Recording.objects.create(name="test.wav", uploader=self.doctor,
+                                             file=ContentFile(make_wav(25 * SAMPLE_RATE), name="queued.wav"))
+        examination = Examination.objects.create(doctor=self.doctor, date=timezone.now(), recording=recording)
+        # analysis queued before compression, its segments read the WAV file
+        wav_path = recording.file.path
+        compress_recording.apply(args=(recording.id,)).get()
+
+        client = Mock()
+        client.inference.side_effect = lambda path: {
+            "frames": [{"start": i / 2, "probability": 0.1} for i in range(int(get_duration(path) * 2))]
+        }
+        with patch('analysis.tasks.get_model_client', return_value=client):
+            process_recording.apply(args=(recording.id, wav_path, self.doctor.id)).get()
+        self.assertEqual(client.inference.call_count, 3)
+        examination.refresh_from_db()
+        self.assertEqual(examination.status, Examination.Statuses.processing_succeeded)
+
+        # replaced WAV file is deleted after RECORDING_UPLOAD_EXPIRY
+        call_command("deduplicate_recordings", stdout=StringIO())
+        self.assertTrue(os.path.exists(wav_path))
+        with override_settings(RECORDING_UPLOAD_EXPIRY=-1):
+            call_command("deduplicate_recordings", stdout=StringIO())
+        self.assertFalse(os.path.exists(wav_path))
+        recording.refresh_from_db()
+        self.assertTrue(os.path.exists(recording.file.path))
+
+    def test_not_compressed(self):
+        # not a WAV file, noise which does not get smaller
+        noise = make_wav(0)[:40] + struct.pack('<I', 20000) + os.urandom(20000)
+        for content in (b'xd', noise):
+            recording = Recording.objects.create(name="test.wav", uploader=self.doctor,
+                                                 file=ContentFile(content, name="test.wav"))
+            self.assertIsNone(compress_recording.apply(args=(recording.id,)).get())
+            with open(recording.file.path, 'rb') as file:
+                self.assertEqual(file.read(), content)
+        self.assertFalse(any(name.endswith('.part') for name in os.listdir(os.path.dirname(recording.file.path))))
+
+    def test_command(self):
+        content = make_wav(5 * SAMPLE_RATE)
+        recording = Recording.objects.create(name="test.wav", uploader=self.doctor,
+                                             file=ContentFile(content, name="test.wav"))
+        out = StringIO()
+        call_command("compress_recordings", "--report", stdout=out)
+        self.assertFalse(is_compressed(recording.file.path))
+        self.assertIn("0 compressed", out.getvalue())
+
+        out = StringIO()
+        call_command("compress_recordings", stdout=out)
+        recording.refresh_from_db()
+        self.assertTrue(is_compressed(recording.file.path))
+        self.assertIn("Compressed 1 recordings", out.getvalue())
+        self.assertIn(f"{len(content) / 2 ** 20:.1f} MB as WAV files", out.getvalue())
+
+    @override_settings(RECORDING_COMPRESSION=True)
+    def test_scheduled_after_create(self):
+        with patch.object(compress_recording, "delay") as delay, patch.object(compute_waveform, "delay"), \
+                self.captureOnCommitCallbacks(execute=True):
+            recording = Recording.objects.create(name="new.wav", uploader=self.doctor,
+                                                 file=ContentFile(make_wav(100), name="new.wav"))
+        delay.assert_called_once_with(recording.id)
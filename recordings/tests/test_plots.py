@@ -0,0 +1,113 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of statistics plots endpoints (content-addressed images, conditional requests)
+and of deferred loading of probability plot columns.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from analysis.frames import mock_frames
+from recordings.models import PlotImage, Recording, RecordingPlot
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+
+class TestRecordingPlots(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+        cls.other_doctor = User.objects.create_user(email="other@gmail.com", password="test1", first_name="",
+                                                    last_name="", type=User.Types.DOCTOR)
+        cls.recording = Recording.objects.create(name="test.wav", uploader=cls.doctor,
+                                                 probability_frames=mock_frames(1000))
+        cls.image = PlotImage.objects.create(digest="a" * 64, content_type="image/svg+xml", data=b"<svg></svg>")
+        cls.plot = RecordingPlot.objects.create(recording=cls.recording, kind=RecordingPlot.Kinds.sound_index_in_time,
+                                                image=cls.image)
+
+    def _require_jwt_cookies(self, user) -> None:
+        access, refresh = get_tokens_for_user(user=user)
+        self.client.cookies.load({
+            'access': access,
+            'refresh': refresh,
+        })
+
+    def _plot_url(self, kind: str) -> str:
+        return f"/api/recordings/{self.recording.id}/plots/{kind}/"
+
+    def test_list_plots(self):
+        self._require_jwt_cookies(self.doctor)
+        response = self.client.get(f"/api/recordings/{self.recording.id}/plots/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]["kind"], "sound_index_in_time")
+        self.assertEqual(response.json()[0]["url"], f"{self._plot_url('sound_index_in_time')}?v={self.image.digest}")
+
+        response = self.client.get(f"/api/recordings/{self.recording.id}/")
+        self.assertEqual([plot["digest"] for plot in response.json()["plots"]], [self.image.digest])
+
+    def test_get_plot(self):
+        self._require_jwt_cookies(self.doctor)
+        response = self.client.get(self._plot_url("sound_index_in_time"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b"<svg></svg>")
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertEqual(response["ETag"], f'"{self.image.digest}"')
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        response = self.client.get(self._plot_url("sound_index_in_time"), {"v": self.image.digest})
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(self._plot_url("sound_index_histogram"))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_plot_not_modified(self):
+        self._require_jwt_cookies(self.doctor)
+        since = http_date(self.plot.updated_at.timestamp())
+        for headers in ({"HTTP_IF_NONE_MATCH": f'"{self.image.digest}"'}, {"HTTP_IF_MODIFIED_SINCE": since}):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self._plot_url("sound_index_in_time"), **headers)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response["ETag"], f'"{self.image.digest}"')
+            self.assertFalse(any('"data"' in query["sql"] for query in queries.captured_queries))
+
+    def test_plot_of_other_doctor(self):
+        self._require_jwt_cookies(self.other_doctor)
+        response = self.client.get(self._plot_url("sound_index_in_time"))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_does_not_load_blobs(self):
+        self._require_jwt_cookies(self.doctor)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/recordings/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any("probability_frames" in query["sql"] for query in queries.captured_queries))
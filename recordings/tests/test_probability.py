@@ -0,0 +1,179 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of compact binary probability plot storage and its endpoint.
+"""
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from analysis.frames import mock_frames
+from recordings.models import Recording, RecordingPlot
+from recordings.probability import FLOAT32, UINT8, UINT8_SCALE, ProbabilityPlot
+from recordings.serializers import RecordingAfterAnalysisSerializer
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+
+class TestProbabilityPlot(TestCase):
+    def test_float32_round_trip(self):
+        plot = ProbabilityPlot.from_frames(mock_frames(500))
+        decoded = ProbabilityPlot.from_bytes(plot.to_bytes(FLOAT32))
+        self.assertEqual(decoded, plot)
+        self.assertAlmostEqual(decoded.step, 0.01)
+
+    def test_uint8_round_trip(self):
+        plot = ProbabilityPlot.from_frames(mock_frames(500))
+        data = plot.to_bytes(UINT8)
+        decoded = ProbabilityPlot.from_bytes(data)
+        self.assertEqual(len(data), len(plot.to_bytes(FLOAT32)) - 3 * len(plot))
+        self.assertTrue(np.all(np.abs(decoded.probabilities - plot.probabilities) <= 0.5 / UINT8_SCALE + 1e-6))
+
+    def test_to_list(self):
+        frames = [{"start": 1.5, "probability": 0.25}, {"start": 1.51, "probability": 0.75}]
+        self.assertEqual(ProbabilityPlot.from_frames(frames).to_list(), frames)
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            ProbabilityPlot.from_frames(mock_frames(10)).to_bytes("float16")
+
+    def test_frames_with_gap_keep_starts(self):
+        frames = [{"start": start, "probability": 0.5} for start in (0.0, 0.01, 0.02, 0.5, 0.51)]
+        plot = ProbabilityPlot.from_frames(frames)
+        self.assertEqual(plot.step, 0.0)
+        self.assertEqual(plot.to_list(), frames)
+
+        decoded = ProbabilityPlot.from_bytes(plot.to_bytes(FLOAT32))
+        self.assertEqual(decoded, plot)
+
+    def test_jitter_within_tolerance(self):
+        frames = mock_frames(100)
+        frames.starts[1::2] += 0.00005
+        plot = ProbabilityPlot.from_frames(frames)
+        self.assertIsNone(plot.explicit_starts)
+        self.assertAlmostEqual(plot.step, 0.01, places=5)
+
+    def test_field_saves_frames(self):
+        frames = mock_frames(100)
+        recording = Recording.objects.create(name="test.wav", probability_frames=frames)
+        recording.refresh_from_db()
+        np.testing.assert_allclose(recording.probability_frames.to_frames().starts, frames.starts)
+        self.assertEqual(RecordingAfterAnalysisSerializer(recording).data["probability_plot"],
+                         recording.probability_frames.to_list())
+
+
+class TestProbabilityPlotEndpoint(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+        cls.plot = ProbabilityPlot.from_frames(mock_frames(100))
+        cls.recording = Recording.objects.create(name="test.wav", uploader=cls.doctor,
+                                                 probability_frames=cls.plot)
+
+    def _require_jwt_cookies(self, user) -> None:
+        access, refresh = get_tokens_for_user(user=user)
+        self.client.cookies.load({
+            'access': access,
+            'refresh': refresh,
+        })
+
+    def _url(self, recording: Recording) -> str:
+        return f"/api/recordings/{recording.id}/probability_plot/"
+
+    def test_binary(self):
+        self._require_jwt_cookies(self.doctor)
+        response = self.client.get(self._url(self.recording), {"encoding": UINT8})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        self.assertEqual(response["X-Frame-Count"], "100")
+        self.assertEqual(len(ProbabilityPlot.from_bytes(response.content)), 100)
+
+    def test_json(self):
+        self._require_jwt_cookies(self.doctor)
+        response = self.client.get(self._url(self.recording), {"encoding": "json"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), self.plot.to_list())
+
+    def test_legacy_json_plot(self):
+        self._require_jwt_cookies(self.doctor)
+        frames = [{"start": 0.0, "probability": 0.5}, {"start": 0.01, "probability": 1.0}]
+        recording = Recording.objects.create(name="old.wav", uploader=self.doctor, probability_plot=frames)
+        response = self.client.get(self._url(recording), {"encoding": "json"})
+        self.assertEqual(response.json(), frames)
+
+    def test_update_probability_plot(self):
+        self._require_jwt_cookies(self.doctor)
+        recording = Recording.objects.create(name="old.wav", uploader=self.doctor,
+                                             probability_plot=[{"start": 0.0, "probability": 0.5}])
+        frames = ProbabilityPlot.from_frames(mock_frames(50)).to_list()
+        response = self.client.patch(f"/api/recordings/{recording.id}/", {"probability_plot": frames}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["probability_plot"], frames)
+        # frames are packed into binary columns, statistics plots are rendered from them
+        recording.refresh_from_db()
+        self.assertIsNone(recording.probability_plot)
+        self.assertEqual(recording.probability_frames.to_list(), frames)
+        self.assertIsNotNone(recording.probability_pyramid)
+        self.assertTrue(RecordingPlot.objects.filter(recording=recording).exists())
+
+        for invalid in ([{"start": "x", "probability": 0.5}], {"start": 0.0}, [1, 2]):
+            response = self.client.patch(f"/api/recordings/{recording.id}/", {"probability_plot": invalid},
+                                         format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("probability_plot", response.json())
+
+        response = self.client.patch(f"/api/recordings/{recording.id}/", {"probability_plot": None}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.json()["probability_plot"])
+        recording.refresh_from_db()
+        self.assertIsNone(recording.probability_frames)
+        self.assertFalse(RecordingPlot.objects.filter(recording=recording).exists())
+
+    def test_not_analysed(self):
+        self._require_jwt_cookies(self.doctor)
+        recording = Recording.objects.create(name="new.wav", uploader=self.doctor)
+        response = self.client.get(self._url(recording))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unknown_encoding(self):
+        self._require_jwt_cookies(self.doctor)
+        response = self.client.get(self._url(self.recording), {"encoding": "float16"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pack_probability_plots(self):
+        frames = [{"start": 0.0, "probability": 0.5}, {"start": 0.01, "probability": 1.0}]
+        recording = Recording.objects.create(name="old.wav", uploader=self.doctor, probability_plot=frames)
+        call_command("pack_probability_plots", stdout=StringIO())
+        recording.refresh_from_db()
+        self.assertIsNone(recording.probability_plot)
+        self.assertEqual(recording.probability_frames.to_list(), frames)
@@ -0,0 +1,139 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of downsampled probability plot pyramid and probability plot window
+of recording endpoint.
+"""
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from analysis.frames import Frames, mock_frames
+from analysis.tasks import save_analysis_results
+from recordings.models import Recording
+from recordings.probability import ProbabilityPlot
+from recordings.pyramid import PYRAMID_BASE, PYRAMID_FACTOR, ProbabilityPyramid, lttb, select_indices
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+
+class TestProbabilityPyramid(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.plot = ProbabilityPlot.from_frames(mock_frames(10000))
+
+    def test_lttb(self):
+        y = np.zeros(1000)
+        y[[123, 456, 789]] = 1
+        indices = lttb(np.arange(1000), y, 50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        # peaks are kept, taking every 20th frame would lose all of them
+        self.assertTrue({123, 456, 789} <= set(indices.tolist()))
+
+    def test_levels(self):
+        pyramid = ProbabilityPyramid.from_plot(self.plot)
+        self.assertEqual([len(level) for level in pyramid.levels], [PYRAMID_BASE, PYRAMID_BASE * PYRAMID_FACTOR])
+        self.assertEqual(ProbabilityPyramid.from_bytes(pyramid.to_bytes()), pyramid)
+        self.assertEqual(ProbabilityPyramid.from_plot(ProbabilityPlot.from_frames(mock_frames(100))).levels, [])
+
+    def test_select_indices(self):
+        pyramid = ProbabilityPyramid.from_plot(self.plot)
+        self.assertEqual(len(select_indices(self.plot, pyramid)), 10000)
+        self.assertEqual(len(select_indices(self.plot, pyramid, resolution=1000)), 1000)
+        self.assertEqual(len(select_indices(self.plot, None, resolution=1000)), 1000)
+
+        # full detail of range, both ends included
+        indices = select_indices(self.plot, pyramid, start=10, end=20)
+        self.assertEqual((indices[0], indices[-1]), (1000, 2000))
+
+        indices = select_indices(self.plot, pyramid, resolution=100, start=10, end=30)
+        self.assertEqual(len(indices), 100)
+        self.assertEqual((indices[0], indices[-1]), (1000, 3000))
+        self.assertTrue(np.all((indices >= 1000) & (indices <= 3000)))
+
+    def test_select_indices_of_explicit_starts(self):
+        frames = [{"start": start, "probability": 0.5} for start in (0.0, 0.01, 0.02, 5.0, 5.01, 5.02)]
+        plot = ProbabilityPlot.from_frames(frames)
+        self.assertEqual(select_indices(plot, None, start=0.01, end=5.0).tolist(), [1, 2, 3])
+
+
+class TestProbabilityPlotWindow(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+        cls.recording = Recording.objects.create(name="test.wav", uploader=cls.doctor)
+        save_analysis_results(cls.recording.id, {"probability_frames": mock_frames(5000)})
+
+    def _require_jwt_cookies(self, user) -> None:
+        access, refresh = get_tokens_for_user(user=user)
+        self.client.cookies.load({
+            'access': access,
+            'refresh': refresh,
+        })
+
+    def _get_plot(self, params: dict):
+        self._require_jwt_cookies(self.doctor)
+        return self.client.get(f"/api/recordings/{self.recording.id}/", params)
+
+    def test_pyramid_saved(self):
+        self.recording.refresh_from_db()
+        self.assertEqual(len(self.recording.probability_pyramid.levels), 1)
+
+    def test_full_plot(self):
+        response = self._get_plot({})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["probability_plot"]), 5000)
+        self.assertNotIn("probability_pyramid", response.json())
+
+    def test_resolution_and_range(self):
+        plot = self._get_plot({"resolution": 200})
+        self.assertEqual(len(plot.json()["probability_plot"]), 200)
+
+        plot = self._get_plot({"start": 5, "end": 6}).json()["probability_plot"]
+        self.assertEqual(len(plot), 101)
+        self.assertEqual((plot[0]["start"], plot[-1]["start"]), (5.0, 6.0))
+
+        plot = self._get_plot({"resolution": 300, "start": 10}).json()["probability_plot"]
+        self.assertEqual(len(plot), 300)
+        self.assertEqual((plot[0]["start"], plot[-1]["start"]), (10.0, 49.99))
+
+    def test_legacy_plot(self):
+        frames = Frames(np.arange(1000) / 100, np.linspace(0, 1, 1000))
+        Recording.objects.filter(id=self.recording.id).update(
+            probability_frames=None, probability_pyramid=None,
+            probability_plot=ProbabilityPlot.from_frames(frames).to_list()
+        )
+        self.assertEqual(len(self._get_plot({"resolution": 100}).json()["probability_plot"]), 100)
+
+    def test_invalid_window(self):
+        self.assertEqual(self._get_plot({"resolution": "a"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._get_plot({"start": 10, "end": 5}).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,159 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of content-addressable storage of recording audio.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import wave
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from examinations.models import Examination
+from recordings.lossless import compress_wav, is_compressed
+from recordings.models import Recording, RecordingAudio
+from recordings.storage import get_audio_name
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_wav(frames: int) -> bytes:
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes(os.urandom(2 * frames))
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECORDING_COMPRESSION=False)
+@patch('recordings.signals.compute_waveform.delay')
+class TestRecordingStorage(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        access, refresh = get_tokens_for_user(user=self.doctor)
+        self.client.cookies.load({'access': access, 'refresh': refresh})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def _upload(self, content: bytes) -> Recording:
+        examination = Examination.objects.create(doctor=self.doctor, date=timezone.now() + timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/recordings/", {
+                'file': SimpleUploadedFile("test.wav", content),
+                'name': 'test.wav',
+                'examination': examination.id
+            }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Recording.objects.get(id=response.json()['id'])
+
+    def _delete(self, recording: Recording):
+        Examination.objects.filter(recording=recording).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            recording.delete()
+
+    def test_duplicate_upload(self, compute_waveform):
+        content = make_wav(8000)
+        first, second = self._upload(content), self._upload(content)
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(first.audio_id, digest)
+        self.assertEqual(second.audio_id, digest)
+        self.assertEqual(first.file.name, get_audio_name(digest))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(os.listdir(os.path.dirname(first.file.path)).count(f'{digest}.wav'), 1)
+
+        # file is deleted with the last recording referencing it
+        self._delete(first)
+        self.assertTrue(default_storage.exists(second.file.name))
+        self._delete(second)
+        self.assertFalse(default_storage.exists(second.file.name))
+        self.assertFalse(RecordingAudio.objects.filter(digest=digest).exists())
+
+        # the same content can be uploaded again
+        recording = self._upload(content)
+        with recording.file.open('rb') as file:
+            self.assertEqual(file.read(), content)
+
+    def test_deduplicate_recordings(self, compute_waveform):
+        content = make_wav(8000)
+        uploaded = self._upload(content)
+        names = [default_storage.save('recordings/legacy.wav', ContentFile(content)) for _ in range(2)]
+        legacy = [Recording.objects.create(uploader=self.doctor, name='legacy.wav', file=name) for name in names]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('deduplicate_recordings', stdout=StringIO())
+        for recording in legacy:
+            recording.refresh_from_db()
+            self.assertEqual(recording.audio_id, uploaded.audio_id)
+            self.assertEqual(recording.file.name, uploaded.file.name)
+        # files of legacy recordings are kept for analyses queued with their paths until they expire
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        with override_settings(RECORDING_UPLOAD_EXPIRY=-1):
+            call_command('deduplicate_recordings', stdout=StringIO())
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+        with uploaded.file.open('rb') as file:
+            self.assertEqual(file.read(), content)
+
+    def test_deduplicate_compressed_recording(self, compute_waveform):
+        path = default_storage.path(default_storage.save('recordings/legacy.wav', ContentFile(make_wav(8000))))
+        compressed_path = path[:-len('.wav')] + '.flac'
+        compress_wav(path, compressed_path)
+        with open(path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        recording = Recording.objects.create(uploader=self.doctor, name='legacy.wav',
+                                             file=os.path.relpath(compressed_path, MEDIA_ROOT))
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('deduplicate_recordings', stdout=out)
+        recording.refresh_from_db()
+        # compressed file is stored under the name of compressed audio
+        self.assertEqual(recording.audio_id, digest)
+        self.assertEqual(recording.file.name, get_audio_name(digest, compressed=True))
+        self.assertTrue(is_compressed(recording.file.path))
+        self.assertIn("Moved 1 recordings", out.getvalue())
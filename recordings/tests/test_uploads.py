@@ -0,0 +1,212 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of resumable chunked upload of recordings.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+import wave
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from analysis.cache import file_sha256
+from examinations.models import Examination
+from recordings.models import Recording, RecordingUpload
+from recordings.uploads import _hashes, finish_upload, get_part_path
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_wav(frames: int) -> bytes:
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(8000)
+        wav.writeframes((bytes(range(256)) * (frames // 128 + 1))[:2 * frames])
+    return buffer.getvalue()
+
+
+AUDIO = make_wav(8000)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECORDING_UPLOAD_MAX_CHUNK_SIZE=4096)
+class TestRecordingUploads(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        access, refresh = get_tokens_for_user(user=self.doctor)
+        self.client.cookies.load({'access': access, 'refresh': refresh})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+        cls.examination = Examination.objects.create(doctor=cls.doctor, date=timezone.now() + timedelta(days=1))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def _start(self, size: int = len(AUDIO)) -> str:
+        response = self.client.post("/api/recordings/uploads/", {
+            "name": "long.wav", "examination": self.examination.id, "size": size
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()["id"]
+
+    def _chunk(self, upload_id: str, offset: int, data: bytes):
+        return self.client.put(f"/api/recordings/uploads/{upload_id}/chunk/?offset={offset}", data,
+                               content_type="application/octet-stream")
+
+    def test_upload(self):
+        upload_id = self._start()
+        for offset in range(0, len(AUDIO), 4096):
+            response = self._chunk(upload_id, offset, AUDIO[offset:offset + 4096])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["offset"], min(offset + 4096, len(AUDIO)))
+
+        response = self.client.post(f"/api/recordings/uploads/{upload_id}/finish/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        recording = Recording.objects.get(id=response.json()["id"])
+        with recording.file.open('rb') as file:
+            self.assertEqual(file.read(), AUDIO)
+        self.assertEqual(recording.uploader, self.doctor)
+        self.assertEqual(recording.length, timedelta(seconds=1))
+        self.examination.refresh_from_db()
+        self.assertEqual(self.examination.recording, recording)
+        self.assertEqual(self.examination.status, Examination.Statuses.file_uploaded)
+        self.assertFalse(RecordingUpload.objects.exists())
+
+    def test_digest_of_chunks(self):
+        digest = hashlib.sha256(AUDIO).hexdigest()
+        for written_by_other_process in (False, True):
+            with self.subTest(written_by_other_process=written_by_other_process):
+                upload_id = self._start()
+                self._chunk(upload_id, 0, AUDIO[:4096])
+                # rejected chunk does not change the digest
+                self._chunk(upload_id, 0, b"x" * 100)
+                for offset in range(4096, len(AUDIO), 4096):
+                    self._chunk(upload_id, offset, AUDIO[offset:offset + 4096])
+                if written_by_other_process:
+                    _hashes.clear()
+
+                # part file is read again only when its SHA-256 is not in memory, before examination is locked
+                with mock.patch('recordings.uploads.file_sha256', wraps=file_sha256) as read_file:
+                    response = self.client.post(f"/api/recordings/uploads/{upload_id}/finish/")
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(read_file.call_count, int(written_by_other_process))
+                self.assertEqual(Recording.objects.get(id=response.json()["id"]).audio.digest, digest)
+                self.assertNotIn(uuid.UUID(upload_id), _hashes)
+                Examination.objects.filter(id=self.examination.id).update(recording=None)
+
+    @override_settings(RECORDING_COMPRESSION=False)
+    @mock.patch('recordings.signals.compute_waveform.delay')
+    def test_finish_after_rollback(self, compute_waveform):
+        upload_id = self._start()
+        for offset in range(0, len(AUDIO), 4096):
+            self._chunk(upload_id, offset, AUDIO[offset:offset + 4096])
+
+        upload = RecordingUpload.objects.get(id=upload_id)
+        with mock.patch.object(Recording.objects, 'create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                finish_upload(upload)
+        # part file is kept, finish can be repeated
+        self.assertTrue(os.path.exists(get_part_path(upload)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/api/recordings/uploads/{upload_id}/finish/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with Recording.objects.get(id=response.json()["id"]).file.open('rb') as file:
+            self.assertEqual(file.read(), AUDIO)
+        self.assertFalse(os.path.exists(get_part_path(upload)))
+
+    def test_resume(self):
+        upload_id = self._start()
+        self._chunk(upload_id, 0, AUDIO[:4096])
+        # chunk sent again after a dropped connection or skipping bytes - client gets offset to continue from
+        for offset in (0, 5000):
+            response = self._chunk(upload_id, offset, AUDIO[offset:offset + 100])
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(response.json()["offset"], 4096)
+        self.assertEqual(self.client.get(f"/api/recordings/uploads/{upload_id}/").json()["offset"], 4096)
+
+        response = self.client.post(f"/api/recordings/uploads/{upload_id}/finish/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_chunks(self):
+        upload_id = self._start(size=5000)
+        self.assertEqual(self._chunk(upload_id, 0, b"x" * 4097).status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self._chunk(upload_id, 0, b"x" * 4096)
+        self.assertEqual(self._chunk(upload_id, 4096, b"x" * 1000).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_without_content_length(self):
+        upload_id = self._start(size=5000)
+        # chunked transfer encoding - body length is not known in advance
+        response = self.client.put(f"/api/recordings/uploads/{upload_id}/chunk/?offset=0", b"x" * 100,
+                                   content_type="application/octet-stream", CONTENT_LENGTH="")
+        self.assertEqual(response.status_code, status.HTTP_411_LENGTH_REQUIRED)
+        self.assertEqual(RecordingUpload.objects.get(id=upload_id).offset, 0)
+
+    def test_invalid_wav(self):
+        upload_id = self._start(size=4000)
+        self._chunk(upload_id, 0, b"x" * 4000)
+        response = self.client.post(f"/api/recordings/uploads/{upload_id}/finish/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("file", response.json())
+        self.assertFalse(Recording.objects.filter(uploader=self.doctor).exists())
+
+    def test_invalid_start(self):
+        response = self.client.post("/api/recordings/uploads/", {
+            "name": "long.mp3", "examination": self.examination.id, "size": 0
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.json()), {"name", "size"})
+
+    def test_abort_and_stale_uploads(self):
+        upload = RecordingUpload.objects.get(id=self._start())
+        self.assertTrue(os.path.exists(get_part_path(upload)))
+        self.assertEqual(self.client.delete(f"/api/recordings/uploads/{upload.id}/").status_code,
+                         status.HTTP_204_NO_CONTENT)
+        self.assertFalse(os.path.exists(get_part_path(upload)))
+
+        upload = RecordingUpload.objects.get(id=self._start())
+        RecordingUpload.objects.filter(id=upload.id).update(updated_at=timezone.now() - timedelta(days=3))
+        call_command("delete_stale_uploads", stdout=StringIO())
+        self.assertFalse(RecordingUpload.objects.exists())
+        self.assertFalse(os.path.exists(get_part_path(upload)))
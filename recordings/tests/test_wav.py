@@ -0,0 +1,101 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of streaming WAV header parser.
+"""
+import struct
+import wave
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from recordings.wav import InvalidWav, WavInfo, read_wav_info
+
+
+def make_wav(frames: int = 8000, channels: int = 1, sample_width: int = 2, sample_rate: int = 8000) -> bytes:
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames * channels * sample_width))
+    return buffer.getvalue()
+
+
+def insert_chunk(data: bytes, chunk_id: bytes, payload: bytes) -> bytes:
+    """Inserts RIFF chunk right after the RIFF/WAVE header"""
+    chunk = struct.pack('<4sI', chunk_id, len(payload)) + payload + b'\0' * (len(payload) % 2)
+    return data[:4] + struct.pack('<I', len(data) - 8 + len(chunk)) + data[8:12] + chunk + data[12:]
+
+
+class TestWavHeader(SimpleTestCase):
+    def test_read_info(self):
+        file = BytesIO(make_wav(frames=12000, channels=2, sample_width=3, sample_rate=16000))
+        file.seek(10)
+        info = read_wav_info(file)
+        self.assertEqual(info, WavInfo(audio_format=1, channels=2, sample_rate=16000, bits_per_sample=24,
+                                       frames=12000, data_offset=44, data_size=12000 * 6))
+        self.assertEqual(info.length, timedelta(seconds=0.75))
+        # position of the file is left where it was
+        self.assertEqual(file.tell(), 10)
+
+    def test_skipped_chunks(self):
+        # metadata chunks (with odd size padded to even) before format and before data
+        data = insert_chunk(make_wav(), b'LIST', b'INFOISFT\x03\x00\x00\x00ab\x00')
+        data = insert_chunk(data, b'bext', b'x' * 601)
+        info = read_wav_info(BytesIO(data))
+        self.assertEqual((info.frames, info.data_offset), (8000, 44 + 8 + 602 + 8 + 16))
+
+    def test_extensible_format(self):
+        data = make_wav()
+        fmt = struct.pack('<HHIIHHHHI16s', 0xFFFE, 1, 8000, 16000, 2, 16, 22, 16, 4, b'\x01\x00' + bytes(14))
+        data = data[:12] + struct.pack('<4sI', b'fmt ', len(fmt)) + fmt + data[36:]
+        self.assertEqual(read_wav_info(BytesIO(data)).frames, 8000)
+
+    def test_oversized_format_chunk(self):
+        data = bytearray(make_wav())
+        data[16:20] = struct.pack('<I', 2 ** 31)
+        file = BytesIO(bytes(data))
+        with mock.patch.object(file, 'read', wraps=file.read) as read, self.assertRaises(InvalidWav):
+            read_wav_info(file)
+        # declared size of the chunk is not read
+        self.assertTrue(all(call.args[0] <= 64 for call in read.call_args_list))
+
+    def test_invalid_files(self):
+        float_wav = bytearray(make_wav(sample_width=4))
+        float_wav[20:22] = struct.pack('<H', 3)
+        invalid = {
+            'not riff': b'xd' * 100,
+            'empty': b'',
+            'truncated header': make_wav()[:30],
+            'truncated data': make_wav()[:-1000],
+            'no audio': make_wav(frames=0),
+            'float samples': bytes(float_wav),
+            'too many channels': make_wav(channels=3),
+            'low sample rate': make_wav(sample_rate=4000),
+        }
+        for name, data in invalid.items():
+            with self.subTest(name), self.assertRaises(InvalidWav):
+                read_wav_info(BytesIO(data))
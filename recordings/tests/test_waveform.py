@@ -0,0 +1,146 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: File contains tests of waveform peaks computed in background and their endpoint.
+"""
+import os
+import shutil
+import tempfile
+import wave
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from recordings.models import Recording, RecordingWaveform
+from recordings.tasks import compress_recording, compute_waveform
+from recordings.waveform import BUCKET_SAMPLES, WaveformPeaks
+from users.utils import get_tokens_for_user
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp()
+SAMPLE_RATE = 8000
+
+
+def make_wav(samples: np.ndarray, sample_width: int = 2) -> bytes:
+    """WAV file with samples (floats in range [-1, 1], shape (frames, channels))"""
+    path = os.path.join(MEDIA_ROOT, "source.wav")
+    if sample_width == 1:
+        data = (samples * 127 + 128).astype(np.uint8)
+    else:
+        data = (samples * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(sample_width)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(data.tobytes())
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestWaveform(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email="doctor@gmail.com", password="test1", first_name="",
+                                              last_name="", type=User.Types.DOCTOR)
+        # 60 s, left channel rises from silence to full scale, right channel is silent
+        left = np.repeat(np.linspace(0, 1, 60), SAMPLE_RATE) * np.tile([1, -1], 30 * SAMPLE_RATE)
+        cls.samples = np.column_stack((left, np.zeros(len(left))))
+        cls.recording = Recording.objects.create(name="test.wav", uploader=cls.doctor,
+                                                 file=ContentFile(make_wav(cls.samples), name="test.wav"))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_peaks(self):
+        peaks = WaveformPeaks.from_wav(self.recording.file.path)
+        self.assertEqual(peaks.samples, 60 * SAMPLE_RATE)
+        self.assertEqual(len(peaks.levels[0].peaks), -(-60 * SAMPLE_RATE // BUCKET_SAMPLES))
+        self.assertLessEqual(len(peaks.levels[-1].peaks), 1000)
+        self.assertEqual(peaks.levels[0].peaks[0].tolist(), [0, 0])
+        self.assertEqual(peaks.levels[-1].peaks[-1].tolist(), [-127, 127])
+
+        decoded = WaveformPeaks.from_bytes(peaks.to_bytes())
+        self.assertEqual(decoded.sample_rate, SAMPLE_RATE)
+        self.assertTrue(all(np.array_equal(a.peaks, b.peaks) for a, b in zip(peaks.levels, decoded.levels)))
+
+        # 8-bit samples are unsigned
+        path = os.path.join(MEDIA_ROOT, "8bit.wav")
+        with open(path, 'wb') as file:
+            file.write(make_wav(self.samples, sample_width=1))
+        self.assertEqual(WaveformPeaks.from_wav(path).levels[-1].peaks[-1].tolist(), [-127, 127])
+
+    def test_select(self):
+        peaks = WaveformPeaks.from_wav(self.recording.file.path)
+        selected = peaks.select(500)
+        self.assertLessEqual(len(selected["min"]), 500)
+        duration = selected["bucket_duration"]
+        self.assertAlmostEqual(duration * len(selected["min"]), 60, delta=duration)
+
+        selected = peaks.select(100, start=30, end=31)
+        self.assertLessEqual(len(selected["min"]), 100)
+        self.assertAlmostEqual(selected["start"], 30, delta=selected["bucket_duration"])
+        # amplitude in 31st second is 30 / 59 of full scale
+        self.assertTrue(all(abs(value - 30 / 59 * 127) <= 1 for value in selected["max"][1:-1]))
+
+    def test_computed_after_create(self):
+        with patch.object(compute_waveform, "delay") as delay, patch.object(compress_recording, "delay"), \
+                self.captureOnCommitCallbacks(execute=True):
+            recording = Recording.objects.create(name="new.wav", uploader=self.doctor,
+                                                 file=ContentFile(make_wav(self.samples), name="new.wav"))
+        delay.assert_called_once_with(recording.id)
+
+        compute_waveform.apply(args=(recording.id,))
+        self.assertEqual(RecordingWaveform.objects.get(recording=recording).peaks.samples, 60 * SAMPLE_RATE)
+
+        # not a WAV file - nothing is stored
+        recording = Recording.objects.create(name="bad.wav", uploader=self.doctor,
+                                             file=ContentFile(b"xd", name="bad.wav"))
+        compute_waveform.apply(args=(recording.id,))
+        self.assertFalse(RecordingWaveform.objects.filter(recording=recording).exists())
+
+    def test_endpoint(self):
+        access, refresh = get_tokens_for_user(user=self.doctor)
+        self.client.cookies.load({'access': access, 'refresh': refresh})
+        url = f"/api/recordings/{self.recording.id}/waveform/"
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        compute_waveform.apply(args=(self.recording.id,))
+        response = self.client.get(url, {"resolution": 200, "start": 10, "end": 20})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(response.json()["max"]), 200)
+        self.assertEqual(response.json()["sample_rate"], SAMPLE_RATE)
+
+        response = self.client.get(url, {"resolution": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,204 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Resumable chunked upload of recordings. Upload is initialised with name, examination and size
+of the file, then chunks are sent one after another, each starting at offset of bytes received so far (after
+a dropped connection the client asks for offset and continues from it). A chunk is read from the request (into
+a temporary file spooled to disk) before the upload is locked, then it is copied to a part file in
+RECORDING_UPLOAD_DIR of MEDIA_ROOT in small blocks, so memory use does not depend on size of the file.
+SHA-256 of the file is updated with every chunk while it is read. hashlib state can not be stored in the database,
+it is kept in memory of the process (daphne serves all chunks of an upload from one process), a part file written
+by another process is hashed when the upload is finished - before the examination is locked.
+When all bytes are received, the part file is linked into content-addressed storage of recordings, Recording is
+created and attached to the examination (the part file is removed after commit, so a failed finish can be repeated).
+
+File consists of:
+    - OffsetMismatch - raised for chunk which does not start at offset of the upload
+    - get_part_path - path of part file of upload
+    - get_upload_digest - SHA-256 of part file of complete upload
+    - start_upload - creates empty part file of upload
+    - write_chunk - writes chunk read from request stream at offset of upload
+    - finish_upload - validates WAV header, links part file into storage, creates Recording and attaches examination
+    - discard_upload - deletes upload and its part file
+    - delete_stale_uploads - discards uploads not continued for RECORDING_UPLOAD_EXPIRY hours
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+from typing import BinaryIO, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from analysis.cache import file_sha256
+from examinations.models import Examination
+from .models import Recording, RecordingUpload
+from .storage import store_audio
+from .wav import InvalidWav, read_wav_info
+
+# request stream is copied to the part file in blocks of this size
+BLOCK_SIZE = 64 * 1024
+# chunks up to this size are read into memory, larger ones into a temporary file
+SPOOL_SIZE = 1024 * 1024
+# SHA-256 states of uploads in progress (the oldest are dropped, their part files are hashed on finish)
+MAX_HASHES = 1024
+
+# upload id -> (offset, SHA-256 of the part file up to offset)
+_hashes: OrderedDict = OrderedDict()
+_hashes_lock = threading.Lock()
+
+
+class OffsetMismatch(ValueError):
+    """Chunk does not start at offset of the upload (bytes received so far)"""
+
+
+def get_part_path(upload: RecordingUpload) -> str:
+    return os.path.join(settings.MEDIA_ROOT, settings.RECORDING_UPLOAD_DIR, f'{upload.id}.part')
+
+
+def _get_hash(upload_id: uuid.UUID, offset: int) -> Optional['hashlib._Hash']:
+    # copy, so a chunk which is rejected (offset mismatch) does not change the stored state
+    if offset == 0:
+        return hashlib.sha256()
+    with _hashes_lock:
+        offset_hash = _hashes.get(upload_id)
+        return offset_hash[1].copy() if offset_hash and offset_hash[0] == offset else None
+
+
+def _set_hash(upload_id: uuid.UUID, offset: int, sha256: 'hashlib._Hash'):
+    with _hashes_lock:
+        _hashes[upload_id] = (offset, sha256)
+        _hashes.move_to_end(upload_id)
+        while len(_hashes) > MAX_HASHES:
+            _hashes.popitem(last=False)
+
+
+def _discard_hash(upload_id: uuid.UUID):
+    with _hashes_lock:
+        _hashes.pop(upload_id, None)
+
+
+def get_upload_digest(upload: RecordingUpload) -> str:
+    """SHA-256 of part file of complete upload, updated with its chunks or read from the file."""
+    sha256 = _get_hash(upload.id, upload.size)
+    return sha256.hexdigest() if sha256 is not None else file_sha256(get_part_path(upload))
+
+
+def start_upload(upload: RecordingUpload):
+    path = get_part_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+def write_chunk(upload: RecordingUpload, offset: int, stream: BinaryIO, length: int) -> int:
+    """
+    Writes length bytes of stream to the part file at offset and returns new offset of upload. The chunk is read
+    before row of upload is locked (a slow client does not hold the lock), the row is locked while the chunk
+    is written, so concurrent requests can not write the same range.
+    """
+    sha256 = _get_hash(upload.id, offset)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, dir=os.path.dirname(get_part_path(upload))) as chunk:
+        remaining = length
+        while remaining > 0:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            chunk.write(block)
+            if sha256 is not None:
+                sha256.update(block)
+            remaining -= len(block)
+        chunk.seek(0)
+
+        with transaction.atomic():
+            upload = RecordingUpload.objects.select_for_update().get(id=upload.id)
+            if offset != upload.offset:
+                raise OffsetMismatch(upload.offset)
+
+            with open(get_part_path(upload), 'r+b') as part:
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, BLOCK_SIZE)
+                # the rest of an interrupted chunk is sent again from the same offset
+                part.truncate()
+
+            upload.offset = offset + length - remaining
+            upload.save(update_fields=['offset', 'updated_at'])
+    if sha256 is not None:
+        _set_hash(upload.id, upload.offset, sha256)
+    return upload.offset
+
+
+def finish_upload(upload: RecordingUpload) -> Recording:
+    """Links the complete part file into storage of recordings, creates Recording and attaches the examination."""
+    # complete part file does not change any more, it is not read while the examination is locked
+    digest = get_upload_digest(upload)
+    with transaction.atomic():
+        examination = Examination.objects.select_for_update().get(id=upload.examination_id)
+        if examination.recording is not None:
+            raise serializers.ValidationError(
+                {'detail': 'Another recording has already been assigned to chosen examination.'})
+
+        with open(get_part_path(upload), 'rb') as part:
+            try:
+                info = read_wav_info(part)
+            except InvalidWav as e:
+                raise serializers.ValidationError({'file': [str(e)]})
+
+        # file is linked, not copied - its bytes are written only once (and not at all for stored content)
+        audio, _ = store_audio(digest, get_part_path(upload))
+
+        recording = Recording.objects.create(uploader=upload.uploader, name=upload.name, audio=audio,
+                                             file=audio.file.name, length=info.length)
+        examination.recording = recording
+        examination.status = Examination.Statuses.file_uploaded
+        examination.save()
+        upload_id = upload.id
+        upload.delete()
+    _discard_hash(upload_id)
+    return recording
+
+
+def discard_upload(upload: RecordingUpload):
+    path = get_part_path(upload)
+    if os.path.exists(path):
+        os.remove(path)
+    _discard_hash(upload.id)
+    upload.delete()
+
+
+def delete_stale_uploads() -> int:
+    """Discards uploads without a chunk for RECORDING_UPLOAD_EXPIRY hours, returns their number."""
+    stale = RecordingUpload.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(hours=settings.RECORDING_UPLOAD_EXPIRY)
+    )
+    count = 0
+    for upload in stale:
+        discard_upload(upload)
+        count += 1
+    return count
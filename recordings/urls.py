@@ -24,13 +24,24 @@ author: Wojciech Nowicki
 description: File registers api endpoints
 
 endpoints:
+    - /api/recordings/uploads/
+    - /api/recordings/uploads/<uuid>/
+    - /api/recordings/uploads/<uuid>/chunk/
+    - /api/recordings/uploads/<uuid>/finish/
     - /api/recordings/
     - /api/recordings/<id>/
+    - /api/recordings/<id>/probability_plot/
+    - /api/recordings/<id>/plots/
+    - /api/recordings/<id>/plots/<kind>/
+    - /api/recordings/<id>/audio/
+    - /api/recordings/<id>/waveform/
 """
 from rest_framework.routers import SimpleRouter
-from .views import RecordingViewSet
+from .views import RecordingUploadViewSet, RecordingViewSet
 
 router = SimpleRouter()
+# registered first, so "uploads" is not matched as id of a recording
+router.register(r'recordings/uploads', RecordingUploadViewSet, basename='recording-uploads')
 router.register(r'recordings', RecordingViewSet, basename='recordings')
 
 urlpatterns = router.urls
@@ -26,25 +26,47 @@ mapping usage of correct endpoints, http methods and serializers, based on taken
 
 views and viewsets:
     - RecordingViewSet - recordings CRUD
+    - RecordingUploadViewSet - resumable chunked upload of recordings
 """
+import os
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import QuerySet
+from django.db.models import Prefetch, QuerySet
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import no_body, swagger_auto_schema
 from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.request import Request
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST
+from rest_framework.status import (
+    HTTP_200_OK, HTTP_201_CREATED, HTTP_206_PARTIAL_CONTENT, HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND, HTTP_409_CONFLICT, HTTP_411_LENGTH_REQUIRED, HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+)
 
+from analysis.tasks import render_recording_plots
+from core.pagination import KeysetPagination
 from examinations.models import Examination
-from .models import Recording
+from .audio import AudioRenderer, audio_response
+from .handlers import RecordingUploadHandler
+from .models import PlotImage, Recording, RecordingPlot, RecordingUpload, RecordingWaveform
+from .probability import ENCODINGS
 from .serializers import (
     ListRecordingsBeforeAnalysisSerializer,
     RecordingAfterAnalysisSerializer,
     RecordingCreateSerializer, 
-    RecordingBeforeAnalysisSerializer
+    RecordingBeforeAnalysisSerializer,
+    ProbabilityPlotWindowSerializer,
+    RecordingPlotSerializer,
+    RecordingUploadSerializer,
+    WaveformWindowSerializer
 )
+from .uploads import OffsetMismatch, discard_upload, finish_upload, start_upload, write_chunk
 
 User = get_user_model()
 
@@ -58,22 +80,40 @@ class RecordingViewSet(
     viewsets.GenericViewSet
 ):
     """
-    GET     /api/recordings/          - list all recordings
+    GET     /api/recordings/          - list all recordings (?limit=, ?cursor=, ?count=false)
     POST    /api/recordings/          - register new recording
     GET     /api/recordings/<int:id>/ - retrieve recording
+                                        (?resolution=, ?start=&end= select points of probability plot)
     PUT     /api/recordings/<int:id>/ - update recording
     PATCH   /api/recordings/<int:id>/ - partially update recording
+    GET     /api/recordings/<int:id>/probability_plot/ - probability plot in binary form
+                                                         (?encoding=float32|uint8, ?encoding=json for list of frames)
+    GET     /api/recordings/<int:id>/plots/ - list of statistics plots of recording
+    GET     /api/recordings/<int:id>/plots/<kind>/ - statistics plot image (ETag, ?v=<digest> is cached for long)
+    GET     /api/recordings/<int:id>/audio/ - audio of recording (supports Range requests)
+    GET     /api/recordings/<int:id>/waveform/ - waveform peaks (?resolution=, ?start=&end=)
     """
 
     serializer_class = ListRecordingsBeforeAnalysisSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    pagination_ordering = ('-uploaded_at', '-id')
 
     def get_queryset(self) -> QuerySet[Recording]:
         if self.request.user.is_anonymous:
             return Recording.objects.none()
         elif self.request.user.type == User.Types.DOCTOR:
             # recordings uploaded by current user (doctor)
-            return Recording.objects.filter(uploader=self.request.user)
+            queryset = Recording.objects.filter(uploader=self.request.user)
+            if getattr(self, 'action', None) in ('retrieve', 'update', 'partial_update', 'probability_plot'):
+                # probability plot is part of the response, pyramid is loaded only when resolution is requested
+                return queryset.without_blobs('probability_plot', 'probability_frames')
+            if getattr(self, 'action', None) == 'list':
+                # examinations with their patients are loaded in one query for the whole page
+                queryset = queryset.prefetch_related(
+                    Prefetch('examination_set', queryset=Examination.objects.select_related('patient'))
+                )
+            return queryset.without_blobs()
         return Recording.objects.none()
 
     def get_serializer_class(self):
@@ -83,12 +123,36 @@ class RecordingViewSet(
             return RecordingAfterAnalysisSerializer
         return super().get_serializer_class()
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # statistics plots are rendered from written probability plot (or removed with it)
+        if 'probability_frames' in serializer.validated_data:
+            render_recording_plots(serializer.instance.id, serializer.validated_data['probability_frames'])
+
     @swagger_auto_schema(responses={
         HTTP_201_CREATED: openapi.Response('OK', RecordingBeforeAnalysisSerializer)}
     )
     def create(self, request: Request, *args, **kwargs) -> Response:
+        # file is written, hashed and its WAV header parsed in one pass over the request body
+        request.upload_handlers.insert(0, RecordingUploadHandler(request))
         return super().create(request, *args, **kwargs)
 
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('resolution', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description="Maximum number of points of probability plot (all frames if not given)"),
+        openapi.Parameter('start', openapi.IN_QUERY, type=openapi.TYPE_NUMBER,
+                          description="Start of probability plot range in seconds"),
+        openapi.Parameter('end', openapi.IN_QUERY, type=openapi.TYPE_NUMBER,
+                          description="End of probability plot range in seconds"),
+    ])
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        window = ProbabilityPlotWindowSerializer(data=request.query_params)
+        window.is_valid(raise_exception=True)
+        serializer = self.get_serializer(self.get_object(), context={
+            **self.get_serializer_context(), 'probability_plot_window': window.validated_data
+        })
+        return Response(serializer.data)
+
     @swagger_auto_schema(responses={
         HTTP_200_OK: "Recording was successfully detached from examination.",
         HTTP_400_BAD_REQUEST: "Recording was not assigned to any examination."
@@ -109,3 +173,178 @@ class RecordingViewSet(
             {'message': 'Recording was not assigned to any examination.'},
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('encoding', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=[*ENCODINGS, 'json'])
+    ], responses={
+        HTTP_200_OK: "Probability plot (application/octet-stream, layout described in recordings/probability.py)",
+        HTTP_400_BAD_REQUEST: "Unknown encoding",
+        HTTP_404_NOT_FOUND: "Recording has not been analysed yet."
+    })
+    @action(detail=True, methods=['GET'])
+    def probability_plot(self, request: Request, *args, **kwargs):
+        recording = self.get_object()
+        plot = recording.get_probability_plot()
+        if plot is None:
+            return Response({'message': 'Recording has not been analysed yet.'}, status=HTTP_404_NOT_FOUND)
+
+        encoding = request.query_params.get('encoding', settings.PROBABILITY_PLOT_ENCODING)
+        if encoding == 'json':
+            return Response(plot.to_list(), status=HTTP_200_OK)
+        if encoding not in ENCODINGS:
+            return Response({'message': f'Unknown encoding: {encoding}'}, status=HTTP_400_BAD_REQUEST)
+
+        response = HttpResponse(plot.to_bytes(encoding), content_type='application/octet-stream')
+        response['X-Frame-Start'] = plot.start
+        response['X-Frame-Step'] = plot.step
+        response['X-Frame-Count'] = len(plot)
+        response['X-Probability-Encoding'] = encoding
+        return response
+
+    @swagger_auto_schema(responses={
+        HTTP_200_OK: openapi.Response('Plots of recording', RecordingPlotSerializer(many=True))
+    })
+    @action(detail=True, methods=['GET'])
+    def plots(self, request: Request, *args, **kwargs) -> Response:
+        plots = RecordingPlot.objects.filter(recording=self.get_object()).metadata().order_by('kind')
+        return Response(RecordingPlotSerializer(plots, many=True).data, status=HTTP_200_OK)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('v', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="Digest of the image (url of plot), response is cached for a long time")
+    ], responses={
+        HTTP_200_OK: "Plot image",
+        HTTP_304_NOT_MODIFIED: "Plot has not changed (If-None-Match or If-Modified-Since)",
+        HTTP_404_NOT_FOUND: "Recording does not have this plot."
+    })
+    @action(detail=True, methods=['GET'], url_path=r'plots/(?P<kind>[a-z0-9_]+)')
+    def plot(self, request: Request, kind: str, *args, **kwargs):
+        plot = RecordingPlot.objects.filter(recording=self.get_object(), kind=kind).metadata().first()
+        if plot is None:
+            return Response({'message': 'Recording does not have this plot.'}, status=HTTP_404_NOT_FOUND)
+
+        # images are content-addressed, so digest is a strong ETag,
+        # conditional request is answered before image bytes are read from database
+        etag = f'"{plot.image_id}"'
+        last_modified = int(plot.updated_at.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is None:
+            image = PlotImage.objects.filter(digest=plot.image_id).values_list('data', flat=True).get()
+            response = HttpResponse(bytes(image), content_type=plot.image.content_type)
+        else:
+            response = not_modified
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if request.query_params.get('v') == plot.image_id:
+            # content of url with digest never changes
+            patch_cache_control(response, private=True, max_age=settings.RECORDING_PLOT_MAX_AGE, immutable=True)
+        else:
+            # plot of this kind changes with next analysis, so clients revalidate it with If-None-Match
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @swagger_auto_schema(method='GET', manual_parameters=[
+        openapi.Parameter('Range', openapi.IN_HEADER, type=openapi.TYPE_STRING, description="e.g. bytes=0-1023")
+    ], responses={
+        HTTP_200_OK: "Whole recording",
+        HTTP_206_PARTIAL_CONTENT: "Requested range of recording",
+        HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE: "Range is outside of the recording"
+    })
+    @action(detail=True, methods=['GET', 'HEAD'], renderer_classes=[AudioRenderer])
+    def audio(self, request: Request, *args, **kwargs):
+        recording = self.get_object()
+        if not recording.file or not os.path.exists(recording.file.path):
+            return Response({'message': 'Audio of recording is not available.'}, status=HTTP_404_NOT_FOUND)
+        return audio_response(request, recording.file.name, recording.file.path)
+
+    @swagger_auto_schema(query_serializer=WaveformWindowSerializer, responses={
+        HTTP_200_OK: "Minimum and maximum (int8) of every bucket of samples, start and duration of buckets in seconds",
+        HTTP_404_NOT_FOUND: "Waveform has not been computed yet."
+    })
+    @action(detail=True, methods=['GET'])
+    def waveform(self, request: Request, *args, **kwargs) -> Response:
+        window = WaveformWindowSerializer(data=request.query_params)
+        window.is_valid(raise_exception=True)
+        waveform = RecordingWaveform.objects.filter(recording=self.get_object()).first()
+        if waveform is None:
+            return Response({'message': 'Waveform has not been computed yet.'}, status=HTTP_404_NOT_FOUND)
+        return Response(waveform.peaks.select(**window.validated_data), status=HTTP_200_OK)
+
+
+class RecordingUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    POST    /api/recordings/uploads/                 - start upload (name, examination, size in bytes)
+    GET     /api/recordings/uploads/<uuid:id>/       - state of upload (offset - number of bytes received)
+    PUT     /api/recordings/uploads/<uuid:id>/chunk/ - chunk of file (raw body) starting at ?offset=
+    POST    /api/recordings/uploads/<uuid:id>/finish/ - create recording from complete upload
+    DELETE  /api/recordings/uploads/<uuid:id>/       - abort upload
+    """
+
+    serializer_class = RecordingUploadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self) -> QuerySet[RecordingUpload]:
+        if self.request.user.is_anonymous or self.request.user.type != User.Types.DOCTOR:
+            return RecordingUpload.objects.none()
+        return RecordingUpload.objects.filter(uploader=self.request.user)
+
+    def perform_create(self, serializer):
+        start_upload(serializer.save(uploader=self.request.user))
+
+    def perform_destroy(self, instance: RecordingUpload):
+        discard_upload(instance)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('offset', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True,
+                          description="Position of the chunk in file, has to be equal to offset of upload")
+    ], request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY), responses={
+        HTTP_200_OK: openapi.Response('Chunk has been written', RecordingUploadSerializer),
+        HTTP_400_BAD_REQUEST: "Invalid offset or chunk exceeds size of upload",
+        HTTP_409_CONFLICT: "Chunk does not start at offset of upload (current offset is returned)",
+        HTTP_411_LENGTH_REQUIRED: "Content-Length header is missing (e.g. chunked transfer encoding)",
+        HTTP_413_REQUEST_ENTITY_TOO_LARGE: "Chunk is larger than RECORDING_UPLOAD_MAX_CHUNK_SIZE"
+    })
+    @action(detail=True, methods=['PUT'])
+    def chunk(self, request: Request, *args, **kwargs) -> Response:
+        upload = self.get_object()
+        # length of the chunk has to be known before it is written (body without it would be read as empty)
+        if not request.headers.get('Content-Length'):
+            return Response({'message': 'Content-Length is required.'}, status=HTTP_411_LENGTH_REQUIRED)
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({'message': 'Offset and Content-Length are required.'}, status=HTTP_400_BAD_REQUEST)
+        if length > settings.RECORDING_UPLOAD_MAX_CHUNK_SIZE:
+            return Response(
+                {'message': f'Chunk can not be larger than {settings.RECORDING_UPLOAD_MAX_CHUNK_SIZE} bytes.'},
+                status=HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+        if offset + length > upload.size:
+            return Response({'message': 'Chunk exceeds size of upload.'}, status=HTTP_400_BAD_REQUEST)
+
+        # body is read from the stream block by block (request.data would load the whole chunk)
+        try:
+            upload.offset = write_chunk(upload, offset, request.stream, length) if length else upload.offset
+        except OffsetMismatch as e:
+            return Response({'message': 'Chunk has to start at offset of upload.', 'offset': e.args[0]},
+                            status=HTTP_409_CONFLICT)
+        return Response(RecordingUploadSerializer(upload).data, status=HTTP_200_OK)
+
+    @swagger_auto_schema(request_body=no_body, responses={
+        HTTP_201_CREATED: openapi.Response('Recording has been created', RecordingBeforeAnalysisSerializer),
+        HTTP_400_BAD_REQUEST: "Upload is not complete or examination already has a recording"
+    })
+    @action(detail=True, methods=['POST'])
+    def finish(self, request: Request, *args, **kwargs) -> Response:
+        upload = self.get_object()
+        if upload.offset != upload.size:
+            return Response({'message': f'Only {upload.offset} of {upload.size} bytes have been received.'},
+                            status=HTTP_400_BAD_REQUEST)
+        recording = finish_upload(upload)
+        return Response(RecordingBeforeAnalysisSerializer(recording).data, status=HTTP_201_CREATED)
@@ -0,0 +1,140 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Streaming parser of WAV (RIFF/WAVE) header. Only the header is read - RIFF chunks preceding the audio
+are skipped with seek, so validating an upload reads a few dozen bytes regardless of size of the recording.
+Parsed header is used to reject corrupt and unsupported files before they reach the worker, and to fill
+Recording.length right when the recording is uploaded.
+
+File consists of:
+    - InvalidWav - raised for file which is not a supported WAV file (message is shown to the user)
+    - WavInfo - format, channels, sample rate, bit depth and number of frames of WAV file
+    - read_wav_info - parses header of WAV file object and validates it
+"""
+import os
+import struct
+from datetime import timedelta
+from typing import BinaryIO, NamedTuple, Optional
+
+from django.conf import settings
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+BITS_PER_SAMPLE = (8, 16, 24, 32)
+# RIFF chunks (LIST, fact, bext, ...) skipped before the data chunk, files with more are rejected
+MAX_CHUNKS = 64
+# format chunk of WAVE_FORMAT_EXTENSIBLE is the largest one, larger declared size is not read
+MAX_FMT_SIZE = 40
+
+
+class InvalidWav(ValueError):
+    """File is not a WAV file supported by the analysis"""
+
+
+class WavInfo(NamedTuple):
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+    frames: int
+    # position and size of audio samples in the file
+    data_offset: int
+    data_size: int
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate
+
+    @property
+    def length(self) -> timedelta:
+        return timedelta(seconds=self.duration)
+
+
+def _read(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) < size:
+        raise InvalidWav('File is truncated, header of WAV file is incomplete.')
+    return data
+
+
+def _parse_fmt(chunk: bytes) -> tuple[int, int, int, int, int]:
+    if len(chunk) < 16:
+        raise InvalidWav('Format chunk of WAV file is too short.')
+    audio_format, channels, sample_rate, _, block_align, bits_per_sample = struct.unpack('<HHIIHH', chunk[:16])
+    if audio_format == WAVE_FORMAT_EXTENSIBLE and len(chunk) >= 26:
+        # first two bytes of SubFormat GUID hold the actual format
+        audio_format = struct.unpack('<H', chunk[24:26])[0]
+    if audio_format != WAVE_FORMAT_PCM:
+        raise InvalidWav(f'Unsupported audio format {audio_format:#06x}, only PCM recordings are supported.')
+    if not 1 <= channels <= settings.RECORDING_MAX_CHANNELS:
+        raise InvalidWav(f'Recording has {channels} channels, at most {settings.RECORDING_MAX_CHANNELS} are supported.')
+    if sample_rate < settings.RECORDING_MIN_SAMPLE_RATE:
+        raise InvalidWav(f'Sample rate {sample_rate} Hz is lower than {settings.RECORDING_MIN_SAMPLE_RATE} Hz.')
+    if bits_per_sample not in BITS_PER_SAMPLE:
+        raise InvalidWav(f'Unsupported bit depth {bits_per_sample}, supported are: {BITS_PER_SAMPLE}.')
+    if block_align != channels * bits_per_sample // 8:
+        raise InvalidWav('Format chunk of WAV file is inconsistent (block align does not match channels).')
+    return audio_format, channels, sample_rate, bits_per_sample, block_align
+
+
+def read_wav_info(file: BinaryIO, size: Optional[int] = None) -> WavInfo:
+    """
+    Reads header of WAV file (from its beginning) and returns its parameters. Raises InvalidWav for files which
+    are not PCM WAV, have unsupported parameters, contain no audio or are truncated. Position of file is restored.
+    File can be just the beginning of a WAV file of given size, if its header fits in it.
+    """
+    position = file.tell()
+    try:
+        file_size = size if size is not None else file.seek(0, os.SEEK_END)
+        file.seek(0)
+        riff, _, wave = struct.unpack('<4sI4s', _read(file, 12))
+        if riff == b'RF64':
+            raise InvalidWav('RF64 files are not supported.')
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise InvalidWav('File is not a WAV (RIFF/WAVE) file.')
+
+        fmt = None
+        for _ in range(MAX_CHUNKS):
+            chunk_id, chunk_size = struct.unpack('<4sI', _read(file, 8))
+            if chunk_id == b'fmt ':
+                if chunk_size > MAX_FMT_SIZE:
+                    raise InvalidWav(f'Format chunk of WAV file is too long ({chunk_size} bytes).')
+                fmt = _parse_fmt(_read(file, chunk_size))
+                file.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise InvalidWav('Audio data of WAV file precede its format chunk.')
+                audio_format, channels, sample_rate, bits_per_sample, block_align = fmt
+                data_offset = file.tell()
+                if data_offset + chunk_size > file_size:
+                    raise InvalidWav('File is truncated, it is shorter than its header declares.')
+                frames = chunk_size // block_align
+                if not frames:
+                    raise InvalidWav('Recording contains no audio.')
+                return WavInfo(audio_format, channels, sample_rate, bits_per_sample, frames, data_offset, chunk_size)
+            else:
+                # chunks are word aligned
+                file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+        raise InvalidWav('Audio data of WAV file not found.')
+    finally:
+        file.seek(position)
@@ -0,0 +1,199 @@
+"""
+Copyright (c) 2022 Adam Lisichin, Hubert Decyusz, Wojciech Nowicki, Gustaw Daczkowski
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+author: Gustaw Daczkowski
+
+description: Waveform peaks of recording audio - minimum and maximum sample of every bucket of samples, so
+the waveform can be drawn without downloading and decoding the WAV file. Peaks are computed in one streaming
+pass over the file (in blocks of samples, all channels together) and quantized to int8. The finest level has
+BUCKET_SAMPLES samples per bucket, every next level merges LEVEL_FACTOR buckets of the previous one until it has
+at most MIN_BUCKETS buckets. Layout of stored bytes (little-endian):
+
+    version: uint8 | reserved: uint8 | levels: uint16 | sample_rate: uint32 | samples: uint64 |
+    levels * (samples_per_bucket: uint32 | count: uint32 | count * (min: int8, max: int8))
+
+File consists of:
+    - WaveformPeaks - peaks of every level with conversion to/from bytes and selection of time range
+    - WaveformPeaksField - BinaryField storing WaveformPeaks
+    - read_samples - generator of normalized sample blocks of WAV file
+"""
+import struct
+import wave
+from typing import Iterator, NamedTuple
+
+import numpy as np
+from django.db import models
+
+from .lossless import open_audio
+
+VERSION = 1
+HEADER = struct.Struct('<BBHIQ')
+LEVEL_HEADER = struct.Struct('<II')
+
+BUCKET_SAMPLES = 256
+LEVEL_FACTOR = 4
+MIN_BUCKETS = 1000
+# samples are read in blocks of whole buckets
+BLOCK_BUCKETS = 1024
+
+
+def _decode(data: bytes, sample_width: int) -> np.ndarray:
+    """Converts PCM samples to floats in range [-1, 1]."""
+    if sample_width == 1:
+        # 8-bit WAV samples are unsigned
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples)
+        return samples.astype(np.float32) / (1 << 23)
+    dtype = {2: '<i2', 4: '<i4'}[sample_width]
+    return np.frombuffer(data, dtype=dtype).astype(np.float32) / (1 << (8 * sample_width - 1))
+
+
+def read_samples(file_path: str, block_frames: int) -> Iterator[np.ndarray]:
+    """Yields blocks of block_frames frames of WAV file as arrays of shape (frames, channels)."""
+    with open_audio(file_path) as file, wave.open(file, 'rb') as wav:
+        channels, sample_width = wav.getnchannels(), wav.getsampwidth()
+        while data := wav.readframes(block_frames):
+            yield _decode(data, sample_width).reshape(-1, channels)
+
+
+def _quantize(low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """Interleaves minimums and maximums quantized to int8, the range is rounded outwards."""
+    peaks = np.empty((len(low), 2), dtype=np.int8)
+    peaks[:, 0] = np.clip(np.floor(low * 127), -128, 127)
+    peaks[:, 1] = np.clip(np.ceil(high * 127), -128, 127)
+    return peaks
+
+
+def _merge(peaks: np.ndarray, factor: int) -> np.ndarray:
+    """Merges every factor neighbouring buckets (minimum of minimums, maximum of maximums)."""
+    bounds = np.arange(0, len(peaks), factor)
+    return np.column_stack((np.minimum.reduceat(peaks[:, 0], bounds), np.maximum.reduceat(peaks[:, 1], bounds)))
+
+
+class Level(NamedTuple):
+    samples_per_bucket: int
+    peaks: np.ndarray  # shape (buckets, 2) - minimum and maximum of bucket
+
+
+class WaveformPeaks:
+    """Levels of waveform peaks from the finest to the coarsest."""
+
+    def __init__(self, sample_rate: int, samples: int, levels: list[Level]):
+        self.sample_rate = sample_rate
+        self.samples = samples
+        self.levels = levels
+
+    @classmethod
+    def from_wav(cls, file_path: str) -> "WaveformPeaks":
+        """Computes peaks reading WAV file once, block by block. Raises wave.Error or EOFError for other files."""
+        with open_audio(file_path) as file, wave.open(file, 'rb') as wav:
+            sample_rate = wav.getframerate()
+        blocks, samples = [], 0
+        for block in read_samples(file_path, BUCKET_SAMPLES * BLOCK_BUCKETS):
+            samples += len(block)
+            # the last bucket of the file may be shorter
+            bounds = np.arange(0, len(block), BUCKET_SAMPLES)
+            blocks.append(_quantize(
+                np.minimum.reduceat(block.min(axis=1), bounds), np.maximum.reduceat(block.max(axis=1), bounds)
+            ))
+        peaks = np.concatenate(blocks) if blocks else np.empty((0, 2), dtype=np.int8)
+
+        levels = [Level(BUCKET_SAMPLES, peaks)]
+        while len(levels[-1].peaks) > MIN_BUCKETS:
+            previous = levels[-1]
+            levels.append(Level(previous.samples_per_bucket * LEVEL_FACTOR, _merge(previous.peaks, LEVEL_FACTOR)))
+        return cls(sample_rate, samples, levels)
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0.0
+
+    def select(self, resolution: int, start: float = None, end: float = None) -> dict:
+        """
+        Returns at most resolution peaks between start and end (seconds) taken from the coarsest level with
+        enough buckets in range (buckets are merged further if it has more).
+        """
+        first_sample = 0 if start is None else min(int(start * self.sample_rate), self.samples)
+        last_sample = self.samples if end is None else min(int(np.ceil(end * self.sample_rate)), self.samples)
+        last_sample = max(first_sample, last_sample)
+
+        for level in reversed(self.levels):
+            first = first_sample // level.samples_per_bucket
+            last = -(-last_sample // level.samples_per_bucket)
+            if last - first >= resolution:
+                break
+        peaks = level.peaks[first:last]
+        # buckets are merged in groups of equal size, so all of them have the same duration
+        factor = -(-len(peaks) // resolution) if len(peaks) > resolution else 1
+        if factor > 1:
+            peaks = _merge(peaks, factor)
+
+        rate = self.sample_rate or 1
+        return {
+            "sample_rate": self.sample_rate,
+            "start": first * level.samples_per_bucket / rate,
+            "bucket_duration": level.samples_per_bucket * factor / rate,
+            "min": peaks[:, 0].tolist(),
+            "max": peaks[:, 1].tolist(),
+        }
+
+    def to_bytes(self) -> bytes:
+        parts = [HEADER.pack(VERSION, 0, len(self.levels), self.sample_rate, self.samples)]
+        for level in self.levels:
+            parts.append(LEVEL_HEADER.pack(level.samples_per_bucket, len(level.peaks)))
+            parts.append(level.peaks.astype(np.int8).tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "WaveformPeaks":
+        version, _, count, sample_rate, samples = HEADER.unpack_from(data)
+        if version != VERSION:
+            raise ValueError(f"Unsupported waveform peaks version: {version}")
+        levels, offset = [], HEADER.size
+        for _ in range(count):
+            samples_per_bucket, buckets = LEVEL_HEADER.unpack_from(data, offset)
+            offset += LEVEL_HEADER.size
+            peaks = np.frombuffer(data, dtype=np.int8, count=2 * buckets, offset=offset).reshape(-1, 2)
+            levels.append(Level(samples_per_bucket, peaks))
+            offset += 2 * buckets
+        return cls(sample_rate, samples, levels)
+
+
+class WaveformPeaksField(models.BinaryField):
+    """BinaryField with WaveformPeaks as Python value."""
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return WaveformPeaks.from_bytes(bytes(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, WaveformPeaks):
+            return value
+        return WaveformPeaks.from_bytes(super().to_python(value))
+
+    def get_prep_value(self, value):
+        if isinstance(value, WaveformPeaks):
+            value = value.to_bytes()
+        return super().get_prep_value(value)
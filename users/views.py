@@ -49,6 +49,7 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView, TokenRefreshView, TokenVerifyView
 )
 
+from core.pagination import KeysetPagination
 from users.permissions import CurrentUserOrAdminPermission
 from users.serializers import (
     CookieTokenRefreshSerializer, CookieTokenVerifySerializer, UserSerializer,
@@ -181,7 +182,7 @@ class JWTLogoutView(APIView):
 
 class UserViewSet(viewsets.ModelViewSet):
     """
-    GET     /api/users/          - list all users
+    GET     /api/users/          - list all users (?limit=, ?cursor=, ?count=false)
     POST    /api/users/          - register new user
     GET     /api/users/<int:id>/ - retrieve user
     PUT     /api/users/<int:id>/ - update user
@@ -193,6 +194,8 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['type']
+    pagination_class = KeysetPagination
+    pagination_ordering = 'id'
 
     def get_serializer_class(self):
         if hasattr(self, 'action') and self.action == 'create':